@@ -0,0 +1,59 @@
+"""Compression cost benchmark for Milvago.
+
+Compresses the synthetic JSON payloads of the suite with every gzip
+level and, if the brotli package is installed, a few brotli
+qualities, reporting the CPU time per response against the bytes
+saved, to help choosing a CompressionPolicy.
+
+    $ python _benchmarks/compression.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from milvago.server.compression import Compressor, brotli  # noqa: E402
+from suite import SIZES, synthetic_records  # noqa: E402
+
+
+def measure(compressor: Compressor, data: bytes, iterations: int) -> dict:
+    """Compresses the data repeatedly.
+
+    Returns
+    -------
+    dict"""
+    compressed = compressor.compress(data)
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        compressor.compress(data)
+    elapsed = (time.perf_counter_ns() - started) / iterations
+    return {
+        "compress_us": round(elapsed / 1e3, 2),
+        "bytes": len(compressed),
+        "saved": round(1 - len(compressed) / len(data), 3),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default=",".join(SIZES))
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args(argv)
+    compressors = [Compressor("gzip", level) for level in range(1, 10)]
+    if brotli is not None:
+        compressors += [Compressor("br", level) for level in (1, 4, 6, 9)]
+    results = {}
+    for size_name in args.sizes.split(","):
+        data = json.dumps(synthetic_records(SIZES[size_name])).encode()
+        for compressor in compressors:
+            key = f"json/{size_name}/{compressor.encoding}-{compressor.level}"
+            results[key] = measure(compressor, data, args.iterations)
+            print(f"{key:<24}{json.dumps(results[key])}", file=sys.stderr)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
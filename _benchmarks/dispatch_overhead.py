@@ -0,0 +1,71 @@
+"""Micro-benchmark of the per-request overhead Milvago adds
+on top of a bare falcon resource.
+
+Runs entirely in-process, calling the WSGI app directly, so
+the numbers only reflect routing and dispatch.
+
+    $ python _benchmarks/dispatch_overhead.py [--iterations N]
+"""
+import os
+import sys
+import timeit
+import argparse
+import falcon
+from falcon import testing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import milvago  # noqa: E402
+
+
+CONTENTS = 'Hello Milvago!'
+
+
+class RawResource:
+    def on_get(self, req, resp, **kwargs):
+        resp.body = CONTENTS
+
+
+@milvago.expose_web('/function/{name}')
+def function_handler(web):
+    return CONTENTS
+
+
+class ClassHandler(milvago.HttpMlv):
+
+    def __init__(self):
+        milvago.HttpMlv.__init__(self, '/class/{name}')
+
+    def get(self):
+        return CONTENTS
+
+
+def _start_response(status, headers):
+    pass
+
+
+def measure(app, path, iterations):
+    """Returns the best per-request time in microseconds."""
+    env = testing.create_environ(path)
+    timer = timeit.Timer(lambda: app(env, _start_response))
+    return min(timer.repeat(5, iterations)) / iterations * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    iterations = parser.parse_args(argv).iterations
+    raw = falcon.API()
+    raw.add_route('/raw/{name}', RawResource())
+    app = milvago.Milvago([function_handler(), ClassHandler()])()
+    baseline = measure(raw, '/raw/x', iterations)
+    print(f"{'falcon resource':<20}{baseline:8.2f} us/req")
+    for name, path in (('function handler', '/function/x'),
+                       ('class handler', '/class/x')):
+        took = measure(app, path, iterations)
+        print(f"{name:<20}{took:8.2f} us/req "
+              f"(+{took - baseline:.2f} us over falcon)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Benchmark of RadixRouter against falcon's CompiledRouter with 10,
+1k and 10k parameterized routes.
+
+Reports the time to add the routes and serve the first request, and
+the time of a lookup of a random path, without and with the LRU of
+RadixRouter (the hot set is 100 paths). falcon 2 recompiles its
+router on every add_route, which takes minutes for 1k routes, so the
+benchmark compiles it once after adding all of them.
+
+    $ python _benchmarks/routing.py [--lookups N]
+"""
+import os
+import sys
+import time
+import random
+import timeit
+import argparse
+from falcon.routing import CompiledRouter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from milvago import RadixRouter  # noqa: E402
+
+SIZES = (10, 1000, 10000)
+
+
+class DeferredRouter(CompiledRouter):
+    """CompiledRouter compiling once, on the first lookup."""
+    compiled = False
+
+    def _compile(self):
+        if not self.compiled:
+            return None
+        return CompiledRouter._compile(self)
+
+    def find(self, uri, req=None):
+        if not self.compiled:
+            self.compiled = True
+            self._find = self._compile()
+        return CompiledRouter.find(self, uri, req)
+
+
+class Resource:
+    def on_get(self, req, resp, **kwargs):
+        pass
+
+
+def templates(count: int) -> list:
+    """A mix of static, plain, int and nested routes."""
+    routes = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            routes.append(f"/static{i}/about")
+        elif kind == 1:
+            routes.append(f"/users{i}/{{username}}")
+        elif kind == 2:
+            routes.append(f"/orders{i}/{{order_id:int}}/items")
+        else:
+            routes.append(f"/shops{i}/{{shop}}/products/{{product_id:int}}")
+    return routes
+
+
+def concrete(template: str, rng: random.Random) -> str:
+    """A path matching a template."""
+    return template.replace("{username}", f"user{rng.randrange(1000)}") \
+        .replace("{order_id:int}", str(rng.randrange(10 ** 6))) \
+        .replace("{shop}", f"shop{rng.randrange(100)}") \
+        .replace("{product_id:int}", str(rng.randrange(10 ** 6)))
+
+
+def build(router, routes: list, first: str) -> float:
+    """Seconds to add the routes and route the first path."""
+    resource = Resource()
+    started = time.perf_counter()
+    for template in routes:
+        router.add_route(template, resource)
+    router.find(first)
+    return time.perf_counter() - started
+
+
+def measure(router, paths: list, lookups: int) -> float:
+    """Microseconds per lookup."""
+    find = router.find
+    index = iter(range(10 ** 9))
+
+    def lookup():
+        find(paths[next(index) % len(paths)])
+
+    return min(timeit.repeat(lookup, number=lookups, repeat=3)) \
+        / lookups * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--lookups", type=int, default=20000)
+    lookups = parser.parse_args(argv).lookups
+    rng = random.Random(42)
+    print(f"{'routes':>7}{'router':>16}{'build ms':>10}"
+          f"{'cold us':>10}{'hot us':>9}")
+    for size in SIZES:
+        routes = templates(size)
+        paths = [concrete(rng.choice(routes), rng) for _ in range(lookups)]
+        hot = paths[:100]
+        for name, factory in (("CompiledRouter", DeferredRouter),
+                              ("RadixRouter", lambda: RadixRouter(0)),
+                              ("RadixRouter+LRU", RadixRouter)):
+            router = factory()
+            took = build(router, routes, paths[0])
+            print(f"{size:>7}{name:>16}{took * 1e3:>10.1f}"
+                  f"{measure(router, paths, lookups):>10.2f}"
+                  f"{measure(router, hot, lookups):>9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Serialization benchmark for Milvago.
+
+Serializes the synthetic records of the suite, as dicts and as
+dataclasses, with every serializer available and reports the
+throughput and the bytes produced. The `str` row is the previous
+way of doing things: json.dumps to a str which falcon encodes.
+
+    $ python _benchmarks/serialization.py
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import dataclasses
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import milvago  # noqa: E402
+from suite import SIZES, synthetic_records  # noqa: E402
+
+
+@dataclasses.dataclass
+class Record:
+    id: int
+    first_name: str
+    last_name: str
+    email: str
+    gender: str
+    ip_address: str
+
+
+def _as_str(obj) -> bytes:
+    return json.dumps(obj).encode("utf-8")
+
+
+def serializers() -> dict:
+    """The available serializers, by name."""
+    available = {"str": _as_str}
+    for name in ("JsonSerializer", "OrjsonSerializer",
+                 "UjsonSerializer", "MsgpackSerializer"):
+        try:
+            serializer = getattr(milvago, name)()
+        except ImportError:
+            continue
+        available[serializer.name] = serializer.dumps
+    return available
+
+
+def measure(dumps, payload, iterations: int) -> dict:
+    """Serializes the payload repeatedly.
+
+    Returns
+    -------
+    dict"""
+    size = len(dumps(payload))
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        dumps(payload)
+    elapsed = (time.perf_counter_ns() - started) / iterations
+    return {
+        "us": round(elapsed / 1e3, 2),
+        "mb_per_s": round(size / elapsed * 1e3, 1),
+        "bytes": size,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default=",".join(SIZES))
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args(argv)
+    available = serializers()
+    results = {}
+    for size_name in args.sizes.split(","):
+        records = synthetic_records(SIZES[size_name])
+        payloads = {
+            "dict": records,
+            "dataclass": [Record(**record) for record in records],
+        }
+        for kind, payload in payloads.items():
+            for name, dumps in available.items():
+                if kind == "dataclass" and name == "str":
+                    continue
+                key = f"{kind}/{size_name}/{name}"
+                results[key] = measure(dumps, payload, args.iterations)
+                print(f"{key:<26}{json.dumps(results[key])}",
+                      file=sys.stderr)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Benchmark of the startup of a worker: the import time of milvago,
+measured with `python -X importtime` in fresh interpreters, and the
+time until an application with a hundred handlers is ready.
+
+    $ python _benchmarks/startup.py [--runs N]
+"""
+import os
+import sys
+import time
+import statistics
+import argparse
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+BOOT = """
+import milvago
+handlers = []
+for i in range(100):
+    @milvago.expose_web(f'/route{i}/{{name}}')
+    def handler(web):
+        return 'hello'
+    handlers.append(handler())
+milvago.Milvago(handlers)()
+"""
+
+
+def import_times() -> dict:
+    """Cumulative import time in microseconds of milvago and of
+    the top-level packages it pulls in, from a fresh interpreter.
+    Nested packages are counted within their parents too."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import milvago"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() != "milvago":
+            # another top-level import, i.e. site, not ours
+            times.clear()
+        elif depth > 0 and "." not in name.strip():
+            times[name.strip()] = int(cumulative)
+        if name.strip() == "milvago":
+            times["milvago"] = int(cumulative)
+    return times
+
+
+def boot_time() -> float:
+    """Seconds to start an interpreter and create the application."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", BOOT], cwd=ROOT, check=True)
+    return time.perf_counter() - started
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    runs = parser.parse_args(argv).runs
+    samples = [import_times() for _ in range(runs)]
+    total = statistics.median(sample["milvago"] for sample in samples)
+    print(f"import milvago {total / 1000:8.1f} ms (median of {runs})")
+    last = samples[-1]
+    heavy = sorted(
+        (name for name in last if name != "milvago"),
+        key=last.get,
+        reverse=True
+    )[:10]
+    for name in heavy:
+        print(f"  {name:<13}{last[name] / 1000:8.1f} ms")
+    boot = statistics.median(boot_time() for _ in range(runs))
+    print(f"boot, 100 handlers {boot * 1000:8.1f} ms "
+          f"(interpreter included)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
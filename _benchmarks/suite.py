@@ -0,0 +1,418 @@
+"""Self-contained benchmark suite for Milvago.
+
+Drives the application in-process, through WSGI and through ASGI,
+with synthetic payloads of several sizes, so the results can be
+reproduced anywhere without wrk2 or any data files.
+
+    $ python _benchmarks/suite.py --output results.json
+    $ python _benchmarks/suite.py --baseline results.json --threshold 0.1
+
+For every scenario, interface and payload size it reports the p50/p99
+latency, the p50 time to the first body chunk, the requests per second
+and the memory allocated per request (the tracemalloc peak above the
+steady state). With --baseline, the
+exit code is 1 if any result regressed by more than --threshold, so
+the suite can gate changes.
+"""
+import io
+import os
+import sys
+import json
+import time
+import atexit
+import random
+import shutil
+import string
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+from urllib.parse import urlencode
+from falcon import testing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import milvago  # noqa: E402
+
+
+SIZES = {
+    "small": 1024,
+    "medium": 64 * 1024,
+    "large": 1024 * 1024,
+}
+
+WORKDIR = tempfile.mkdtemp(prefix="milvago-bench-")
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+
+
+def synthetic_records(size: int) -> list:
+    """Creates records shaped like the ones in MOCK_DATA.json,
+    roughly `size` bytes once serialized."""
+    rand = random.Random(size)
+    records = []
+    total = 0
+    while total < size:
+        record = {
+            "id": len(records) + 1,
+            "first_name": "".join(rand.choices(string.ascii_letters, k=8)),
+            "last_name": "".join(rand.choices(string.ascii_letters, k=10)),
+            "email": f"user{len(records)}@example.com",
+            "gender": rand.choice(["Female", "Male"]),
+            "ip_address": ".".join(str(rand.randint(0, 255)) for _ in range(4)),
+        }
+        records.append(record)
+        total += len(json.dumps(record)) + 2
+    return records
+
+
+class Scenario:
+    """A single benchmarked endpoint.
+
+    Parameters
+    ----------
+    name : str
+        Name of the scenario in the report.
+    build : callable
+        Called with the payload size, returns a tuple of
+        (handlers, milvago kwargs, request kwargs)."""
+    __slots__ = ["name", "build"]
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+
+def _text(size):
+    contents = "x" * size
+
+    @milvago.expose_web('/text')
+    def text(web):
+        return contents
+
+    return [text()], {}, {"path": "/text"}
+
+
+def _text_static(size):
+    contents = "x" * size
+
+    @milvago.expose_web('/text', static_body=True)
+    def text(web):
+        return contents
+
+    return [text()], {}, {"path": "/text"}
+
+
+def _json(size):
+    contents = json.dumps(synthetic_records(size))
+
+    @milvago.expose_web('/json')
+    def as_json(web):
+        web.set_content_type("json")
+        return contents
+
+    return [as_json()], {}, {"path": "/json"}
+
+
+def _json_dict(size):
+    records = synthetic_records(size)
+
+    @milvago.expose_web('/json')
+    def as_json(web):
+        return records
+
+    return [as_json()], {}, {"path": "/json"}
+
+
+def _write_table_template(size):
+    directory = os.path.join(WORKDIR, f"templates-{size}")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "table.html"), "w") as f:
+        f.write(
+            "<html><body><table>{% for row in rows %}"
+            "<tr><td>{{ row.id }}</td><td>{{ row.first_name }}</td>"
+            "<td>{{ row.last_name }}</td><td>{{ row.email }}</td>"
+            "<td>{{ row.ip_address }}</td></tr>"
+            "{% endfor %}</table></body></html>"
+        )
+    return directory
+
+
+def _template(size):
+    directory = _write_table_template(size)
+    rows = synthetic_records(size // 2)
+
+    @milvago.expose_web('/template')
+    def template(web):
+        return web.render("table.html", rows=rows)
+
+    return [template()], {"template_dir": directory}, {"path": "/template"}
+
+
+def _template_stream(size):
+    directory = _write_table_template(size)
+    rows = synthetic_records(size // 2)
+
+    @milvago.expose_web('/template')
+    def template(web):
+        web.render_stream("table.html", rows=rows)
+
+    return [template()], {"template_dir": directory}, {"path": "/template"}
+
+
+def _params(size):
+    @milvago.expose_web('/user/{username}/orders/{order}')
+    def params(web):
+        return f"{web.uri_data['username']} {web.uri_data['order']}"
+
+    query = urlencode({"filter": "x" * min(size, 2048)})
+    return [params()], {}, {"path": "/user/milvago/orders/42", "query": query}
+
+
+def _form(size):
+    @milvago.expose_web('/form', 'post')
+    def form(web):
+        return str(len(web.request.params["message"]))
+
+    body = urlencode({"message": "x" * size, "name": "milvago"})
+    return [form()], {}, {
+        "path": "/form",
+        "method": "POST",
+        "body": body.encode(),
+        "headers": {"Content-Type": "application/x-www-form-urlencoded"},
+    }
+
+
+def _static(size):
+    directory = os.path.join(WORKDIR, f"static-{size}")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "file.bin"), "wb") as f:
+        f.write(os.urandom(size))
+    handlers = [milvago.expose_static("/static", directory)]
+    return handlers, {}, {"path": "/static/file.bin"}
+
+
+SCENARIOS = [
+    Scenario("text", _text),
+    Scenario("text_static", _text_static),
+    Scenario("json", _json),
+    Scenario("json_dict", _json_dict),
+    Scenario("template", _template),
+    Scenario("template_stream", _template_stream),
+    Scenario("params", _params),
+    Scenario("form", _form),
+    Scenario("static", _static),
+]
+
+
+def _build_app(handlers, options, asgi):
+    """Builds the application without the startup output."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return milvago.Milvago(handlers, asgi=asgi, **options)()
+
+
+def _start_response(status, headers, exc_info=None):
+    pass
+
+
+class WsgiDriver:
+    """Sends requests straight to a WSGI application."""
+
+    def __init__(self, app, path, query="", method="GET",
+                 body=b"", headers=None):
+        self._app = app
+        self._body = body
+        self.first_chunk_ns = 0
+        self._env = testing.create_environ(
+            path, query_string=query, method=method, headers=headers
+        )
+        if body:
+            self._env["CONTENT_LENGTH"] = str(len(body))
+
+    def request(self) -> int:
+        """Sends a single request, returning the body size."""
+        env = dict(self._env)
+        env["wsgi.input"] = io.BytesIO(self._body)
+        started = time.perf_counter_ns()
+        result = self._app(env, _start_response)
+        size = 0
+        for chunk in result:
+            if not size:
+                self.first_chunk_ns = time.perf_counter_ns() - started
+            size += len(chunk)
+        if hasattr(result, "close"):
+            result.close()
+        return size
+
+
+class AsgiDriver:
+    """Sends requests straight to an ASGI application."""
+
+    def __init__(self, app, path, query="", method="GET",
+                 body=b"", headers=None):
+        self._app = app
+        self._body = body
+        self.first_chunk_ns = 0
+        self._loop = asyncio.new_event_loop()
+        self._scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"localhost")] + [
+                (name.lower().encode(), value.encode())
+                for name, value in (headers or {}).items()
+            ],
+            "server": ("localhost", 80),
+            "client": ("127.0.0.1", 1),
+        }
+
+    async def _request(self):
+        size = 0
+        started = time.perf_counter_ns()
+
+        async def receive():
+            return {"type": "http.request", "body": self._body}
+
+        async def send(message):
+            nonlocal size
+            body = message.get("body", b"")
+            if body and not size:
+                self.first_chunk_ns = time.perf_counter_ns() - started
+            size += len(body)
+
+        await self._app(self._scope, receive, send)
+        return size
+
+    def request(self) -> int:
+        """Sends a single request, returning the body size."""
+        return self._loop.run_until_complete(self._request())
+
+
+def measure(driver, iterations: int, alloc_iterations: int) -> dict:
+    """Runs the requests and computes the statistics.
+
+    Returns
+    -------
+    dict"""
+    for _ in range(min(iterations // 10, 100)):
+        driver.request()
+    timings = []
+    first_chunks = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        begin = clock()
+        size = driver.request()
+        timings.append(clock() - begin)
+        first_chunks.append(driver.first_chunk_ns)
+    elapsed = (clock() - started) / 1e9
+    timings.sort()
+    first_chunks.sort()
+    tracemalloc.start()
+    allocated = []
+    for _ in range(alloc_iterations):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        driver.request()
+        allocated.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    return {
+        "p50_us": round(timings[len(timings) // 2] / 1e3, 2),
+        "p99_us": round(timings[int(len(timings) * 0.99) - 1] / 1e3, 2),
+        "ttfb_us": round(first_chunks[len(first_chunks) // 2] / 1e3, 2),
+        "rps": round(iterations / elapsed, 1),
+        "alloc_bytes_per_req": int(sum(allocated) / len(allocated)),
+        "response_bytes": size,
+    }
+
+
+def run(scenarios, sizes, interfaces, iterations, alloc_iterations):
+    """Runs every combination of scenario, size and interface.
+
+    Returns
+    -------
+    dict
+        Results keyed by "<scenario>/<interface>/<size>"."""
+    results = {}
+    for scenario in scenarios:
+        for size_name in sizes:
+            for interface in interfaces:
+                handlers, options, request = scenario.build(SIZES[size_name])
+                app = _build_app(handlers, options, interface == "asgi")
+                driver = (AsgiDriver if interface == "asgi"
+                          else WsgiDriver)(app, **request)
+                key = f"{scenario.name}/{interface}/{size_name}"
+                results[key] = measure(driver, iterations, alloc_iterations)
+                print(f"{key:<28}{json.dumps(results[key])}",
+                      file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Lists the results which regressed by more than threshold
+    relative to the baseline.
+
+    Returns
+    -------
+    list"""
+    regressions = []
+    for key, result in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if result["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(
+                f"{key}: rps {previous['rps']} -> {result['rps']}")
+        if result["p99_us"] > previous["p99_us"] * (1 + threshold):
+            regressions.append(
+                f"{key}: p99 {previous['p99_us']}us -> {result['p99_us']}us")
+        if result["alloc_bytes_per_req"] > \
+                previous["alloc_bytes_per_req"] * (1 + threshold) + 1024:
+            regressions.append(
+                f"{key}: allocated {previous['alloc_bytes_per_req']}B "
+                f"-> {result['alloc_bytes_per_req']}B")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scenarios", default=",".join(
+        s.name for s in SCENARIOS))
+    parser.add_argument("--sizes", default=",".join(SIZES))
+    parser.add_argument("--interfaces", default="wsgi,asgi")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--alloc-iterations", type=int, default=50)
+    parser.add_argument("--output", help="Write the results to a file.")
+    parser.add_argument("--baseline", help="Results of a previous run.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Allowed relative regression, 0.1 = 10%%.")
+    args = parser.parse_args(argv)
+    names = args.scenarios.split(",")
+    results = run(
+        [s for s in SCENARIOS if s.name in names],
+        args.sizes.split(","),
+        args.interfaces.split(","),
+        args.iterations,
+        args.alloc_iterations
+    )
+    report = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        print(report)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
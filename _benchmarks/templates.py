@@ -0,0 +1,110 @@
+"""Template cold-start benchmark for Milvago.
+
+Builds an application with many routes rendering pages which extend
+a shared layout and reports, each in a fresh interpreter, the startup
+time and the latency of the first request to every route:
+
+- cold: empty bytecode cache, templates compiled on first render.
+- bytecode: the cache filled by a previous process.
+- precompiled: Milvago(precompile_templates=True) with a filled cache.
+
+    $ python _benchmarks/templates.py --routes 40
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from falcon import testing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import milvago  # noqa: E402
+
+
+LAYOUT = "<html><head>{% block head %}<title>{{ title }}</title>" \
+         "{% endblock %}</head><body><nav>{% for item in menu %}" \
+         "<a href='{{ item }}'>{{ item|title }}</a>{% endfor %}</nav>" \
+         "{% block body %}{% endblock %}</body></html>"
+PAGE = "{% extends 'layout.html' %}{% block body %}" \
+       "{% for row in rows %}<p>{{ loop.index }} {{ row|upper }}</p>" \
+       "{% endfor %}{% endblock %}"
+
+
+def create_templates(directory: str, routes: int) -> None:
+    """Writes the layout and one page per route."""
+    with open(os.path.join(directory, "layout.html"), "w") as f:
+        f.write(LAYOUT)
+    for index in range(routes):
+        with open(os.path.join(directory, f"page{index}.html"), "w") as f:
+            f.write(PAGE)
+
+
+def measure(template_dir: str, cache_dir: str, routes: int,
+            precompile: bool) -> dict:
+    """Starts the application and requests every route once.
+
+    Returns
+    -------
+    dict"""
+    handlers = []
+    for index in range(routes):
+        @milvago.expose_web(f"/page{index}")
+        def page(web, index=index):
+            return web.render(f"page{index}.html", title="Milvago",
+                              menu=["home", "about"], rows=["a", "b"])
+        handlers.append(page())
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = milvago.Milvago(
+            handlers,
+            template_dir=template_dir,
+            template_cache_dir=cache_dir,
+            precompile_templates=precompile
+        )()
+    startup = time.perf_counter() - started
+    client = testing.TestClient(app)
+    started = time.perf_counter()
+    for index in range(routes):
+        client.simulate_get(f"/page{index}")
+    first_requests = time.perf_counter() - started
+    return {
+        "startup_ms": round(startup * 1000, 2),
+        "first_requests_ms": round(first_requests * 1000, 2),
+        "total_ms": round((startup + first_requests) * 1000, 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--routes", type=int, default=40)
+    parser.add_argument("--measure", nargs=3,
+                        metavar=("TEMPLATE_DIR", "CACHE_DIR", "PRECOMPILE"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.measure:
+        template_dir, cache_dir, precompile = args.measure
+        print(json.dumps(measure(template_dir, cache_dir, args.routes,
+                                 precompile == "1")))
+        return 0
+    template_dir = tempfile.mkdtemp(prefix="milvago-templates-")
+    cache_dir = tempfile.mkdtemp(prefix="milvago-bytecode-")
+    create_templates(template_dir, args.routes)
+    results = {}
+    for mode, precompile in (("cold", "0"), ("bytecode", "0"),
+                             ("precompiled", "1")):
+        output = subprocess.check_output([
+            sys.executable, __file__, "--routes", str(args.routes),
+            "--measure", template_dir, cache_dir, precompile
+        ])
+        results[mode] = json.loads(output)
+        print(f"{mode:<14}{json.dumps(results[mode])}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
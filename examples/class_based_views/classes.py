@@ -30,8 +30,8 @@ $ curl http://localhost:8000/another_example
 $ curl -X POST http://localhost:8000/another_example
 
     We haven't defined a POST handler for this mount-point,
-    so the response you should get is:
-    A server error occurred.  Please contact the administrator.
+    so the response you should get is a 405 Method Not Allowed
+    with an "Allow: GET, OPTIONS" header.
 """
 from milvago import Milvago, HttpMlv
 
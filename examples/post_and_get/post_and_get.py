@@ -27,8 +27,9 @@ $ curl -X PUT 'http://localhost:8000/post_and_get'
 
 $ curl -X DELETE 'http://localhost:8000/post_and_get'
 
-    The output you should get is:
-    A server error occurred.  Please contact the administrator.
+    DELETE isn't exposed, so the response you should get is
+    a 405 Method Not Allowed with an
+    "Allow: GET, POST, PUT, OPTIONS" header.
 
 $ curl 'http://localhost:8000/class_post_get?name=Milvago'
 
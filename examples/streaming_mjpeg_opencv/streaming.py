@@ -3,17 +3,21 @@ import numpy as np
 import milvago
 
 
-class WebCamera:
-    def __init__(self, camera_id: str):
-        self.video = cv2.VideoCapture(int(camera_id))
+def camera_frames(camera_id: str):
+    """The JPEG frames of a camera. StreamHub runs a single one of
+    these per camera, however many clients are watching it, and
+    closes it, releasing the camera, when the last one leaves."""
+    video = cv2.VideoCapture(int(camera_id))
+    try:
+        while True:
+            _, image = np.array(video.read())
+            _, jpeg = cv2.imencode('.jpg', image)
+            yield jpeg.tobytes()
+    finally:
+        video.release()
 
-    def __del__(self):
-        self.video.release()
 
-    def get_frame(self):
-        _, image = np.array(self.video.read())
-        ret, jpeg = cv2.imencode('.jpg', image)
-        return jpeg.tobytes()
+hub = milvago.StreamHub(camera_frames)
 
 
 class WebcamStream(milvago.HttpMlv):
@@ -22,17 +26,7 @@ class WebcamStream(milvago.HttpMlv):
         milvago.HttpMlv.__init__(self, '/stream.mjpeg')
 
     def get(self):
-        labeled_frame = WebcamStream.load_frame(
-            WebCamera(self.request.params.get("camera", 0))
-        )
-        self.set_custom_content_type("multipart/x-mixed-replace; boundary=frame")
-        self.response.stream = labeled_frame
-
-    @staticmethod
-    def load_frame(cam):
-        while True:
-            yield (b'--frame\r\nContent-Type: image/jpeg'
-                   b'\r\n\r\n' + cam.get_frame() + b'\r\n\r\n')
+        hub.multipart(self, self.request.params.get("camera", "0"))
 
 
 @milvago.expose_web('/')
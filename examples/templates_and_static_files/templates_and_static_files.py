@@ -17,9 +17,10 @@ from milvago import Milvago, HttpMlv, HttpStaticDir, expose_web
 @expose_web('/')
 def index(web):
     """Let's explore the web parameter. What is it?
-    Well, in essence, it's an entire instance of
-    the HttpMlv class and you can access all the properties
-    and methods from it. One of which, is render().
+    Well, in essence, it's the context of the current
+    request (milvago.RequestContext), holding the request,
+    the response and the uri data, along with the methods
+    of HttpMlv that act on them. One of which, is render().
     render() the name of the html template you intend
     to use and any number of named arguments to be passed
     on to the view. In this case, the view uses a variable
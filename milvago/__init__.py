@@ -43,5 +43,39 @@ through wsgiref. If you want to run it in production, you should
 '''
 
 from milvago.server.handlers import HttpMlv, HttpStaticDir, API, expose_web, expose_static
+from milvago.server.context import RequestContext
+from milvago.server.prepared import PreparedResponse
+from milvago.server.forms import FormLimits, FormPart, FormRequest
+from milvago.server.cache import CachePolicy, ResponseCache
+from milvago.server.coalesce import CoalescePolicy
+from milvago.server.compression import CompressionPolicy
+from milvago.server.metrics import Metrics
+from milvago.server.profiler import Profiler
+from milvago.server.routing import RadixRouter
+from milvago.server.tasks import TaskQueue
+from milvago.server.streams import StreamHub
+from milvago.server.resources import Resources
+from milvago.server.limits import Limit
+from milvago.server.deadlines import Deadline, Timeout
+from milvago.server.serializers import (
+    Serializer,
+    JsonSerializer,
+    OrjsonSerializer,
+    UjsonSerializer,
+    MsgpackSerializer
+)
 from milvago.server.collector import Milvago
 from milvago.__version__ import __version__
+
+
+def __getattr__(name):
+    """AsgiApp pulls in asyncio and PreforkServer the wsgiref
+    server, which most applications don't need, so they are only
+    imported when first used."""
+    if name == "AsgiApp":
+        from milvago.server.asgi import AsgiApp
+        return AsgiApp
+    if name == "PreforkServer":
+        from milvago.server.prefork import PreforkServer
+        return PreforkServer
+    raise AttributeError(f"module 'milvago' has no attribute '{name}'")
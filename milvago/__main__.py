@@ -0,0 +1,23 @@
+"""Command line interface of Milvago.
+
+    $ milvago compile-templates templates/ --cache-dir /var/cache/milvago
+"""
+import sys
+from milvago.server.templates import compile_templates
+
+
+COMMANDS = {
+    "compile-templates": compile_templates,
+}
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in COMMANDS:
+        print(f"usage: milvago {{{','.join(COMMANDS)}}} ...", file=sys.stderr)
+        return 2
+    return COMMANDS[argv[0]](argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,4 +5,24 @@ class InvalidMilvagoClassException(Exception):
 
 class InvalidMediaType(Exception):
     """Used when an invalid content-type
-    has been passed."""
\ No newline at end of file
+    has been passed."""
+
+
+class UnsupportedHandlerException(Exception):
+    """Used when a handler cannot be served
+    in the current mode of the application."""
+
+
+class StreamRenderError(Exception):
+    """Used when a streamed template fails after the
+    headers of the response have been sent."""
+
+
+class RouteConflictException(Exception):
+    """Used when a route cannot be told apart from
+    one which has already been added."""
+
+
+class UnknownResourceException(AttributeError):
+    """Used when a handler asks for a resource
+    which hasn't been registered."""
@@ -0,0 +1,372 @@
+"""The module serves a Milvago application over ASGI.
+
+falcon 2 only speaks WSGI, so the adapter below translates every
+ASGI request into a falcon.Request, routes it through the very same
+falcon.API (routes, static mounts, error handlers, middleware) and
+translates the falcon.Response back. Coroutine handlers are awaited
+natively on the event loop, everything else is sent to a bounded
+thread pool so it can never block the loop."""
+import io
+import os
+import sys
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import falcon
+from falcon.api import _BODILESS_STATUS_CODES, _TYPELESS_STATUS_CODES
+from milvago.server.handlers import HttpMlv
+
+
+LOGGER = logging.getLogger('Milvago')
+
+
+class AsgiApp:
+    """ASGI application wrapping a falcon.API.
+
+    Parameters
+    ----------
+    falcon_api : falcon.API
+        The application with all handlers mounted.
+    max_threads : int
+        Size of the thread pool running the synchronous
+        handlers, None for the default of ThreadPoolExecutor.
+    lifecycle : Lifecycle
+        Started and shut down by the lifespan events of
+        the server."""
+    __slots__ = [
+        "_api",
+        "_executor",
+        "_max_threads",
+        "_lifecycle"
+    ]
+
+    def __init__(self, falcon_api, max_threads: int = None,
+                 lifecycle=None):
+        self._api = falcon_api
+        self._max_threads = max_threads
+        self._executor = None
+        self._lifecycle = lifecycle
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<AsgiApp(\n" \
+               f"\tapi = {self._api},\n" \
+               f"\tmax_threads = {self._max_threads}\n)>"
+
+    @property
+    def app(self):
+        """The underlying falcon.API."""
+        return self._api
+
+    @property
+    def executor(self):
+        """The thread pool for synchronous handlers, created
+        lazily so it's never shared across forked workers."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_threads,
+                thread_name_prefix="milvago-asgi"
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        """Waits for the running synchronous handlers and
+        stops the thread pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __call__(self, scope, receive, send):
+        """ASGI entry point.
+
+        Parameters
+        ----------
+        scope : dict
+            The ASGI connection scope.
+        receive : callable
+            Awaitable returning the next ASGI event.
+        send : callable
+            Awaitable sending an ASGI event."""
+        if scope["type"] == "http":
+            await self._handle_http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._handle_lifespan(receive, send)
+        else:
+            raise NotImplementedError(
+                f"Unsupported ASGI scope type {scope['type']}"
+            )
+
+    async def _handle_lifespan(self, receive, send):
+        """Starts the lifecycle of the process and tears it down
+        with the thread pool on shutdown. The hooks may block, so
+        they run in the thread pool."""
+        lifecycle = self._lifecycle
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if lifecycle is not None:
+                    try:
+                        await self._run_sync(lifecycle.startup)
+                    except Exception as error:
+                        LOGGER.exception("The startup of the process failed")
+                        await send({
+                            "type": "lifespan.startup.failed",
+                            "message": str(error)
+                        })
+                        return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if lifecycle is not None:
+                    await self._run_sync(lifecycle.shutdown)
+                self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _run_sync(self, function, *args, **kwargs):
+        """Runs a blocking callable in the thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            functools.partial(function, *args, **kwargs)
+        )
+
+    async def _handle_http(self, scope, receive, send):
+        """Processes a single HTTP request."""
+        api = self._api
+        env = await _build_environ(scope, receive)
+        req = api._request_type(env, options=api.req_options)
+        resp = api._response_type(options=api.resp_options)
+        params = {}
+        resource = None
+        req_succeeded = False
+        mw_req_stack, mw_rsrc_stack, mw_resp_stack = api._middleware
+        try:
+            try:
+                for process_request in mw_req_stack:
+                    process_request(req, resp)
+                    if resp.complete:
+                        break
+                if not resp.complete:
+                    responder, params, resource, req.uri_template = \
+                        api._get_responder(req)
+            except Exception as ex:
+                if not api._handle_exception(req, resp, ex, params):
+                    raise
+            else:
+                try:
+                    if resource is not None:
+                        for process_resource in mw_rsrc_stack:
+                            process_resource(req, resp, resource, params)
+                            if resp.complete:
+                                break
+                    if not resp.complete:
+                        await self._respond(
+                            responder, resource, req, resp, params
+                        )
+                    req_succeeded = True
+                except Exception as ex:
+                    if not api._handle_exception(req, resp, ex, params):
+                        raise
+            for process_response in mw_resp_stack:
+                process_response(req, resp, resource, req_succeeded)
+        except Exception:
+            LOGGER.exception(f"Unhandled exception for {req.path}")
+            await _send_error(send)
+            return
+        await self._send_response(
+            req, resp, send, "http.response.pathsend" in (
+                scope.get("extensions") or {}
+            )
+        )
+
+    async def _respond(self, responder, resource, req, resp, params):
+        """Awaits coroutine handlers, serves prepared responses
+        inline and sends everything else to the thread pool."""
+        if isinstance(resource, HttpMlv):
+            prepared = resource.prepared.get(req.method)
+            if prepared is not None:
+                prepared.apply(req, resp)
+                return
+            invoke = resource.async_dispatch.get(req.method)
+            if invoke is not None:
+                await resource._process_async(invoke, req, resp, params)
+                return
+        await self._run_sync(responder, req, resp, **params)
+
+    async def _send_response(self, req, resp, send, pathsend=False):
+        """Translates the falcon.Response into ASGI events. Whole
+        files are handed over to the server with the pathsend
+        extension when it supports it, which lets it sendfile."""
+        api = self._api
+        status = resp.status
+        media_type = api._media_type
+        body = []
+        if req.method == "HEAD" or status in _BODILESS_STATUS_CODES:
+            if status in _TYPELESS_STATUS_CODES:
+                media_type = None
+        elif hasattr(resp.stream, "__aiter__"):
+            body = resp.stream
+        elif hasattr(resp.stream, "read"):
+            path = _sendable_path(resp) if pathsend else None
+            if path is not None:
+                await _send_path(resp, send, media_type, path)
+                return
+            body = _FileChunks(resp.stream)
+        else:
+            body, length = api._get_body(resp)
+            if length is not None:
+                resp._headers["content-length"] = str(length)
+        headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in resp._wsgi_headers(media_type)
+        ]
+        await send({
+            "type": "http.response.start",
+            "status": int(status[:3]),
+            "headers": headers
+        })
+        try:
+            if isinstance(body, list):
+                for chunk in body:
+                    await _send_chunk(send, chunk)
+            elif hasattr(body, "__aiter__"):
+                async for chunk in body:
+                    await _send_chunk(send, chunk)
+            else:
+                iterator = iter(body)
+                while True:
+                    chunk = await self._run_sync(next, iterator, None)
+                    if chunk is None:
+                        break
+                    await _send_chunk(send, chunk)
+        finally:
+            if hasattr(body, "close"):
+                await self._run_sync(body.close)
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def _send_path(resp, send, media_type, path):
+    """Sends a whole file with the pathsend extension."""
+    resp.stream.close()
+    await send({
+        "type": "http.response.start",
+        "status": int(resp.status[:3]),
+        "headers": [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in resp._wsgi_headers(media_type)
+        ]
+    })
+    await send({"type": "http.response.pathsend", "path": path})
+
+
+def _sendable_path(resp):
+    """The path of the file streamed by a response, if the
+    whole file is streamed, None otherwise."""
+    stream = resp.stream
+    name = getattr(stream, "name", None)
+    if not isinstance(stream, io.BufferedReader) or not isinstance(name, str):
+        return None
+    try:
+        if stream.tell() != 0 or resp.content_length is None or \
+                int(resp.content_length) != os.fstat(stream.fileno()).st_size:
+            return None
+    except (OSError, ValueError):
+        return None
+    return os.path.abspath(name)
+
+
+class _FileChunks:
+    """Iterates over a file-like stream in large blocks, every
+    block costs a round trip to the thread pool."""
+    __slots__ = ["_stream"]
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __iter__(self):
+        return iter(functools.partial(self._stream.read, self.BLOCK_SIZE), b"")
+
+    def close(self):
+        self._stream.close()
+
+
+async def _send_chunk(send, chunk):
+    """Sends a part of the body, skipping empty ones, which
+    would be interpreted as the end of the response."""
+    if chunk:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        await send({
+            "type": "http.response.body",
+            "body": bytes(chunk),
+            "more_body": True
+        })
+
+
+async def _send_error(send):
+    """Answers with a bare 500 in case of an unhandled
+    exception."""
+    await send({
+        "type": "http.response.start",
+        "status": 500,
+        "headers": [(b"content-type", falcon.MEDIA_TEXT.encode())]
+    })
+    await send({
+        "type": "http.response.body",
+        "body": b"A server error occurred."
+    })
+
+
+async def _build_environ(scope, receive):
+    """Creates a WSGI environ out of an ASGI scope, reading
+    the whole request body.
+
+    Returns
+    -------
+    dict"""
+    body = io.BytesIO()
+    more_body = True
+    while more_body:
+        message = await receive()
+        body.write(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    body.seek(0)
+    # decoded like WSGI servers do, raw_path is still percent-encoded
+    path = scope["path"].encode("utf-8").decode("latin-1")
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    env = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": path,
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "asgi.scope": scope,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            env[name] = value
+            continue
+        name = f"HTTP_{name}"
+        env[name] = f"{env[name]},{value}" if name in env else value
+    if "CONTENT_LENGTH" not in env and body.getbuffer().nbytes:
+        env["CONTENT_LENGTH"] = str(body.getbuffer().nbytes)
+    return env
@@ -0,0 +1,367 @@
+"""The module contains the response cache. Handlers opt in with
+a CachePolicy and the encoded responses are kept in a ResponseCache,
+a bounded LRU shared by all the handlers of an application."""
+import time
+import threading
+from collections import OrderedDict
+import falcon
+from milvago.server.conditional import make_etag, send_bytes
+
+
+class CachePolicy:
+    """Describes how the responses of a handler are cached. Only
+    successful GET requests are cached.
+
+    Parameters
+    ----------
+    ttl : float
+        For how many seconds a response is valid.
+    vary : list
+        The query parameters which are a part of the cache key.
+        None means the entire query string.
+    vary_headers : list
+        The request headers which are a part of the cache key.
+    etag : bool
+        Attach a strong ETag to the cached responses and answer
+        matching If-None-Match requests with 304."""
+    __slots__ = [
+        "ttl",
+        "vary",
+        "vary_headers",
+        "etag"
+    ]
+
+    def __init__(self, ttl: float, vary: list = None,
+                 vary_headers: list = None, etag: bool = True):
+        self.ttl = ttl
+        self.vary = tuple(vary) if vary is not None else None
+        self.vary_headers = tuple(vary_headers or ())
+        self.etag = etag
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<CachePolicy(ttl = {self.ttl}, vary = {self.vary}, " \
+               f"vary_headers = {self.vary_headers}, etag = {self.etag})>"
+
+    def key(self, route: str, req, serializers=None) -> tuple:
+        """Computes the cache key of a request.
+
+        Parameters
+        ----------
+        route : str
+            The route of the handler.
+        req : falcon.Request
+            falcon.Request instance.
+        serializers : Serializers
+            The serializers of the handler, the media type they
+            negotiate is a part of the key.
+
+        Returns
+        -------
+        tuple"""
+        return request_key(route, req, self.vary, self.vary_headers,
+                           serializers)
+
+
+def request_key(route: str, req, vary: tuple, vary_headers: tuple,
+                serializers=None) -> tuple:
+    """The key of the requests which get the same response.
+
+    Parameters
+    ----------
+    route : str
+        The route of the handler.
+    req : falcon.Request
+        falcon.Request instance.
+    vary : tuple
+        The query parameters which are a part of the key, None
+        for the entire query string.
+    vary_headers : tuple
+        The request headers which are a part of the key.
+    serializers : Serializers
+        The serializers of the handler. When they negotiate, the
+        media type picked by the Accept header is a part of the
+        key, since the response varies with it.
+
+    Returns
+    -------
+    tuple"""
+    if vary is None:
+        query = req.query_string
+    else:
+        params = req.params
+        query = tuple(str(params.get(name)) for name in vary)
+    headers = tuple(req.get_header(name) for name in vary_headers)
+    media_type = serializers.preferred(req) \
+        if serializers is not None and serializers.negotiates else None
+    return route, req.path, query, headers, media_type
+
+
+class CachedResponse:
+    """An encoded response, ready to be sent again.
+
+    Parameters
+    ----------
+    body : bytes
+        The encoded body.
+    content_type : str
+        Value of the Content-Type header.
+    status : str
+        The falcon status line.
+    headers : dict
+        All the other headers set by the handler.
+    etag : str
+        Unquoted entity-tag, None if the policy disables them.
+    expires : float
+        time.monotonic() after which the entry is stale."""
+    __slots__ = [
+        "body",
+        "content_type",
+        "status",
+        "headers",
+        "etag",
+        "expires",
+        "size"
+    ]
+
+    def __init__(self, body, content_type, status, headers, etag, expires):
+        self.body = body
+        self.content_type = content_type
+        self.status = status
+        self.headers = headers
+        self.etag = etag
+        self.expires = expires
+        self.size = len(body) + sum(
+            len(name) + len(value) for name, value in headers.items()
+        ) + 256
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<CachedResponse(status = {self.status}, " \
+               f"size = {self.size}, etag = {self.etag})>"
+
+    def apply(self, req, resp) -> None:
+        """Writes the entry onto a response, answering with 304
+        if the client already has it and with 206 to a Range.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance."""
+        if self.headers:
+            resp.set_headers(self.headers)
+        resp.status = self.status
+        resp.content_type = self.content_type
+        send_bytes(req, resp, self.body, self.etag)
+
+
+def capture_response(resp, policy: CachePolicy):
+    """Turns the response produced by a handler into a cache entry.
+
+    Parameters
+    ----------
+    resp : falcon.Response
+        falcon.Response instance, after the handler ran.
+    policy : CachePolicy
+        The policy of the handler.
+
+    Returns
+    -------
+    CachedResponse
+        None if the response cannot be cached."""
+    if resp.status != falcon.HTTP_200 or resp.stream is not None \
+            or resp._cookies:
+        return None
+    headers = resp.headers
+    cache_control = headers.pop("cache-control", "")
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if cache_control:
+        headers["cache-control"] = cache_control
+    content_type = headers.pop("content-type", None)
+    headers.pop("content-length", None)
+    headers.pop("etag", None)
+    body = resp.body
+    if body is None:
+        body = resp.data or b""
+    elif isinstance(body, str):
+        body = body.encode("utf-8")
+    return CachedResponse(
+        bytes(body),
+        content_type,
+        resp.status,
+        headers,
+        make_etag(body) if policy.etag else None,
+        time.monotonic() + policy.ttl
+    )
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses, bounded by the
+    total size of the entries.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of all entries.
+    max_entries : int
+        The maximum number of entries, None for no limit."""
+    __slots__ = [
+        "_entries",
+        "_lock",
+        "_max_bytes",
+        "_max_entries",
+        "_size",
+        "hits",
+        "misses",
+        "evictions"
+    ]
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024,
+                 max_entries: int = None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<ResponseCache(entries = {len(self)}, " \
+               f"size = {self._size}, max_bytes = {self._max_bytes})>"
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """The total size of all entries."""
+        return self._size
+
+    def get(self, key: tuple):
+        """Looks up a fresh entry, counting the hit or the miss.
+
+        Parameters
+        ----------
+        key : tuple
+            The key, as computed by CachePolicy.key.
+
+        Returns
+        -------
+        CachedResponse
+            None if there is no fresh entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, entry: CachedResponse) -> None:
+        """Stores an entry, evicting the least recently used
+        ones until it fits.
+
+        Parameters
+        ----------
+        key : tuple
+            The key, as computed by CachePolicy.key.
+        entry : CachedResponse
+            The response to store."""
+        if entry.size > self._max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and (
+                    self._size + entry.size > self._max_bytes
+                    or (self._max_entries is not None
+                        and len(self._entries) >= self._max_entries)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            self._entries[key] = entry
+            self._size += entry.size
+
+    def _remove(self, key: tuple) -> None:
+        """Removes an entry, the lock must be held."""
+        self._size -= self._entries.pop(key).size
+
+    def invalidate(self, route: str = None, path: str = None) -> int:
+        """Removes entries from the cache. Without arguments,
+        the whole cache is cleared.
+
+        Parameters
+        ----------
+        route : str
+            Remove all the entries of the handler mounted there.
+        path : str
+            Remove all the entries of a concrete path.
+
+        Returns
+        -------
+        int
+            The number of removed entries."""
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if (route is None or key[0] == route)
+                and (path is None or key[1] == path)
+            ]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def serve(self, key: tuple, req, resp) -> bool:
+        """Answers the request from the cache if possible.
+
+        Returns
+        -------
+        bool
+            True if the response has been served."""
+        entry = self.get(key)
+        if entry is None:
+            return False
+        entry.apply(req, resp)
+        return True
+
+    def store(self, key: tuple, req, resp, policy: CachePolicy) -> None:
+        """Caches the response a handler has just produced and
+        applies the validators to it."""
+        entry = capture_response(resp, policy)
+        if entry is not None:
+            self.put(key, entry)
+            entry.apply(req, resp)
+
+    def stats(self) -> dict:
+        """The counters of the cache.
+
+        Returns
+        -------
+        dict"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size": self._size,
+        }
@@ -0,0 +1,185 @@
+"""The module coalesces identical concurrent requests: the first one
+runs the handler and the requests arriving while it runs wait for it
+and get a copy of its response, so a burst of identical GETs, i.e.
+on a popular page whose cache entry just expired, runs the handler
+once instead of once per request."""
+import threading
+from milvago.server.cache import request_key
+from milvago.server.prepared import PreparedResponse
+
+
+class CoalescePolicy:
+    """Describes which requests to a handler are identical.
+
+    Parameters
+    ----------
+    vary : list
+        The query parameters which are a part of the key. None
+        means the entire query string.
+    vary_headers : list
+        The request headers which are a part of the key, i.e.
+        Authorization for responses which depend on the user.
+    timeout : float
+        How long, in seconds, a request waits for the one it
+        joined before running the handler itself."""
+    __slots__ = [
+        "vary",
+        "vary_headers",
+        "timeout"
+    ]
+
+    def __init__(self, vary: list = None, vary_headers: list = None,
+                 timeout: float = 10.0):
+        self.vary = tuple(vary) if vary is not None else None
+        self.vary_headers = tuple(vary_headers or ())
+        self.timeout = timeout
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<CoalescePolicy(vary = {self.vary}, " \
+               f"vary_headers = {self.vary_headers}, " \
+               f"timeout = {self.timeout})>"
+
+    def key(self, route: str, req, serializers=None) -> tuple:
+        """Computes the key of a request, the media type negotiated
+        by serializers is a part of it.
+
+        Returns
+        -------
+        tuple"""
+        return request_key(route, req, self.vary, self.vary_headers,
+                           serializers)
+
+
+class _Flight:
+    """A running handler and the requests waiting for it."""
+    __slots__ = [
+        "done",
+        "followers",
+        "response"
+    ]
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.followers = 0
+        self.response = None
+
+
+class SingleFlight:
+    """The requests in flight of a handler, by key.
+
+    Parameters
+    ----------
+    policy : CoalescePolicy
+        Self-explanatory."""
+    __slots__ = [
+        "_policy",
+        "_flights",
+        "_lock",
+        "executed",
+        "shared",
+        "timeouts"
+    ]
+
+    def __init__(self, policy: CoalescePolicy):
+        self._policy = policy
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<SingleFlight(executed = {self.executed}, " \
+               f"shared = {self.shared}, timeouts = {self.timeouts})>"
+
+    def wrap(self, route: str, process, serializers=None):
+        """Coalesces the calls to HttpMlv._process.
+
+        Parameters
+        ----------
+        route : str
+            The route of the handler.
+        process : callable
+            HttpMlv._process.
+        serializers : Serializers
+            The serializers of the handler, only the requests which
+            negotiate the same media type share a response.
+
+        Returns
+        -------
+        callable"""
+        key = self._policy.key
+        run = self.run
+
+        def coalesced(invoke, req, resp, uri_data):
+            run(key(route, req, serializers), req, resp,
+                lambda: process(invoke, req, resp, uri_data))
+
+        return coalesced
+
+    def run(self, key, req, resp, process) -> None:
+        """Runs process for the first request with a key and copies
+        its response onto the requests which arrive meanwhile. They
+        run process themselves if it raises, streams or takes
+        longer than the timeout of the policy.
+
+        Parameters
+        ----------
+        key : tuple
+            The key of the request.
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+        process : callable
+            Writes the response of the handler onto resp."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.executed += 1
+                leader = True
+            else:
+                flight.followers += 1
+                leader = False
+        if leader:
+            self._lead(key, flight, resp, process)
+            return
+        finished = flight.done.wait(self._policy.timeout)
+        response = flight.response
+        with self._lock:
+            if response is not None:
+                self.shared += 1
+            else:
+                self.executed += 1
+                if not finished:
+                    self.timeouts += 1
+        if response is not None:
+            response.apply(req, resp)
+            return
+        process()
+
+    def _lead(self, key, flight: _Flight, resp, process) -> None:
+        """Runs the handler, then hands its response over to the
+        requests which joined it."""
+        succeeded = False
+        try:
+            process()
+            succeeded = True
+        finally:
+            with self._lock:
+                del self._flights[key]
+                followers = flight.followers
+            if succeeded and followers and resp.stream is None:
+                flight.response = PreparedResponse.from_response(resp)
+            flight.done.set()
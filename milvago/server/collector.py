@@ -1,10 +1,26 @@
 """The module creates the server and starts the application
 on a given host and port."""
 import typing
-from werkzeug.serving import run_simple
 import falcon
 from milvago.server.handlers import HttpMlv, API
-from milvago.common.exceptions import InvalidMilvagoClassException
+from milvago.server.cache import ResponseCache
+from milvago.server.serializers import Serializers, DEFAULT_SERIALIZERS
+from milvago.server.templates import create_environment, precompile
+from milvago.server.compression import (
+    CompressionPolicy,
+    CompressionMiddleware
+)
+from milvago.server.metrics import Metrics, MetricsMiddleware, MetricsHandler
+from milvago.server.profiler import Profiler, ProfilerHandler
+from milvago.server.tasks import TaskQueue
+from milvago.server.resources import Resources
+from milvago.server.lifecycle import Lifecycle, HealthHandler
+from milvago.server.limits import Limit, LimitMiddleware
+from milvago.server.forms import FormRequest
+from milvago.common.exceptions import (
+    InvalidMilvagoClassException,
+    UnsupportedHandlerException
+)
 
 
 class Milvago:
@@ -25,14 +41,106 @@ class Milvago:
         Self-explanatory again.
     template_dir : str
         Full path to where the directory containing
-        the templates."""
+        the templates.
+    template_cache_dir : str
+        Where the compiled templates are persisted, so they
+        survive restarts and are shared by the workers. None
+        uses jinja2's temporary directory, '' disables it.
+    precompile_templates : bool
+        Compile all the templates when the application starts
+        instead of on their first render.
+    asgi : bool
+        Serve the application over ASGI, which allows handlers
+        declared with async def. Calling the instance returns an
+        AsgiApp for uvicorn, hypercorn, etc. instead of falcon.API.
+    asgi_threads : int
+        In ASGI mode, the size of the thread pool running the
+        synchronous handlers.
+    cache_max_bytes : int
+        The size of the response cache shared by all the handlers
+        with a CachePolicy.
+    parse_forms : bool
+        Let falcon parse form-urlencoded bodies into the request
+        params. Disable it to stream them with web.stream_form(),
+        multipart bodies are never parsed upfront.
+    serializers : list
+        Serializer instances for the dicts, lists and dataclasses
+        returned by handlers, by order of preference. Defaults to
+        the fastest JSON library installed and msgpack.
+    compression : CompressionPolicy
+        Compress text-like responses for clients sending
+        Accept-Encoding, True for the default policy.
+    metrics : Metrics
+        Record per-route latencies, status codes and sizes,
+        True for the default buckets.
+    metrics_route : str
+        Where the metrics are exposed in the Prometheus text
+        format, None to not expose them.
+    profiler : Profiler
+        Sample the stacks of a fraction of the requests.
+    profiler_route : str
+        Where the collapsed stacks can be downloaded with the
+        token of the profiler.
+    tasks : TaskQueue
+        The pool of every worker running the functions handlers
+        pass to web.defer, a TaskQueue() by default.
+    resources : Resources
+        The connection pools and clients the handlers reach
+        through web.resources, created once per worker.
+    on_startup : list
+        Callables run with the Milvago instance in every worker
+        before it serves requests, after the fork.
+    on_shutdown : list
+        Callables run with the Milvago instance when a worker
+        exits, in the reverse order, once its tasks are done and
+        before its resources are closed.
+    health_route : str
+        Where the health of the resources is reported, None to
+        not expose it.
+    limit : Limit
+        Applied to every request before it's routed, on top of
+        the limits of the handlers. In ASGI mode, the requests
+        never wait for a slot.
+    router : object
+        falcon router matching the requests to the handlers, i.e.
+        RadixRouter(), falcon's CompiledRouter by default.
+    startup_table : bool
+        Print a table of the mounted handlers when the
+        application is created, None for debug mode only.
+    workers : int
+        Serve the application with this many forked processes
+        instead of returning it, see PreforkServer.
+    max_requests : int
+        With workers, replace a worker after it has served this
+        many requests, 0 to never replace them."""
     __slots__ = [
         "_handler_list",
         "_app",
         "_debug",
         "_host",
         "_port",
-        "_templates"
+        "_templates",
+        "_template_cache_dir",
+        "_precompile_templates",
+        "_environment",
+        "_asgi",
+        "_asgi_threads",
+        "_cache",
+        "_serializers",
+        "_parse_forms",
+        "_compression",
+        "_metrics",
+        "_metrics_route",
+        "_profiler",
+        "_profiler_route",
+        "_tasks",
+        "_resources",
+        "_lifecycle",
+        "_health_route",
+        "_limit",
+        "_startup_table",
+        "_workers",
+        "_max_requests"
     ]
 
     def __init__(
@@ -41,14 +149,82 @@ class Milvago:
             debug: bool = False,
             host: str = '0.0.0.0',
             port: int = 8000,
-            template_dir: str = None
+            template_dir: str = None,
+            template_cache_dir: str = None,
+            precompile_templates: bool = False,
+            asgi: bool = False,
+            asgi_threads: int = None,
+            cache_max_bytes: int = 64 * 1024 * 1024,
+            serializers: list = None,
+            parse_forms: bool = True,
+            compression: CompressionPolicy = None,
+            metrics: Metrics = None,
+            metrics_route: str = "/metrics",
+            profiler: Profiler = None,
+            profiler_route: str = "/_milvago/profile",
+            tasks: TaskQueue = None,
+            resources: Resources = None,
+            on_startup: list = None,
+            on_shutdown: list = None,
+            health_route: str = None,
+            limit: Limit = None,
+            router=None,
+            startup_table: bool = None,
+            workers: int = None,
+            max_requests: int = 0
     ):
         self._handler_list = handlers
-        self._app = falcon.API()
+        self._compression = CompressionMiddleware(
+            None if compression is True else compression
+        ) if compression else None
+        self._metrics = Metrics() if metrics is True else metrics or None
+        self._metrics_route = metrics_route
+        self._profiler = profiler
+        self._profiler_route = profiler_route
+        self._tasks = TaskQueue() if tasks is None else tasks
+        if self._metrics is not None:
+            self._tasks.attach_metrics(self._metrics)
+        self._resources = Resources() if resources is None else resources
+        self._lifecycle = Lifecycle(
+            self,
+            on_startup,
+            on_shutdown,
+            resources=self._resources,
+            tasks=self._tasks
+        )
+        self._health_route = health_route
+        self._limit = limit
+        self._startup_table = debug if startup_table is None \
+            else startup_table
+        self._workers = workers
+        self._max_requests = max_requests
+        middleware = [self._lifecycle]
+        if self._metrics is not None:
+            middleware.append(MetricsMiddleware(self._metrics))
+        if limit is not None:
+            middleware.append(LimitMiddleware(limit, wait=not asgi))
+            if self._metrics is not None:
+                limit.attach_metrics(self._metrics)
+        if self._compression is not None:
+            middleware.append(self._compression)
+        self._app = falcon.API(
+            request_type=FormRequest,
+            middleware=middleware,
+            router=router
+        )
         self._debug = debug
         self._host = host
         self._port = port
         self._templates = template_dir
+        self._template_cache_dir = template_cache_dir
+        self._precompile_templates = precompile_templates
+        self._environment = None
+        self._asgi = asgi
+        self._asgi_threads = asgi_threads
+        self._cache = ResponseCache(max_bytes=cache_max_bytes)
+        self._parse_forms = parse_forms
+        self._serializers = Serializers(serializers) \
+            if serializers else DEFAULT_SERIALIZERS
 
     def attach_handler(self, handler: HttpMlv) -> None:
         """In case a handler needs to be added before
@@ -80,6 +256,51 @@ class Milvago:
         """Public property returning self._app."""
         return self._app
 
+    @property
+    def response_cache(self):
+        """The ResponseCache shared by the handlers, for
+        invalidation and statistics."""
+        return self._cache
+
+    @property
+    def templates(self):
+        """The jinja2 environment shared by the handlers, None
+        until the application is initialized or without a
+        template directory."""
+        return self._environment
+
+    @property
+    def compression(self):
+        """The CompressionMiddleware, None if compression
+        is disabled."""
+        return self._compression
+
+    @property
+    def metrics(self):
+        """The Metrics of the application, None if disabled."""
+        return self._metrics
+
+    @property
+    def profiler(self):
+        """The Profiler of the application, None if disabled."""
+        return self._profiler
+
+    @property
+    def tasks(self):
+        """The TaskQueue behind web.defer."""
+        return self._tasks
+
+    @property
+    def resources(self):
+        """The Resources behind web.resources."""
+        return self._resources
+
+    @property
+    def lifecycle(self):
+        """The Lifecycle running the startup and shutdown hooks
+        of every worker."""
+        return self._lifecycle
+
     @property
     def host(self):
         """Public property returning self._host."""
@@ -101,7 +322,10 @@ class Milvago:
                f"\thost = {self.host},\n" \
                f"\tport = {self.port},\n" \
                f"\tdebug = {self._debug},\n" \
-               f"\ttemplate_dir = {self._templates}"
+               f"\ttemplate_dir = {self._templates},\n" \
+               f"\tasgi = {self._asgi},\n" \
+               f"\tcompression = {self._compression},\n" \
+               f"\tmetrics = {self._metrics}"
 
     def modfy_props(self, prop_name: str, prop_value: typing.Any) -> None:
         """For modifying properties of Milvago.app.
@@ -113,27 +337,110 @@ class Milvago:
 
     def __call__(self):
         """Starts the application in either development
-        mode or in production through gunicorn.
+        mode, in production with its own workers or returns
+        it, for gunicorn.
 
         Returns
         -------
-        falcon.API"""
-        self._app.req_options.auto_parse_form_urlencoded = True
+        falcon.API
+            Or AsgiApp in ASGI mode.
+
+        Raises
+        ------
+        UnsupportedHandlerException
+            In case workers are requested in ASGI mode."""
+        if self._workers and self._asgi and not self._debug:
+            raise UnsupportedHandlerException(
+                "Milvago(..., workers=N) serves WSGI, run ASGI "
+                "applications with the workers of the ASGI server"
+            )
+        self._app.req_options.auto_parse_form_urlencoded = self._parse_forms
+        if self._templates and self._environment is None:
+            self._environment = create_environment(
+                self._templates,
+                self._template_cache_dir,
+                auto_reload=self._debug
+            )
+            if self._precompile_templates:
+                precompile(self._environment)
         for handler in self._handler_list:
             if isinstance(handler, HttpMlv) \
                     and not handler.template_loader\
-                    and self._templates:
-                handler.attach_templates(self._templates)
+                    and self._environment is not None:
+                handler.attach_environment(self._environment)
+            if isinstance(handler, HttpMlv) and self._profiler is not None:
+                handler.attach_profiler(self._profiler)
+            if isinstance(handler, HttpMlv) and handler.limit is not None \
+                    and self._metrics is not None:
+                handler.limit.attach_metrics(self._metrics)
+            if isinstance(handler, HttpMlv) and handler.timeout is not None \
+                    and self._metrics is not None:
+                handler.timeout.attach_metrics(self._metrics)
+        handlers = list(self._handler_list)
+        if self._metrics is not None and self._metrics_route is not None:
+            handlers.append(MetricsHandler(self._metrics_route, self._metrics))
+        if self._health_route is not None:
+            handlers.append(
+                HealthHandler(self._health_route, self._resources)
+            )
+        if self._profiler is not None:
+            self._profiler.install_signal()
+            if self._profiler.token and self._profiler_route is not None:
+                handlers.append(
+                    ProfilerHandler(self._profiler_route, self._profiler)
+                )
         API(
             self.app,
-            self._handler_list
+            handlers,
+            asgi=self._asgi,
+            cache=self._cache,
+            serializers=self._serializers,
+            tasks=self._tasks,
+            resources=self._resources,
+            startup_table=self._startup_table
         )
+        app = self.app
+        if self._asgi:
+            from milvago.server.asgi import AsgiApp
+            app = AsgiApp(self.app, self._asgi_threads, self._lifecycle)
         if self._debug:
+            self._run_debug(app)
+        elif self._workers:
+            from milvago.server.prefork import PreforkServer
+            PreforkServer(
+                app,
+                self.host,
+                self.port,
+                workers=self._workers,
+                max_requests=self._max_requests,
+                on_start=[self._lifecycle.startup],
+                on_exit=[self._lifecycle.shutdown]
+            ).run()
+        else:
+            return app
+
+    def _run_debug(self, app) -> None:
+        """Runs the development server, werkzeug for WSGI
+        and uvicorn for ASGI.
+
+        Parameters
+        ----------
+        app : falcon.API or AsgiApp
+            The application to serve."""
+        if not self._asgi:
+            from werkzeug.serving import run_simple
             run_simple(
                 self.host,
                 self.port,
-                self.app,
+                app,
                 use_reloader=True
             )
-        else:
-            return self.app
+            return
+        try:
+            import uvicorn
+        except ImportError as error:
+            raise ImportError(
+                "Running an ASGI application in debug mode "
+                "requires uvicorn: pip install uvicorn"
+            ) from error
+        uvicorn.run(app, host=self.host, port=self.port)
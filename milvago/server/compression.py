@@ -0,0 +1,394 @@
+"""The module contains the response compression stage of Milvago,
+a falcon middleware negotiating Accept-Encoding and compressing
+text-like responses with gzip or, if installed, brotli."""
+import zlib
+import threading
+from collections import OrderedDict
+import falcon
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/x-yaml",
+    "application/ld+json",
+    "image/svg+xml",
+)
+
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def accepted_encoding(header: str, available: tuple) -> str:
+    """Picks the preferred encoding out of the Accept-Encoding
+    header of a request.
+
+    Parameters
+    ----------
+    header : str
+        Value of the Accept-Encoding header.
+    available : tuple
+        The encodings the server supports, in order of preference.
+
+    Returns
+    -------
+    str
+        None if the client doesn't accept any of them."""
+    if not header:
+        return None
+    weights = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best = None
+    best_weight = 0.0
+    for coding in available:
+        weight = weights.get(coding, wildcard)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def vary_on_encoding(resp) -> None:
+    """Adds Accept-Encoding to the Vary header of a response,
+    unless it is already there."""
+    vary = resp.get_header("Vary")
+    if vary is None or "accept-encoding" not in vary.lower():
+        resp.append_header("Vary", "Accept-Encoding")
+
+
+class Compressor:
+    """Compresses data with a single encoding.
+
+    Parameters
+    ----------
+    encoding : str
+        'gzip' or 'br'.
+    level : int
+        The compression level, 1-9 for gzip, 0-11 for brotli."""
+    __slots__ = ["encoding", "level"]
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        self.level = level
+
+    def compress(self, data: bytes) -> bytes:
+        """One-shot compression.
+
+        Returns
+        -------
+        bytes"""
+        if self.encoding == "br":
+            return brotli.compress(data, quality=self.level)
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks):
+        """Compresses an iterable of chunks, flushing after every
+        one of them so the client receives each chunk as soon as
+        it has been produced (MJPEG, SSE, streamed templates).
+
+        Parameters
+        ----------
+        chunks : iterable
+            bytes or str chunks.
+
+        Returns
+        -------
+        generator"""
+        if self.encoding == "br":
+            compressor = brotli.Compressor(quality=self.level)
+
+            def process(chunk):
+                return compressor.process(chunk) + compressor.flush()
+
+            finish = compressor.finish
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+            def process(chunk):
+                return compressor.compress(chunk) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+
+            finish = compressor.flush
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if chunk:
+                    yield process(chunk)
+            yield finish()
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+class CompressionPolicy:
+    """Configures the compression of responses.
+
+    Parameters
+    ----------
+    level : int
+        The gzip compression level, 1-9.
+    brotli_level : int
+        The brotli quality, 0-11. Brotli is only offered when the
+        brotli package is installed.
+    min_size : int
+        Bodies smaller than this are sent as they are.
+    types : tuple
+        Prefixes of the compressible content-types.
+    cache_bytes : int
+        Size of the LRU of compressed outputs of responses with
+        an ETag, 0 disables it.
+    cache_max_item : int
+        Bodies larger than this aren't kept in the LRU, file
+        streams larger than this are compressed on the fly."""
+    __slots__ = [
+        "level",
+        "brotli_level",
+        "min_size",
+        "types",
+        "cache_bytes",
+        "cache_max_item"
+    ]
+
+    def __init__(self, level: int = 6, brotli_level: int = 4,
+                 min_size: int = 1024, types: tuple = COMPRESSIBLE_TYPES,
+                 cache_bytes: int = 16 * 1024 * 1024,
+                 cache_max_item: int = 1024 * 1024):
+        self.level = level
+        self.brotli_level = brotli_level
+        self.min_size = min_size
+        self.types = tuple(types)
+        self.cache_bytes = cache_bytes
+        self.cache_max_item = cache_max_item
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<CompressionPolicy(level = {self.level}, " \
+               f"brotli_level = {self.brotli_level}, " \
+               f"min_size = {self.min_size})>"
+
+    def compressors(self) -> dict:
+        """The available compressors, by order of preference.
+
+        Returns
+        -------
+        dict"""
+        compressors = {}
+        if brotli is not None:
+            compressors["br"] = Compressor("br", self.brotli_level)
+        compressors["gzip"] = Compressor("gzip", self.level)
+        return compressors
+
+    def compressible(self, content_type: str) -> bool:
+        """Whether a content-type is worth compressing."""
+        return bool(content_type) and content_type.startswith(self.types)
+
+
+class CompressedCache:
+    """Thread-safe LRU of compressed bodies, keyed by the path
+    of the resource, the entity-tag of the uncompressed body and
+    the encoding. The entity-tags of files only reflect their size
+    and modification time, which different files may share.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the compressed bodies."""
+    __slots__ = ["_entries", "_lock", "_max_bytes", "_size", "hits", "misses"]
+
+    def __init__(self, max_bytes: int):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple):
+        """Returns the compressed body, None if unknown."""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: tuple, data: bytes) -> None:
+        """Stores a compressed body, evicting the least
+        recently used ones until it fits."""
+        if len(data) > self._max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            while self._entries and self._size + len(data) > self._max_bytes:
+                self._size -= len(self._entries.popitem(last=False)[1])
+            self._entries[key] = data
+            self._size += len(data)
+
+
+class CompressionMiddleware:
+    """falcon middleware compressing the responses.
+
+    Parameters
+    ----------
+    policy : CompressionPolicy
+        The configuration of the compression."""
+    __slots__ = ["_policy", "_compressors", "_encodings", "_cache"]
+
+    def __init__(self, policy: CompressionPolicy = None):
+        self._policy = policy or CompressionPolicy()
+        self._compressors = self._policy.compressors()
+        self._encodings = tuple(self._compressors)
+        self._cache = CompressedCache(self._policy.cache_bytes) \
+            if self._policy.cache_bytes else None
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<CompressionMiddleware(policy = {self._policy}, " \
+               f"encodings = {self._encodings})>"
+
+    @property
+    def encodings(self) -> tuple:
+        """The supported encodings, by order of preference."""
+        return self._encodings
+
+    @property
+    def cache(self):
+        """The CompressedCache, None if disabled."""
+        return self._cache
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        """Compresses the response if the client accepts it.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+        resource : object
+            The resource the request has been routed to.
+        req_succeeded : bool
+            Whether the request has been processed without errors."""
+        if resp.status != falcon.HTTP_200 or req.method == "HEAD" \
+                or "content-encoding" in resp._headers \
+                or not self._policy.compressible(resp.content_type):
+            return
+        vary_on_encoding(resp)
+        encoding = accepted_encoding(
+            req.get_header("Accept-Encoding"),
+            self._encodings
+        )
+        if encoding is None:
+            return
+        compressor = self._compressors[encoding]
+        if resp.stream is not None:
+            self._compress_stream(req, resp, compressor)
+            return
+        data = resp.body if resp.body is not None else resp.data
+        if data is None or len(data) < self._policy.min_size:
+            return
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        resp.body = None
+        resp.data = self._compress(req, resp, compressor, data)
+        _mark_encoded(resp, encoding)
+
+    def _compress(self, req, resp, compressor, data: bytes) -> bytes:
+        """Compresses a body in memory, through the LRU when the
+        response has a validator.
+
+        Returns
+        -------
+        bytes"""
+        etag = resp.etag
+        if self._cache is None or etag is None \
+                or len(data) > self._policy.cache_max_item:
+            return compressor.compress(data)
+        key = (req.path, etag, compressor.encoding)
+        compressed = self._cache.get(key)
+        if compressed is None:
+            compressed = compressor.compress(data)
+            self._cache.put(key, compressed)
+        return compressed
+
+    def _compress_stream(self, req, resp, compressor) -> None:
+        """Compresses a streamed body. Small file streams are read
+        and compressed at once, so they can go through the LRU,
+        everything else is compressed on the fly."""
+        stream = resp.stream
+        if hasattr(stream, "__aiter__"):
+            return
+        length = resp.content_length
+        if length is not None:
+            length = int(length)
+            if length < self._policy.min_size:
+                return
+        resp.content_length = None
+        if hasattr(stream, "read"):
+            if length is not None and length <= self._policy.cache_max_item:
+                try:
+                    data = stream.read()
+                finally:
+                    stream.close()
+                resp.stream = None
+                resp.data = self._compress(req, resp, compressor, data)
+                _mark_encoded(resp, compressor.encoding)
+                return
+            stream = _read_chunks(stream)
+        resp.stream = compressor.stream(stream)
+        _mark_encoded(resp, compressor.encoding)
+
+
+def _read_chunks(fileobj, size: int = 64 * 1024):
+    """Iterates over a file, closing it at the end."""
+    try:
+        for chunk in iter(lambda: fileobj.read(size), b""):
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def _mark_encoded(resp, encoding: str) -> None:
+    """Sets Content-Encoding and gives the entity-tag a suffix,
+    as the compressed body is a different representation. The
+    conditional helpers ignore the suffix when comparing."""
+    resp.set_header("Content-Encoding", encoding)
+    etag = resp.get_header("ETag")
+    if etag is not None:
+        # the setter of falcon.Response.etag would quote W/ as well
+        weak = "W/" if etag.startswith("W/") else ""
+        tag = etag[len(weak):].strip('"')
+        resp.set_header("ETag", f'{weak}"{tag}-{encoding}"')
@@ -0,0 +1,239 @@
+"""The module contains the helpers for conditional requests:
+computing validators, checking them against the request and
+honoring the Range header."""
+import hashlib
+import falcon
+
+
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def make_etag(data: bytes) -> str:
+    """Computes a strong entity-tag out of the response bytes.
+
+    Parameters
+    ----------
+    data : bytes
+        The encoded body.
+
+    Returns
+    -------
+    str
+        The unquoted entity-tag."""
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def stat_etag(stat) -> str:
+    """Computes an entity-tag out of the modification time and
+    the size of a file, without reading it.
+
+    Parameters
+    ----------
+    stat : os.stat_result
+        The result of os.stat of the file.
+
+    Returns
+    -------
+    str
+        The unquoted entity-tag."""
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def etag_matches(req, etag: str) -> bool:
+    """Checks the If-None-Match header of the request against an
+    entity-tag, using the weak comparison as RFC 7232 requires.
+    Entity-tags of compressed representations match as well.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    etag : str
+        The unquoted entity-tag of the current representation.
+
+    Returns
+    -------
+    bool
+        True if the client already has the representation."""
+    candidates = req.if_none_match
+    if not candidates:
+        return False
+    if candidates[0] == "*" or etag in candidates:
+        return True
+    return any(
+        f"{etag}{suffix}" in candidates for suffix in ENCODING_SUFFIXES
+    )
+
+
+def not_modified(req, etag: str = None, last_modified=None) -> bool:
+    """Evaluates If-None-Match and If-Modified-Since. The latter
+    is only taken into account without the former, as RFC 7232
+    requires.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    etag : str
+        The unquoted entity-tag of the representation.
+    last_modified : datetime.datetime
+        The modification time of the representation.
+
+    Returns
+    -------
+    bool
+        True if the request should be answered with 304."""
+    if req.method not in ("GET", "HEAD"):
+        return False
+    if req.if_none_match:
+        return etag is not None and etag_matches(req, etag)
+    if last_modified is not None:
+        since = req.if_modified_since
+        return since is not None and \
+            last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def parse_ranges(header: str, size: int) -> list:
+    """Parses a Range header into absolute byte ranges.
+
+    Parameters
+    ----------
+    header : str
+        Value of the Range header.
+    size : int
+        Size of the representation.
+
+    Returns
+    -------
+    list
+        List of inclusive (first, last) tuples, None if the
+        header is malformed and should be ignored.
+
+    Raises
+    ------
+    falcon.HTTPRangeNotSatisfiable
+        In case none of the ranges overlaps the representation."""
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+    ranges = []
+    for spec in specs.split(","):
+        first, sep, last = spec.strip().partition("-")
+        try:
+            if not sep:
+                return None
+            if first:
+                first = int(first)
+                last = int(last) if last else max(size - 1, first)
+                if last < first:
+                    return None
+            elif last:
+                first, last = max(size - int(last), 0), size - 1
+            else:
+                return None
+        except ValueError:
+            return None
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+    if not ranges:
+        raise falcon.HTTPRangeNotSatisfiable(size)
+    return ranges
+
+
+def requested_ranges(req, size: int, etag: str = None,
+                     last_modified=None) -> list:
+    """Returns the ranges to serve, taking If-Range into account.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    size : int
+        Size of the representation.
+    etag : str
+        The unquoted entity-tag of the representation.
+    last_modified : datetime.datetime
+        The modification time of the representation.
+
+    Returns
+    -------
+    list
+        List of inclusive (first, last) tuples, None if the whole
+        representation should be served."""
+    header = req.get_header("Range")
+    if not header or req.method not in ("GET", "HEAD"):
+        return None
+    if_range = req.get_header("If-Range")
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            if if_range.startswith("W/") or etag is None \
+                    or if_range.strip('"') != etag:
+                return None
+        elif last_modified is None or req.get_header_as_datetime(
+                "If-Range") != last_modified.replace(microsecond=0):
+            return None
+    return parse_ranges(header, size)
+
+
+def send_bytes(req, resp, data: bytes, etag: str = None,
+               last_modified=None) -> None:
+    """Sets an encoded body on the response, together with its
+    validators, answering with 304 or 206 when the request asks
+    for it.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    resp : falcon.Response
+        falcon.Response instance.
+    data : bytes
+        The encoded body.
+    etag : str
+        The unquoted entity-tag, None to skip it.
+    last_modified : datetime.datetime
+        The modification time, None to skip it."""
+    resp.body = None
+    if etag is not None:
+        resp.etag = etag
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    if not_modified(req, etag, last_modified):
+        resp.status = falcon.HTTP_304
+        resp.content_type = None
+        resp.data = None
+        return
+    resp.accept_ranges = "bytes"
+    ranges = requested_ranges(req, len(data), etag, last_modified)
+    if ranges is not None and len(ranges) == 1:
+        first, last = ranges[0]
+        resp.status = falcon.HTTP_206
+        resp.content_range = (first, last, len(data))
+        data = data[first:last + 1]
+    resp.data = data
+
+
+def add_validators(req, resp) -> None:
+    """Attaches a strong ETag to the response a handler has just
+    produced and evaluates the conditional headers against it.
+    Only successful responses with a body in memory and without
+    an ETag of their own qualify.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    resp : falcon.Response
+        falcon.Response instance."""
+    if resp.status != falcon.HTTP_200 or resp.stream is not None \
+            or resp.etag is not None:
+        return
+    data = resp.body
+    if data is None:
+        data = resp.data
+        if data is None:
+            return
+    elif isinstance(data, str):
+        data = data.encode("utf-8")
+    send_bytes(req, resp, data, make_etag(data))
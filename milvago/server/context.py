@@ -0,0 +1,357 @@
+"""The module contains the per-request context, which keeps
+everything that belongs to a single request away from the
+handler instance shared between all requests."""
+import logging
+import contextvars
+import falcon
+from milvago.common.exceptions import InvalidMediaType, StreamRenderError
+from milvago.server.forms import FormLimits, stream_form
+from milvago.server.tasks import DEFAULT_TASKS
+from milvago.server.resources import DEFAULT_RESOURCES
+from milvago.server.static import open_source, guess_type, send_file
+
+
+LOGGER = logging.getLogger('Milvago')
+
+
+CONTENT_TYPES = {
+    "json": falcon.MEDIA_JSON,
+    "msgpack": falcon.MEDIA_MSGPACK,
+    "yml": falcon.MEDIA_YAML,
+    "xml": falcon.MEDIA_XML,
+    "html": falcon.MEDIA_HTML,
+    "js": falcon.MEDIA_JS,
+    "text": falcon.MEDIA_TEXT,
+    "jpg": falcon.MEDIA_JPEG,
+    "png": falcon.MEDIA_PNG,
+    "gif": falcon.MEDIA_GIF,
+}
+
+STREAM_BUFFER_SIZE = 16 * 1024
+
+_CURRENT_CONTEXT = contextvars.ContextVar(
+    "milvago_request_context",
+    default=None
+)
+
+
+def current_context():
+    """Returns the context of the request being processed
+    in the current thread/task or None outside of a request.
+
+    Returns
+    -------
+    RequestContext"""
+    return _CURRENT_CONTEXT.get()
+
+
+class RequestContext:
+    """State of a single request. An instance is created for
+    every request and handed to the handler, so a single HttpMlv
+    instance can serve any number of concurrent requests.
+    self.deadline is the Deadline of the request on the routes
+    with a timeout, None elsewhere. Once it has passed the request
+    has been answered with a 504, the helpers writing the response
+    refuse to and self.response must not be touched anymore.
+
+    Parameters
+    ----------
+    handler : HttpMlv
+        The handler the request has been routed to.
+    request : falcon.Request
+        falcon.Request instance.
+    response : falcon.Response
+        falcon.Response instance.
+    uri_data : dict
+        The named arguments parsed from the uri.
+    status : str
+        The initial status of the response.
+    headers : dict
+        The initial headers of the response."""
+    __slots__ = [
+        "handler",
+        "request",
+        "response",
+        "uri_data",
+        "status",
+        "headers",
+        "deadline"
+    ]
+
+    def __init__(self, handler, request, response, uri_data,
+                 status=falcon.HTTP_200, headers=None):
+        self.handler = handler
+        self.request = request
+        self.response = response
+        self.uri_data = uri_data
+        self.status = status
+        self.headers = {} if headers is None else headers
+        self.deadline = None
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<RequestContext(\n" \
+               f"\turi = {self.uri},\n" \
+               f"\tstatus = {self.status},\n" \
+               f"\theaders = {self.headers},\n" \
+               f"\turi_data = {self.uri_data}\n)>"
+
+    def _check_deadline(self, *resources) -> None:
+        """Gives up on the request if its deadline has passed,
+        closing the resources handed to the response, see
+        Deadline.guard.
+
+        Raises
+        ------
+        falcon.HTTPGatewayTimeout
+            In case it has."""
+        if self.deadline is not None:
+            self.deadline.guard(*resources)
+
+    @property
+    def uri(self):
+        """The route of the handler."""
+        return self.handler.uri
+
+    @property
+    def template_loader(self):
+        """The jinja2 environment of the handler."""
+        return self.handler.template_loader
+
+    @property
+    def resources(self):
+        """The Resources of the application, i.e. the connection
+        pools of the worker."""
+        resources = self.handler.resources
+        return DEFAULT_RESOURCES if resources is None else resources
+
+    def set_status(self, code):
+        """Set the response code of the request.
+
+        Parameters
+        ----------
+        code : int
+            Response code, calling the falcon.HTTP_<code>
+
+        Returns
+        -------
+        RequestContext"""
+        self.status = getattr(falcon, f"HTTP_{code}")
+        return self
+
+    def set_headers(self, **kwargs):
+        """Sets the headers in the response.
+
+        Parameters
+        ----------
+        kwargs : dict
+            List all headers as key-value pairs.
+
+        Returns
+        -------
+        RequestContext"""
+        self.headers.update(kwargs)
+        return self
+
+    def set_content_type(self, content_type: str) -> None:
+        """Sets one of the standard content-types.
+
+        Parameters
+        ----------
+        content_type : str
+            One of the keys of CONTENT_TYPES.
+
+        Raises
+        ------
+        InvalidMediaType
+            In case the content-type is unknown."""
+        if content_type not in CONTENT_TYPES:
+            raise InvalidMediaType(
+                f"Invalid media type, you can use one of "
+                f"{', '.join(CONTENT_TYPES.keys())}")
+        self.response.content_type = CONTENT_TYPES[content_type]
+
+    def set_custom_content_type(self, content_type: str) -> None:
+        """In case a non-standard content-type must be used.
+
+        Parameters
+        ----------
+        content_type : str
+            Self-explanatory."""
+        self.response.content_type = content_type
+
+    def render(self, template_file, **kwargs) -> str:
+        """For rendering a template.
+
+        Parameters
+        ----------
+        template_file : str
+            Relative path to the template
+            with respect to the handler's template loader.
+        **kwargs : dict
+            Named arguments for the template.
+
+        Returns
+        -------
+        str"""
+        self.set_content_type("html")
+        template = self.template_loader.get_template(template_file)
+        return template.render(**kwargs)
+
+    def stream_form(self, limits: FormLimits = None):
+        """Parses the form-urlencoded or multipart/form-data body
+        of the request incrementally. Every part is read entirely
+        before it's yielded, files larger than limits.spool_size
+        are kept in temporary files.
+
+        Parameters
+        ----------
+        limits : FormLimits
+            The limits of the form, the defaults allow fields of
+            up to 1MiB and files of any size.
+
+        Returns
+        -------
+        generator
+            FormPart instances, in the order they were sent.
+
+        Raises
+        ------
+        falcon.HTTPGatewayTimeout
+            In case the deadline of the request has passed."""
+        self._check_deadline()
+        return stream_form(self.request, limits)
+
+    def defer(self, fn, *args, **kwargs):
+        """Runs fn(*args, **kwargs) in the background, so the
+        response doesn't wait for it, i.e. audit writes. When the
+        TaskQueue is full, its policy drops the task, waits for
+        room or runs it right away.
+
+        Parameters
+        ----------
+        fn : callable
+            The task.
+        *args : list
+            Its positional arguments.
+        **kwargs : dict
+            Its named arguments.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The outcome of the task, None if it has been dropped."""
+        return (self.handler.tasks or DEFAULT_TASKS).submit(
+            fn, *args, **kwargs
+        )
+
+    def send_file(self, source, content_type: str = None,
+                  filename: str = None) -> None:
+        """Streams a file, i.e. a download the handler has just
+        authorized, with its Content-Length, ETag and Last-Modified,
+        answering with 304 or 206 when the request asks for it and
+        with multipart/byteranges to several ranges. The file is
+        never read into memory as a whole, entire files keep their
+        file descriptor so the server can sendfile them. The handler
+        returns None afterwards.
+
+        Parameters
+        ----------
+        source : str
+            A path, a file descriptor or a file open in binary
+            mode. The file descriptors and the files are flushed,
+            sent from their start and closed once sent.
+        content_type : str
+            Value of the Content-Type header, guessed from the
+            name of the file by default.
+        filename : str
+            Offer the file as a download under this name.
+
+        Raises
+        ------
+        falcon.HTTPNotFound
+            In case the file is missing or isn't a regular file.
+        falcon.HTTPGatewayTimeout
+            In case the deadline of the request has passed."""
+        fileobj, stat, name = open_source(source)
+        self._check_deadline(fileobj)
+        if filename is not None:
+            self.response.downloadable_as = filename
+        send_file(self.request, self.response, fileobj, stat,
+                  content_type or guess_type(filename or name))
+        # the 504 closes them if it's sent instead, as nothing
+        # would read them then
+        stream = self.response.stream
+        self._check_deadline(
+            fileobj, *(() if stream is None else (stream,))
+        )
+        self.status = self.response.status
+
+    def render_stream(self, template_file,
+                      buffer_size: int = STREAM_BUFFER_SIZE,
+                      **kwargs) -> None:
+        """Renders a template straight into the response stream,
+        so large pages are neither kept in memory as a whole nor
+        delayed until the last byte is rendered. The first chunk
+        is rendered right away, so errors at the top of the
+        template still produce an error response. Later errors
+        cut the response short, as the headers have been sent.
+
+        Parameters
+        ----------
+        template_file : str
+            Relative path to the template
+            with respect to the handler's template loader.
+        buffer_size : int
+            The approximate size of the chunks sent to the client.
+        **kwargs : dict
+            Named arguments for the template.
+
+        Raises
+        ------
+        falcon.HTTPGatewayTimeout
+            In case the deadline of the request has passed."""
+        self._check_deadline()
+        self.set_content_type("html")
+        template = self.template_loader.get_template(template_file)
+        chunks = _buffered(template.generate(**kwargs), buffer_size)
+        first = next(chunks, b"")
+        self._check_deadline(chunks)
+        self.response.stream = _guarded(first, chunks, template_file)
+
+
+def _buffered(pieces, buffer_size: int):
+    """Joins the pieces generated by a template into encoded
+    chunks of about buffer_size characters."""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            yield "".join(buffer).encode("utf-8")
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _guarded(first: bytes, chunks, template_file: str):
+    """Yields the rendered chunks, logging a failure of the
+    template together with its name before re-raising it, so
+    the server aborts the truncated response."""
+    yield first
+    try:
+        yield from chunks
+    except Exception as error:
+        LOGGER.exception(
+            f"Rendering {template_file} failed after the "
+            f"response has been started"
+        )
+        raise StreamRenderError(
+            f"{template_file}: {error}"
+        ) from error
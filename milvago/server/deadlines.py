@@ -0,0 +1,322 @@
+"""The module bounds the time a handler may take. A route's Timeout
+starts a Deadline for every request, which a client can shorten
+with the X-Request-Timeout header, in seconds, to pass on what's
+left of its own budget. The handler runs in a bounded thread pool
+and the request is answered with a 504 once the deadline passes,
+without waiting for it.
+
+A thread can't be stopped from the outside, so the cancellation is
+cooperative: a handler which hasn't started yet is cancelled, one
+which is running finds web.deadline expired and is expected to give
+up, i.e. by calling web.deadline.check() between the steps of its
+work and by passing web.deadline.remaining as the timeout of its
+own calls. Coroutines are cancelled outright.
+
+The handler still running after the 504 shares the response which
+has been sent, so it must not touch web.response anymore: the
+helpers of the RequestContext which write the response, i.e.
+send_file and render_stream, raise the 504 again instead. The
+files and generators they handed to the response in the meantime
+are closed by the 504, as nothing else would."""
+import os
+import time
+import weakref
+import functools
+import threading
+import contextvars
+from inspect import iscoroutinefunction
+import falcon
+
+
+# the header a client sends its remaining budget in, in seconds
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# the method the expired requests are recorded with in Metrics
+METRICS_METHOD = "TIMEOUT"
+
+# the live timeouts, registered once for the fork callback so it
+# doesn't keep them alive
+_TIMEOUTS = weakref.WeakSet()
+
+
+class Deadline:
+    """The point in time by which a request must be answered.
+
+    Parameters
+    ----------
+    expires : float
+        time.monotonic() at the deadline."""
+    __slots__ = [
+        "expires",
+        "_lock",
+        "_abandoned",
+        "_resources"
+    ]
+
+    def __init__(self, expires: float):
+        self.expires = expires
+        self._lock = threading.Lock()
+        self._abandoned = False
+        self._resources = []
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Deadline(remaining = {self.remaining})>"
+
+    @classmethod
+    def after(cls, seconds: float):
+        """A deadline a number of seconds from now.
+
+        Returns
+        -------
+        Deadline"""
+        return cls(time.monotonic() + seconds)
+
+    @property
+    def remaining(self) -> float:
+        """The seconds left, 0 once the deadline has passed."""
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return time.monotonic() >= self.expires
+
+    def check(self) -> None:
+        """Gives up on the request if the deadline has passed.
+
+        Raises
+        ------
+        falcon.HTTPGatewayTimeout
+            In case it has."""
+        if self.expired:
+            raise falcon.HTTPGatewayTimeout(
+                description="The request took too long"
+            )
+
+    def guard(self, *resources) -> None:
+        """Gives up on the request if the deadline has passed,
+        otherwise keeps the resources handed to the response, so
+        they are closed if it's abandoned before being sent.
+
+        Parameters
+        ----------
+        *resources : list
+            Files or generators, anything with a close method.
+
+        Raises
+        ------
+        falcon.HTTPGatewayTimeout
+            In case the deadline has passed, the resources are
+            closed then."""
+        with self._lock:
+            if not self._abandoned and not self.expired:
+                self._resources.extend(resources)
+                return
+        for resource in resources:
+            resource.close()
+        raise falcon.HTTPGatewayTimeout(
+            description="The request took too long"
+        )
+
+    def abandon(self, resp) -> None:
+        """Closes the resources the response won't send, as it's
+        replaced with a 504. The handler may still be running.
+
+        Parameters
+        ----------
+        resp : falcon.Response
+            falcon.Response instance."""
+        with self._lock:
+            self._abandoned = True
+            resources, self._resources = self._resources, []
+        stream = resp.stream
+        if stream is not None:
+            resp.stream = None
+            resources.append(stream)
+        for resource in resources:
+            close = getattr(resource, "close", None)
+            if close is not None:
+                close()
+
+
+class Timeout:
+    """How long the handlers of a route may take, shared by the
+    routes it's passed to.
+
+    Parameters
+    ----------
+    seconds : float
+        The deadline of every request, from the moment the
+        handler is called.
+    workers : int
+        The threads of the pool the synchronous handlers run in.
+        The handlers waiting for a thread count towards their
+        deadline and are cancelled with it.
+    header : str
+        The request header which may shorten the deadline, None
+        to ignore the clients."""
+    __slots__ = [
+        "_seconds",
+        "_workers",
+        "_header",
+        "_executor",
+        "_lock",
+        "_metrics",
+        "expired",
+        "__weakref__"
+    ]
+
+    def __init__(self, seconds: float, workers: int = 16,
+                 header: str = DEADLINE_HEADER):
+        self._seconds = seconds
+        self._workers = workers
+        self._header = header
+        self._executor = None
+        self._lock = threading.Lock()
+        self._metrics = None
+        self.expired = {}
+        _TIMEOUTS.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Timeout(seconds = {self._seconds}, " \
+               f"workers = {self._workers}, header = {self._header})>"
+
+    def _reset(self) -> None:
+        """The threads of the pool don't survive fork."""
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def seconds(self) -> float:
+        """The deadline of the requests, in seconds."""
+        return self._seconds
+
+    def attach_metrics(self, metrics) -> None:
+        """Counts the expired requests in the metrics of the
+        application, Milvago attaches them.
+
+        Parameters
+        ----------
+        metrics : Metrics
+            Self-explanatory."""
+        self._metrics = metrics
+
+    def deadline(self, req) -> Deadline:
+        """The deadline of a request, the earlier of the route's
+        and the one of the client.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+
+        Returns
+        -------
+        Deadline"""
+        seconds = self._seconds
+        if self._header is not None:
+            try:
+                seconds = min(seconds, float(req.get_header(self._header)))
+            except (TypeError, ValueError):
+                pass
+        return Deadline.after(seconds)
+
+    def _executor_for_process(self):
+        """The thread pool of the current process, created on
+        its first request."""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._workers,
+                        thread_name_prefix="milvago-timeout"
+                    )
+        return self._executor
+
+    def _expire(self, route: str):
+        """Counts an expired request and builds its 504.
+
+        Returns
+        -------
+        falcon.HTTPGatewayTimeout"""
+        with self._lock:
+            self.expired[route] = self.expired.get(route, 0) + 1
+        if self._metrics is not None:
+            self._metrics.count(route, METRICS_METHOD, "expired")
+        return falcon.HTTPGatewayTimeout(
+            description=f"The request took longer than "
+                        f"{self._seconds} seconds"
+        )
+
+    def wrap(self, route: str, invoke):
+        """Applies the timeout to a method of a handler.
+
+        Parameters
+        ----------
+        route : str
+            The route of the handler.
+        invoke : callable
+            Callable accepting the RequestContext, or a coroutine
+            function.
+
+        Returns
+        -------
+        callable"""
+        deadline_of = self.deadline
+        expire = self._expire
+        if iscoroutinefunction(invoke):
+            import asyncio
+
+            @functools.wraps(invoke)
+            async def timed_coroutine(context):
+                deadline = context.deadline = deadline_of(context.request)
+                try:
+                    return await asyncio.wait_for(
+                        invoke(context), deadline.remaining
+                    )
+                except asyncio.TimeoutError:
+                    deadline.abandon(context.response)
+                    raise expire(route) from None
+
+            return timed_coroutine
+
+        from concurrent.futures import TimeoutError as FutureTimeout
+        executor = self._executor_for_process
+
+        @functools.wraps(invoke)
+        def timed(context):
+            deadline = context.deadline = deadline_of(context.request)
+            if deadline.expired:
+                raise expire(route)
+            future = executor().submit(
+                contextvars.copy_context().run, invoke, context
+            )
+            try:
+                return future.result(deadline.remaining)
+            except FutureTimeout:
+                future.cancel()
+                deadline.abandon(context.response)
+                raise expire(route) from None
+
+        return timed
+
+
+def _reset_timeouts() -> None:
+    """The pools of the live timeouts don't survive fork."""
+    for timeout in list(_TIMEOUTS):
+        timeout._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_timeouts)
@@ -0,0 +1,471 @@
+"""The module parses form-urlencoded and multipart/form-data request
+bodies incrementally, so uploads of any size are processed in chunks.
+Fields are kept in memory, files are spooled to temporary files once
+they outgrow FormLimits.spool_size."""
+import io
+import shutil
+import tempfile
+from email.message import Message
+from urllib.parse import unquote_to_bytes
+import falcon
+from milvago.common.exceptions import UnsupportedHandlerException
+
+
+class FormLimits:
+    """The limits of a form.
+
+    Parameters
+    ----------
+    max_body_size : int
+        The maximum size of the whole body, None for no limit.
+    max_file_size : int
+        The maximum size of a single file, None for no limit.
+    max_field_size : int
+        The maximum size of a field which isn't a file.
+    max_parts : int
+        The maximum number of fields and files.
+    spool_size : int
+        Files larger than this are moved from memory to a
+        temporary file.
+    chunk_size : int
+        How much of the body is read at once."""
+    __slots__ = [
+        "max_body_size",
+        "max_file_size",
+        "max_field_size",
+        "max_parts",
+        "spool_size",
+        "chunk_size"
+    ]
+
+    def __init__(self, max_body_size: int = None, max_file_size: int = None,
+                 max_field_size: int = 1024 * 1024, max_parts: int = 1000,
+                 spool_size: int = 1024 * 1024, chunk_size: int = 64 * 1024):
+        self.max_body_size = max_body_size
+        self.max_file_size = max_file_size
+        self.max_field_size = max_field_size
+        self.max_parts = max_parts
+        self.spool_size = spool_size
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<FormLimits(max_body_size = {self.max_body_size}, " \
+               f"max_file_size = {self.max_file_size}, " \
+               f"max_field_size = {self.max_field_size}, " \
+               f"max_parts = {self.max_parts}, " \
+               f"spool_size = {self.spool_size})>"
+
+
+DEFAULT_FORM_LIMITS = FormLimits()
+
+
+class FormPart:
+    """A single field or file of a form.
+
+    Parameters
+    ----------
+    name : str
+        The name of the field.
+    filename : str
+        The name of the uploaded file, None for plain fields.
+    content_type : str
+        The content-type of the part, if sent.
+    headers : dict
+        All the headers of the part, lowercase names."""
+    __slots__ = [
+        "name",
+        "filename",
+        "content_type",
+        "headers",
+        "file",
+        "size"
+    ]
+
+    def __init__(self, name: str, filename: str = None,
+                 content_type: str = None, headers: dict = None):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.file = None
+        self.size = 0
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<FormPart(name = {self.name}, filename = {self.filename}, " \
+               f"size = {self.size})>"
+
+    @property
+    def is_file(self) -> bool:
+        """Whether the part is an uploaded file."""
+        return self.filename is not None
+
+    @property
+    def value(self) -> str:
+        """The contents decoded as UTF-8, meant for fields."""
+        return self.read().decode("utf-8", errors="replace")
+
+    def read(self) -> bytes:
+        """The whole contents of the part.
+
+        Returns
+        -------
+        bytes"""
+        self.file.seek(0)
+        return self.file.read()
+
+    def save(self, path: str) -> None:
+        """Copies the contents of the part to a file, in chunks.
+
+        Parameters
+        ----------
+        path : str
+            Where to save the part."""
+        self.file.seek(0)
+        with open(path, "wb") as destination:
+            shutil.copyfileobj(self.file, destination)
+
+    def close(self) -> None:
+        """Releases the memory or removes the temporary file."""
+        self.file.close()
+
+
+def _too_large(what: str, limit: int):
+    """The error of a part of the request exceeding its limit."""
+    return falcon.HTTPPayloadTooLarge(
+        description=f"The {what} exceeds the limit of {limit} bytes"
+    )
+
+
+class _BodyReader:
+    """Reads the body in chunks, enforcing max_body_size, and
+    supports looking for delimiters across chunk boundaries."""
+    __slots__ = ["_stream", "_limits", "_read", "_data", "_eof"]
+
+    def __init__(self, stream, limits: FormLimits):
+        self._stream = stream
+        self._limits = limits
+        self._read = 0
+        self._data = bytearray()
+        self._eof = False
+
+    def fill(self) -> bool:
+        """Reads the next chunk of the body into the buffer.
+
+        Returns
+        -------
+        bool
+            False at the end of the body."""
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._limits.chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._read += len(chunk)
+        limit = self._limits.max_body_size
+        if limit is not None and self._read > limit:
+            raise _too_large("body", limit)
+        self._data += chunk
+        return True
+
+    def chunks(self):
+        """Iterates over the rest of the body."""
+        if self._data:
+            yield bytes(self._data)
+            self._data.clear()
+        while self.fill():
+            yield bytes(self._data)
+            self._data.clear()
+
+    def startswith(self, prefix: bytes) -> bool:
+        """Checks the beginning of the remaining body."""
+        while len(self._data) < len(prefix) and self.fill():
+            pass
+        return self._data.startswith(prefix)
+
+    def skip(self, size: int) -> None:
+        """Drops bytes already in the buffer."""
+        del self._data[:size]
+
+    def read_until(self, delimiter: bytes, limit: int) -> bytes:
+        """Returns everything up to a delimiter, which is consumed.
+
+        Raises
+        ------
+        falcon.HTTPBadRequest
+            In case the delimiter isn't found within limit bytes."""
+        start = 0
+        while True:
+            index = self._data.find(delimiter, start)
+            if index >= 0:
+                data = bytes(self._data[:index])
+                del self._data[:index + len(delimiter)]
+                return data
+            start = max(len(self._data) - len(delimiter) + 1, 0)
+            if len(self._data) > limit or not self.fill():
+                raise falcon.HTTPBadRequest(
+                    description="Malformed multipart body"
+                )
+
+    def stream_until(self, delimiter: bytes):
+        """Yields everything up to a delimiter, which is consumed,
+        without buffering more than a chunk.
+
+        Raises
+        ------
+        falcon.HTTPBadRequest
+            In case the body ends before the delimiter."""
+        keep = len(delimiter) - 1
+        while True:
+            index = self._data.find(delimiter)
+            if index >= 0:
+                if index:
+                    yield bytes(self._data[:index])
+                del self._data[:index + len(delimiter)]
+                return
+            if len(self._data) > keep:
+                yield bytes(self._data[:-keep])
+                del self._data[:-keep]
+            if not self.fill():
+                raise falcon.HTTPBadRequest(
+                    description="Unexpected end of the multipart body"
+                )
+
+
+def _header_params(value: str, header: str = "content-type"):
+    """Parses a header value with parameters.
+
+    Returns
+    -------
+    email.message.Message"""
+    message = Message()
+    message[header] = value
+    return message
+
+
+def _write_part(part: FormPart, chunks, limits: FormLimits) -> None:
+    """Stores the contents of a part, in memory for fields and
+    spooled to the disk for large files."""
+    if part.is_file:
+        part.file = tempfile.SpooledTemporaryFile(max_size=limits.spool_size)
+        limit, what = limits.max_file_size, "file"
+    else:
+        part.file = io.BytesIO()
+        limit, what = limits.max_field_size, "field"
+    for chunk in chunks:
+        part.size += len(chunk)
+        if limit is not None and part.size > limit:
+            part.close()
+            raise _too_large(what, limit)
+        part.file.write(chunk)
+    part.file.seek(0)
+
+
+def parse_multipart(stream, boundary: str, limits: FormLimits = None):
+    """Parses a multipart/form-data body incrementally.
+
+    Parameters
+    ----------
+    stream : file
+        The body of the request.
+    boundary : str
+        The boundary parameter of the Content-Type header.
+    limits : FormLimits
+        The limits of the form.
+
+    Returns
+    -------
+    generator
+        FormPart instances, in the order they were sent.
+
+    Raises
+    ------
+    falcon.HTTPBadRequest
+        In case the body is malformed.
+    falcon.HTTPPayloadTooLarge
+        In case one of the limits is exceeded."""
+    limits = limits or DEFAULT_FORM_LIMITS
+    reader = _BodyReader(stream, limits)
+    delimiter = b"--" + boundary.encode("latin-1")
+    for _ in reader.stream_until(delimiter):
+        pass
+    parts = 0
+    while True:
+        if reader.startswith(b"--"):
+            return
+        if not reader.startswith(b"\r\n"):
+            raise falcon.HTTPBadRequest(description="Malformed multipart body")
+        reader.skip(2)
+        parts += 1
+        if parts > limits.max_parts:
+            raise falcon.HTTPPayloadTooLarge(
+                description=f"The form exceeds the limit of "
+                            f"{limits.max_parts} parts"
+            )
+        if reader.startswith(b"\r\n"):
+            reader.skip(2)
+            raw_headers = b""
+        else:
+            raw_headers = reader.read_until(b"\r\n\r\n", 16 * 1024)
+        headers = {}
+        for line in raw_headers.decode("utf-8", errors="replace").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        disposition = _header_params(
+            headers.get("content-disposition", ""),
+            "content-disposition"
+        )
+        part = FormPart(
+            disposition.get_param("name", header="content-disposition") or "",
+            disposition.get_filename(),
+            headers.get("content-type"),
+            headers
+        )
+        _write_part(part, reader.stream_until(b"\r\n" + delimiter), limits)
+        yield part
+
+
+def parse_urlencoded(stream, limits: FormLimits = None):
+    """Parses an application/x-www-form-urlencoded body
+    incrementally.
+
+    Parameters
+    ----------
+    stream : file
+        The body of the request.
+    limits : FormLimits
+        The limits of the form.
+
+    Returns
+    -------
+    generator
+        FormPart instances, one for every field.
+
+    Raises
+    ------
+    falcon.HTTPPayloadTooLarge
+        In case one of the limits is exceeded."""
+    limits = limits or DEFAULT_FORM_LIMITS
+    reader = _BodyReader(stream, limits)
+    pending = b""
+    parts = 0
+    for chunk in reader.chunks():
+        fields = (pending + chunk).split(b"&")
+        pending = fields.pop()
+        if len(pending) > limits.max_field_size:
+            raise _too_large("field", limits.max_field_size)
+        for field in fields:
+            if field:
+                parts += 1
+                yield _urlencoded_part(field, parts, limits)
+    if pending:
+        yield _urlencoded_part(pending, parts + 1, limits)
+
+
+def _urlencoded_part(field: bytes, parts: int, limits: FormLimits):
+    """Decodes a single name=value pair."""
+    if parts > limits.max_parts:
+        raise falcon.HTTPPayloadTooLarge(
+            description=f"The form exceeds the limit of "
+                        f"{limits.max_parts} parts"
+        )
+    if len(field) > limits.max_field_size:
+        raise _too_large("field", limits.max_field_size)
+    name, _, value = field.partition(b"=")
+    part = FormPart(
+        _unquote(name).decode("utf-8", errors="replace")
+    )
+    _write_part(part, [_unquote(value)], limits)
+    return part
+
+
+def _unquote(value: bytes) -> bytes:
+    """Decodes the plus signs and the percent-escapes of a name
+    or a value, keeping the bytes sent as they are."""
+    return unquote_to_bytes(value.replace(b"+", b" "))
+
+
+class FormRequest(falcon.Request):
+    """falcon.Request keeping the form-urlencoded body falcon
+    parses into the params, so stream_form can still stream it.
+    Milvago creates its requests with it."""
+    __slots__ = [
+        "form_body"
+    ]
+
+    def __init__(self, env, options=None):
+        self.form_body = None
+        falcon.Request.__init__(self, env, options)
+
+    def _parse_form_urlencoded(self):
+        self.form_body = self.stream.read(self.content_length or 0)
+        self.stream = io.BytesIO(self.form_body)
+        falcon.Request._parse_form_urlencoded(self)
+
+
+def stream_form(req, limits: FormLimits = None):
+    """Parses the form sent with a request, according to its
+    Content-Type.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    limits : FormLimits
+        The limits of the form.
+
+    Returns
+    -------
+    generator
+        FormPart instances.
+
+    Raises
+    ------
+    falcon.HTTPUnsupportedMediaType
+        In case the body isn't a form.
+    falcon.HTTPPayloadTooLarge
+        In case the Content-Length exceeds max_body_size.
+    UnsupportedHandlerException
+        In case falcon has already consumed the form of a request
+        which isn't a FormRequest."""
+    limits = limits or DEFAULT_FORM_LIMITS
+    content_type = _header_params(req.content_type or "")
+    length = req.content_length
+    if limits.max_body_size is not None and length is not None \
+            and length > limits.max_body_size:
+        raise _too_large("body", limits.max_body_size)
+    media_type = content_type.get_content_type()
+    if media_type == "multipart/form-data":
+        boundary = content_type.get_param("boundary")
+        if not boundary:
+            raise falcon.HTTPBadRequest(
+                description="The multipart boundary is missing"
+            )
+        return parse_multipart(req.bounded_stream, boundary, limits)
+    if media_type == "application/x-www-form-urlencoded":
+        body = getattr(req, "form_body", None)
+        if body is not None:
+            # falcon has parsed the body into the params already
+            return parse_urlencoded(io.BytesIO(body), limits)
+        if req.options.auto_parse_form_urlencoded \
+                and req.content_length:
+            raise UnsupportedHandlerException(
+                "The form has already been parsed into the request "
+                "params, create the falcon.API with "
+                "request_type=FormRequest"
+            )
+        return parse_urlencoded(req.bounded_stream, limits)
+    raise falcon.HTTPUnsupportedMediaType(
+        description="Expected multipart/form-data or "
+                    "application/x-www-form-urlencoded"
+    )
@@ -1,11 +1,42 @@
 """The module contains everything that is needed to
 create handlers for the Milvago server."""
+import os
+import re
 import logging
+from inspect import iscoroutinefunction
+from types import FunctionType, MethodType, MappingProxyType
 import falcon
 import jinja2
-from rich.console import Console
-from rich.table import Table
-from milvago.common.exceptions import InvalidMediaType
+from milvago.common.exceptions import UnsupportedHandlerException
+from milvago.server.templates import create_environment
+from milvago.server.serializers import (
+    DEFAULT_SERIALIZERS,
+    Serializers,
+    is_structured
+)
+from milvago.server.prepared import PreparedResponse, NegotiatedResponse
+from milvago.server.cache import CachePolicy, ResponseCache
+from milvago.server.limits import Limit
+from milvago.server.coalesce import CoalescePolicy, SingleFlight
+from milvago.server.deadlines import Timeout
+from milvago.server.static import (
+    StaticDirectory,
+    resolve_path,
+    open_file,
+    send_file
+)
+from milvago.server.conditional import add_validators
+from milvago.server.compression import (
+    PRECOMPRESSED,
+    accepted_encoding,
+    vary_on_encoding
+)
+from milvago.server.context import (
+    CONTENT_TYPES,
+    RequestContext,
+    current_context,
+    _CURRENT_CONTEXT
+)
 
 
 LOGGER = logging.getLogger('Milvago')
@@ -14,33 +45,101 @@ LOGGER = logging.getLogger('Milvago')
 class HttpMlv:
     """Really really basic HTTP server based on the falcon framework.
 
+    A single instance serves all the requests to its route, so
+    everything related to a request lives in a RequestContext.
+    Function-based handlers receive the context as their only
+    argument, class-based handlers receive it if their methods
+    accept an argument, i.e. `def get(self, web)`. Either way,
+    self.request, self.response, etc. resolve to the context of
+    the request currently being processed.
+
         Parameters
         ----------
         route : str
-            The URI."""
+            The URI.
+        cache : CachePolicy
+            Cache the responses to GET requests.
+        etag : bool
+            Attach a strong ETag, computed from the body, to the
+            responses to GET and HEAD requests and honor
+            If-None-Match and Range.
+        static_body : bool
+            The responses never change, every method is called
+            once when the handler is mounted and its encoded
+            outcome is served to all requests.
+        limit : Limit
+            Reject the requests over its concurrency or rate with
+            a 503 or a 429, before the method runs.
+        coalesce : CoalescePolicy
+            Identical concurrent GET requests wait for the first
+            one and share its response, True for the default
+            policy. Applies to synchronous methods.
+        timeout : Timeout
+            Answer with a 504 once a method takes longer, a number
+            of seconds for a Timeout with the defaults."""
     __slots__ = [
         "__route__",
         "_status",
         "_headers",
-        "_req",
-        "_resp",
-        "_uri_data",
         "_template_loader",
+        "_dispatch",
+        "_async_dispatch",
+        "_cache_policy",
+        "_cache",
+        "_etag",
+        "_serializers",
+        "_static_body",
+        "_prepared",
+        "_profiler",
+        "_tasks",
+        "_resources",
+        "_limit",
+        "_flights",
+        "_timeout",
         "get",
         "post",
         "put",
         "delete",
-        "head"
+        "head",
+        "patch",
+        "options",
+        "connect",
+        "trace",
+        "on_get",
+        "on_post",
+        "on_put",
+        "on_delete",
+        "on_head",
+        "on_patch",
+        "on_options",
+        "on_connect",
+        "on_trace"
     ]
 
-    def __init__(self, route):
+    def __init__(self, route, cache: CachePolicy = None, etag: bool = False,
+                 static_body: bool = False, limit: Limit = None,
+                 coalesce: CoalescePolicy = None, timeout: Timeout = None):
         self.__route__ = route
         self._status = falcon.HTTP_200
         self._headers = {}
-        self._uri_data = {}
-        self._req = None
-        self._resp = None
         self._template_loader = None
+        self._dispatch = MappingProxyType({})
+        self._async_dispatch = MappingProxyType({})
+        self._cache_policy = cache
+        self._cache = None
+        self._etag = etag
+        self._serializers = None
+        self._static_body = static_body
+        self._prepared = MappingProxyType({})
+        self._profiler = None
+        self._tasks = None
+        self._resources = None
+        self._limit = limit
+        self._flights = SingleFlight(
+            CoalescePolicy() if coalesce is True else coalesce
+        ) if coalesce else None
+        self._timeout = timeout if timeout is None \
+            or isinstance(timeout, Timeout) else Timeout(timeout)
 
     def __repr__(self):
         """Printing representation of the class.
@@ -55,18 +154,300 @@ class HttpMlv:
                f"\turi_data = {self.uri_data},\n" \
                f"\tstatus = {self.status}\n)>"
 
-    def __getattr__(self, name):
-        """Acts as a self-contained wrapper for all the on_*
-        methods available in falcon.
+    def compile_responders(self):
+        """Resolves the methods the handler declares into a frozen
+        method -> callable table and binds each of them to the
+        respective falcon on_<method> responder. Called once when
+        the handler is mounted, methods which aren't declared are
+        left to falcon, which answers with 405 and an Allow header.
+        Coroutine functions are additionally listed in
+        self.async_dispatch, they can only be served in ASGI mode.
+
+        Returns
+        -------
+        MappingProxyType"""
+        table = {}
+        async_table = {}
+        prepared = {}
+        for method in falcon.HTTP_METHODS:
+            name = method.lower()
+            invoke = _context_invoker(getattr(self, name, None))
+            if invoke is None:
+                continue
+            table[method] = invoke
+            if self._static_body:
+                prepared[method] = self._prepare_variants(method, invoke)
+                setattr(self, f"on_{name}", prepared[method].apply)
+                continue
+            if self._limit is not None:
+                invoke = self._limit.wrap(self.__route__, invoke)
+            if self._profiler is not None \
+                    and not iscoroutinefunction(invoke):
+                invoke = self._profiler.wrap(self.__route__, invoke)
+            if self._timeout is not None:
+                invoke = self._timeout.wrap(self.__route__, invoke)
+            if iscoroutinefunction(invoke):
+                async_table[method] = invoke
+            setattr(self, f"on_{name}", self._bind_responder(method, invoke))
+        self._dispatch = MappingProxyType(table)
+        self._async_dispatch = MappingProxyType(async_table)
+        self._prepared = MappingProxyType(prepared)
+        return self._dispatch
+
+    def _prepare_variants(self, method, invoke):
+        """Prepares the response of a method with a constant body,
+        once per media type when its serializers negotiate it.
+
         Parameters
         ----------
-        name : str
-            The function which has been called"""
+        method : str
+            The HTTP method.
+        invoke : callable
+            Callable accepting the RequestContext.
+
+        Returns
+        -------
+        PreparedResponse
+            Or NegotiatedResponse."""
+        prepared = self._prepare(method, invoke)
+        serializers = self._serializers or DEFAULT_SERIALIZERS
+        if not serializers.negotiates \
+                or "accept" not in prepared.headers.get("vary", "").lower():
+            return prepared
+        return NegotiatedResponse(serializers, {
+            media_type: self._prepare(method, invoke, media_type)
+            for media_type in serializers.media_types
+        })
 
-        def wrapper(*args, **kwargs):
-            self._process(*args, **kwargs)
+    def _prepare(self, method, invoke, accept: str = "*/*"):
+        """Calls a method of a handler with a constant body once,
+        on a synthetic request, and keeps the encoded outcome.
 
-        return wrapper
+        Parameters
+        ----------
+        method : str
+            The HTTP method.
+        invoke : callable
+            Callable accepting the RequestContext.
+        accept : str
+            The Accept header of the synthetic request.
+
+        Returns
+        -------
+        PreparedResponse"""
+        from falcon import testing
+        req = falcon.Request(testing.create_environ(
+            path=self.__route__,
+            method=method,
+            headers={"Accept": accept}
+        ))
+        resp = falcon.Response()
+        if iscoroutinefunction(invoke):
+            import asyncio
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(
+                    self._process_async(invoke, req, resp, {})
+                )
+            finally:
+                loop.close()
+        else:
+            self._process(invoke, req, resp, {})
+        return PreparedResponse.from_response(resp, etag=self._etag)
+
+    def _bind_responder(self, method, invoke):
+        """Creates the falcon responder for a single method.
+
+        Parameters
+        ----------
+        method : str
+            The HTTP method.
+        invoke : callable
+            Callable accepting the RequestContext.
+
+        Returns
+        -------
+        callable"""
+        process = self._process
+        if method == "GET" and self._flights is not None:
+            process = self._flights.wrap(
+                self.__route__, process,
+                self._serializers or DEFAULT_SERIALIZERS
+            )
+        if method == "GET" and self._cache_policy is not None:
+            return self._bind_cached_responder(invoke, process)
+        if self._etag and method in ("GET", "HEAD"):
+            def validated_responder(req, resp, **kwargs):
+                process(invoke, req, resp, kwargs)
+                add_validators(req, resp)
+
+            return validated_responder
+
+        def responder(req, resp, **kwargs):
+            process(invoke, req, resp, kwargs)
+
+        return responder
+
+    def _bind_cached_responder(self, invoke, process):
+        """Creates the falcon responder for GET requests of
+        a handler with a CachePolicy.
+
+        Parameters
+        ----------
+        invoke : callable
+            Callable accepting the RequestContext.
+        process : callable
+            Runs the handler on a cache miss.
+
+        Returns
+        -------
+        callable"""
+        if self._cache is None:
+            self._cache = ResponseCache()
+        cache = self._cache
+        policy = self._cache_policy
+        route = self.__route__
+        serializers = self._serializers or DEFAULT_SERIALIZERS
+
+        def cached_responder(req, resp, **kwargs):
+            key = policy.key(route, req, serializers)
+            if cache.serve(key, req, resp):
+                return
+            process(invoke, req, resp, kwargs)
+            cache.store(key, req, resp, policy)
+
+        return cached_responder
+
+    @property
+    def dispatch(self):
+        """The method -> callable table, empty until the
+        handler has been mounted."""
+        return self._dispatch
+
+    @property
+    def async_dispatch(self):
+        """The part of the dispatch table containing
+        coroutine functions."""
+        return self._async_dispatch
+
+    @property
+    def serializers(self):
+        """The Serializers of the dicts, lists and dataclasses
+        the handler returns, None for the defaults."""
+        return self._serializers
+
+    @property
+    def tasks(self):
+        """The TaskQueue running the functions passed to
+        web.defer, None for the default one."""
+        return self._tasks
+
+    @property
+    def coalesced(self):
+        """The SingleFlight of the GET requests, None unless
+        they're coalesced."""
+        return self._flights
+
+    @property
+    def timeout(self):
+        """The Timeout of the methods, None if they may take
+        as long as they like."""
+        return self._timeout
+
+    @property
+    def limit(self):
+        """The Limit of the handler, None if unlimited."""
+        return self._limit
+
+    @property
+    def resources(self):
+        """The Resources the handler reaches through
+        web.resources, None for the default registry."""
+        return self._resources
+
+    @property
+    def prepared(self):
+        """The method -> PreparedResponse table of a handler
+        with a static body, empty otherwise."""
+        return self._prepared
+
+    def attach_serializers(self, serializers: Serializers) -> None:
+        """Sets the serializers of the structured data the
+        handler returns, Milvago attaches the ones of the
+        application.
+
+        Parameters
+        ----------
+        serializers : Serializers
+            The serializers, by order of preference."""
+        self._serializers = serializers
+
+    def attach_tasks(self, tasks) -> None:
+        """Sets the TaskQueue of the functions the handler defers,
+        Milvago attaches the one of the application.
+
+        Parameters
+        ----------
+        tasks : TaskQueue
+            Self-explanatory."""
+        self._tasks = tasks
+
+    def attach_resources(self, resources) -> None:
+        """Sets the Resources of the handler, Milvago attaches
+        the ones of the application.
+
+        Parameters
+        ----------
+        resources : Resources
+            Self-explanatory."""
+        self._resources = resources
+
+    def attach_profiler(self, profiler) -> None:
+        """Samples the synchronous methods of the handler with a
+        Profiler, takes effect when the handler is mounted.
+
+        Parameters
+        ----------
+        profiler : Profiler
+            Self-explanatory."""
+        self._profiler = profiler
+
+    def attach_cache(self, cache: ResponseCache) -> None:
+        """Sets the ResponseCache the handler stores its responses
+        in, the Milvago class shares one between all handlers.
+
+        Parameters
+        ----------
+        cache : ResponseCache
+            Self-explanatory."""
+        self._cache = cache
+
+    @property
+    def cache_policy(self):
+        """The CachePolicy of the handler, if any."""
+        return self._cache_policy
+
+    @property
+    def cache(self):
+        """The ResponseCache of the handler, if any."""
+        return self._cache
+
+    def invalidate_cache(self, path: str = None) -> int:
+        """Drops the cached responses of the handler.
+
+        Parameters
+        ----------
+        path : str
+            Only drop the responses for a concrete path,
+            i.e. '/user/Linus' for a handler of '/user/{name}'.
+
+        Returns
+        -------
+        int
+            The number of dropped responses."""
+        if self._cache is None:
+            return 0
+        return self._cache.invalidate(route=self.__route__, path=path)
 
     def attach_templates(self, template_dir):
         """In the best case scenario this should not be needed
@@ -74,13 +455,21 @@ class HttpMlv:
         needs to render templates from a different directory than
         the default one. Otherwise the Milvago class should take
         care of that."""
-        loader = jinja2.FileSystemLoader(
-            searchpath=template_dir
-        )
-        self._template_loader = jinja2.Environment(loader=loader)
+        self._template_loader = create_environment(template_dir)
+
+    def attach_environment(self, environment: jinja2.Environment) -> None:
+        """Uses a jinja2 environment shared with other handlers,
+        so every template is compiled and cached only once.
+
+        Parameters
+        ----------
+        environment : jinja2.Environment
+            The environment of the application."""
+        self._template_loader = environment
 
     def set_status(self, code):
-        """Set the response code of the request.
+        """Set the response code of the request. Outside of
+        a request, sets the default response code of the handler.
         Parameters
         ----------
         code : int
@@ -88,31 +477,25 @@ class HttpMlv:
         Returns
         -------
         HttpWeb"""
-        self._status = getattr(falcon, f"HTTP_{code}")
+        context = current_context()
+        if context is None:
+            self._status = getattr(falcon, f"HTTP_{code}")
+        else:
+            context.set_status(code)
         return self
 
     def set_headers(self, **kwargs):
-        """Sets the headers in the response.
+        """Sets the headers in the response. Outside of
+        a request, sets the default headers of the handler.
         Parameters
         ----------
         kwargs : dict
             List all headers as key-value pairs."""
-        self._headers.update(kwargs)
-        return self
-
-    def _set_request(self, req, resp):
-        """Internal method, filling in all the class properties.
-        Parameters
-        ----------
-        req : falcon.Request
-            falcon.Request instance.
-        resp : falcon.Response
-            falcon.Response instance
-        Returns
-        -------
-        HttpWeb"""
-        self._req = req
-        self._resp = resp
+        context = current_context()
+        if context is None:
+            self._headers.update(kwargs)
+        else:
+            context.set_headers(**kwargs)
         return self
 
     @property
@@ -120,25 +503,40 @@ class HttpMlv:
         """For quick access to self._template_loader"""
         return self._template_loader
 
+    @property
+    def context(self):
+        """The RequestContext of the current request."""
+        return current_context()
+
     @property
     def request(self):
-        """For quick access to self._req"""
-        return self._req
+        """For quick access to the current falcon.Request"""
+        context = current_context()
+        return None if context is None else context.request
 
     @property
     def status(self):
-        """For quick access to self._status"""
-        return self._status
+        """For quick access to the current status"""
+        context = current_context()
+        return self._status if context is None else context.status
 
     @property
     def headers(self):
-        """For quick access to self._headers"""
-        return self._headers
+        """For quick access to the current headers"""
+        context = current_context()
+        return self._headers if context is None else context.headers
 
     @property
     def response(self):
-        """For quick access to self._resp"""
-        return self._resp
+        """For quick access to the current falcon.Response"""
+        context = current_context()
+        return None if context is None else context.response
+
+    @property
+    def deadline(self):
+        """For quick access to the Deadline of the current request"""
+        context = current_context()
+        return None if context is None else context.deadline
 
     @property
     def uri(self):
@@ -157,7 +555,8 @@ class HttpMlv:
         Returns
         -------
         dict"""
-        return self._uri_data
+        context = current_context()
+        return {} if context is None else context.uri_data
 
     @property
     def _content_types(self) -> dict:
@@ -167,22 +566,11 @@ class HttpMlv:
         Returns
         -------
         dict"""
-        return {
-            "json": falcon.MEDIA_JSON,
-            "msgpack": falcon.MEDIA_MSGPACK,
-            "yml": falcon.MEDIA_YAML,
-            "xml": falcon.MEDIA_XML,
-            "html": falcon.MEDIA_HTML,
-            "js": falcon.MEDIA_JS,
-            "text": falcon.MEDIA_TEXT,
-            "jpg": falcon.MEDIA_JPEG,
-            "png": falcon.MEDIA_PNG,
-            "gif": falcon.MEDIA_GIF,
-        }
+        return CONTENT_TYPES
 
     def _get_status(self):
         """Returns the status that has been previously set."""
-        return self._status
+        return self.status
 
     def render(self, template_file, **kwargs) -> str:
         """For rendering a template.
@@ -198,16 +586,53 @@ class HttpMlv:
         Returns
         -------
         str"""
-        self.set_content_type("html")
-        template = self._template_loader.get_template(template_file)
-        return template.render(**kwargs)
+        return current_context().render(template_file, **kwargs)
+
+    def stream_form(self, limits=None):
+        """Parses the form of the request incrementally, see
+        RequestContext.stream_form.
+
+        Parameters
+        ----------
+        limits : FormLimits
+            The limits of the form.
+
+        Returns
+        -------
+        generator
+            FormPart instances."""
+        return current_context().stream_form(limits)
+
+    def render_stream(self, template_file, **kwargs) -> None:
+        """Renders a template straight into the response stream,
+        see RequestContext.render_stream.
+
+        Parameters
+        ----------
+        template_file : str
+            Relative path to the template
+            with respect to self._template_loader.
+        **kwargs : dict
+            Named arguments for the template, buffer_size
+            sets the approximate size of the chunks."""
+        current_context().render_stream(template_file, **kwargs)
+
+    def send_file(self, source, content_type: str = None,
+                  filename: str = None) -> None:
+        """Streams a file, see RequestContext.send_file.
+
+        Parameters
+        ----------
+        source : str
+            A path, a file descriptor or a file open in binary mode.
+        content_type : str
+            Value of the Content-Type header, guessed by default.
+        filename : str
+            Offer the file as a download under this name."""
+        current_context().send_file(source, content_type, filename)
 
     def set_content_type(self, content_type: str) -> None:
-        if content_type not in self._content_types:
-            raise InvalidMediaType(
-                f"Invalid media type, you can use one of "
-                f"{', '.join(self._content_types.keys())}")
-        self._resp.content_type = self._content_types[content_type]
+        current_context().set_content_type(content_type)
 
     def set_custom_content_type(self, content_type: str) -> None:
         """In case a non-standard content-type must be used.
@@ -220,49 +645,267 @@ class HttpMlv:
         Returns
         -------
         None"""
-        self.response.content_type = content_type
+        current_context().set_custom_content_type(content_type)
 
-    def _process(self, req, resp, **kwargs):
+    def _process(self, invoke, req, resp, uri_data):
         """Self contained method for all GET, POST, PUT, DELETE, HEAD,
         etc. methods
         Parameters
         ----------
+        invoke : callable
+            The entry of the dispatch table for the method.
         req : falcon.Request
             falcon.Request instance.
         resp : falcon.Response
             falcon.Response instance
+        uri_data : dict
+            The named arguments parsed from the uri."""
+        context = self._create_context(req, resp, uri_data)
+        token = _CURRENT_CONTEXT.set(context)
+        try:
+            body = invoke(context)
+        finally:
+            _CURRENT_CONTEXT.reset(token)
+        self._finish(context, body)
+
+    async def _process_async(self, invoke, req, resp, uri_data):
+        """The coroutine counterpart of _process, used in
+        ASGI mode for handlers declared with async def."""
+        key = None
+        if self._cache_policy is not None and req.method == "GET":
+            key = self._cache_policy.key(
+                self.__route__, req,
+                self._serializers or DEFAULT_SERIALIZERS
+            )
+            if self._cache.serve(key, req, resp):
+                return
+        context = self._create_context(req, resp, uri_data)
+        token = _CURRENT_CONTEXT.set(context)
+        try:
+            body = await invoke(context)
+        finally:
+            _CURRENT_CONTEXT.reset(token)
+        self._finish(context, body)
+        if key is not None:
+            self._cache.store(key, req, resp, self._cache_policy)
+        elif self._etag and req.method in ("GET", "HEAD"):
+            add_validators(req, resp)
+
+    def _create_context(self, req, resp, uri_data):
+        """Creates the RequestContext for a request.
+
         Returns
         -------
-        HttpWeb"""
-        self._uri_data = kwargs
-        self._set_request(req, resp)
-        resp.status = self._get_status()
-        response_method = getattr(self, req.method.lower())
-        if response_method.__class__.__name__ == 'function':
-            resp.body = response_method(self)
+        RequestContext"""
+        return RequestContext(
+            self,
+            req,
+            resp,
+            uri_data,
+            self._status,
+            dict(self._headers)
+        )
+
+    @staticmethod
+    def _finish(context, body):
+        """Copies the outcome of the handler onto the response.
+
+        Parameters
+        ----------
+        context : RequestContext
+            The context of the request.
+        body : str
+            Whatever the handler returned. bytes and
+            PreparedResponse go through resp.data as they are,
+            memoryviews as well if they span a bytes object,
+            since WSGI requires bytes. Dicts, lists, tuples and
+            dataclasses are serialized according to Accept."""
+        resp = context.response
+        resp.status = context.status
+        if context.headers:
+            resp.set_headers(context.headers)
+        if body is None or isinstance(body, str):
+            resp.body = body
+        elif isinstance(body, (bytes, bytearray)):
+            resp.data = body
+        elif isinstance(body, memoryview):
+            resp.data = body.obj if isinstance(body.obj, bytes) \
+                and body.nbytes == len(body.obj) else body.tobytes()
+        elif isinstance(body, PreparedResponse):
+            body.apply(context.request, resp)
+        elif is_structured(body):
+            (context.handler._serializers or DEFAULT_SERIALIZERS).write(
+                context.request, resp, body
+            )
         else:
-            resp.body = response_method()
+            resp.body = body
+
+
+def _context_invoker(method):
+    """Turns a declared method into a callable accepting the
+    RequestContext. Functions attached through expose_web and
+    methods accepting an argument receive the context, methods
+    without arguments are called as they are.
+
+    Parameters
+    ----------
+    method : callable
+        The attribute named after the HTTP method.
+
+    Returns
+    -------
+    callable
+        None if the method isn't declared."""
+    if isinstance(method, FunctionType):
+        return method
+    if isinstance(method, MethodType):
+        if method.__func__.__code__.co_argcount > 1:
+            return method
+        if iscoroutinefunction(method):
+            async def invoke(context):
+                return await method()
+            return invoke
+        return lambda context: method()
+    return None
 
 
 class HttpStaticDir:
     """Wrapper class for directories containing static files,
-    ie. css, js, images, fonts, etc.
-    IMPORTANT: This is for development purposes only.
+    ie. css, js, images, fonts, etc. Files are served with
+    ETag and Last-Modified validators computed from their
+    modification time and size, conditional and Range
+    requests are answered with 304 and 206 respectively.
+    Precompressed siblings (style.css.br, style.css.gz) are
+    served instead of the file to clients accepting them.
+    The directory is scanned once when it is mounted, small
+    files are kept in memory and the others are streamed
+    through wsgi.file_wrapper, so the server can sendfile them.
     Parameters
     ----------
     uri : str
         The path where the directory should be mounted.
     dir_path : str
         Full path to the directory containing the static
-        files."""
+        files.
+    cache_control : str
+        Value of the Cache-Control header of the files,
+        i.e. 'public, max-age=86400'.
+    hot_bytes : int
+        Memory budget for the contents of small files,
+        0 disables it.
+    max_hot_size : int
+        Files up to this size are kept in memory.
+    scan : bool
+        Index the directory at mount time. Without it, every
+        request resolves the path on the disk, which picks
+        up new files at the cost of a few system calls."""
     __slots__ = [
         "_uri",
-        "_dir_path"
+        "_dir_path",
+        "_cache_control",
+        "_hot_bytes",
+        "_max_hot_size",
+        "_scan",
+        "_directory"
     ]
 
-    def __init__(self, uri: str, dir_path: str):
-        self._dir_path = dir_path
-        self._uri = uri
+    def __init__(self, uri: str, dir_path: str, cache_control: str = None,
+                 hot_bytes: int = 16 * 1024 * 1024,
+                 max_hot_size: int = 256 * 1024, scan: bool = True):
+        self._dir_path = os.path.abspath(dir_path)
+        self._uri = uri.rstrip("/")
+        self._cache_control = cache_control
+        self._hot_bytes = hot_bytes
+        self._max_hot_size = max_hot_size
+        self._scan = scan
+        self._directory = None
+
+    def mount(self, media_types: dict) -> None:
+        """Scans the directory, called when the application
+        is initialized.
+
+        Parameters
+        ----------
+        media_types : dict
+            Content-types by file extension."""
+        if not self._scan:
+            return
+        self._directory = StaticDirectory(
+            self._dir_path,
+            media_types,
+            self._cache_control,
+            self._hot_bytes,
+            self._max_hot_size
+        )
+        self._directory.scan()
+
+    def rescan(self) -> int:
+        """Indexes the directory again, i.e. after deploying
+        new files.
+
+        Returns
+        -------
+        int
+            The number of files found."""
+        if self._directory is None:
+            return 0
+        return self._directory.scan()
+
+    @property
+    def directory(self):
+        """The StaticDirectory, None until mounted or if
+        scanning is disabled."""
+        return self._directory
+
+    def __call__(self, req, resp, **kwargs):
+        """Serves a file, falcon calls it for every request
+        starting with the mount-point.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance."""
+        if req.method not in ("GET", "HEAD"):
+            raise falcon.HTTPMethodNotAllowed(["GET", "HEAD"])
+        if self._directory is not None:
+            self._directory.serve(req, resp, req.path[len(self._uri) + 1:])
+            return
+        if self._cache_control:
+            resp.cache_control = [self._cache_control]
+        file_path = resolve_path(
+            self._dir_path,
+            req.path[len(self._uri) + 1:]
+        )
+        content_type = resp.options.static_media_types.get(
+            os.path.splitext(file_path)[1],
+            "application/octet-stream"
+        )
+        siblings = {
+            encoding: f"{file_path}{extension}"
+            for encoding, extension in PRECOMPRESSED
+            if os.path.isfile(f"{file_path}{extension}")
+        }
+        if siblings:
+            vary_on_encoding(resp)
+            encoding = accepted_encoding(
+                req.get_header("Accept-Encoding"),
+                tuple(siblings)
+            )
+            if encoding is not None:
+                fileobj, stat = open_file(siblings[encoding])
+                resp.set_header("Content-Encoding", encoding)
+                send_file(req, resp, fileobj, stat, content_type)
+                return
+        fileobj, stat = open_file(file_path)
+        send_file(req, resp, fileobj, stat, content_type)
+
+    @property
+    def prefix(self) -> str:
+        """The regular expression matching the paths
+        of the files in the directory."""
+        return f"{re.escape(self._uri)}/"
 
     def __repr__(self):
         """Printing representation of the class.
@@ -294,13 +937,37 @@ class API:
         falcon.API instance.
     classes : list
         list of initialized classes inheriting the HttpWeb class
-        or HttpStaticDir in development mode."""
+        or HttpStaticDir.
+    asgi : bool
+        Whether the application is served over ASGI, the only
+        mode supporting handlers declared with async def.
+    cache : ResponseCache
+        The cache shared by the handlers with a CachePolicy.
+    serializers : Serializers
+        The serializers of the structured data returned
+        by the handlers.
+    tasks : TaskQueue
+        The pool running the functions deferred by the handlers.
+    resources : Resources
+        The pools and clients used by the handlers.
+    startup_table : bool
+        Print a table of the mounted handlers, through rich.
+
+    Raises
+    ------
+    UnsupportedHandlerException
+        In case a coroutine handler is mounted in WSGI mode."""
 
     __slots__ = [
         "_mountpoints"
     ]
 
-    def __init__(self, falcon_api, classes):
+    def __init__(self, falcon_api, classes, asgi: bool = False,
+                 cache: ResponseCache = None,
+                 serializers: Serializers = None,
+                 tasks=None,
+                 resources=None,
+                 startup_table: bool = True):
         self._mountpoints = []
         for handler in classes:
             if isinstance(handler, HttpMlv):
@@ -308,27 +975,38 @@ class API:
                     f"Mounting handler {handler.uri} "
                     f"of {str(handler)}"
                 )
+                if handler.cache_policy is not None \
+                        and handler.cache is None and cache is not None:
+                    handler.attach_cache(cache)
+                if handler.serializers is None and serializers is not None:
+                    handler.attach_serializers(serializers)
+                if handler.tasks is None and tasks is not None:
+                    handler.attach_tasks(tasks)
+                if handler.resources is None and resources is not None:
+                    handler.attach_resources(resources)
+                handler.compile_responders()
+                if handler.async_dispatch and not asgi:
+                    raise UnsupportedHandlerException(
+                        f"{handler.uri} declares async methods "
+                        f"({', '.join(handler.async_dispatch)}), "
+                        f"which require Milvago(..., asgi=True)"
+                    )
                 falcon_api.add_route(handler.uri, handler)
             elif isinstance(handler, HttpStaticDir):
                 LOGGER.info(
                     f"Mounting STATIC handler "
                     f"{handler.file_path} at {handler.uri}")
-                LOGGER.warning(
-                    f"Mounting static handles isn't advisable "
-                    f"in production environments. A web server "
-                    f"is a more suitable solution as the "
-                    f"interpreter would be slower at reading files."
-                )
-                falcon_api.add_static_route(
-                    handler.uri,
-                    handler.file_path
-                )
+                handler.mount(falcon_api.resp_options.static_media_types)
+                falcon_api.add_sink(handler, handler.prefix)
             else:
                 LOGGER.error(f"Cannot use class of type "
                              f"{handler.__class__.__name__}")
                 continue
             self._append_mountpoint(handler.uri, str(handler))
-        self._list_all()
+        self._mountpoints.sort(key=lambda x: x[0])
+        LOGGER.info(self._mountpoints)
+        if startup_table:
+            self._list_all()
 
     def __repr__(self):
         """Printing representation of the class.
@@ -353,9 +1031,10 @@ class API:
 
     def _list_all(self):
         """Simply lists all the handlers, will be called
-        when the application is initialized."""
-        self._mountpoints.sort(key=lambda x: x[0])
-        LOGGER.info(self._mountpoints)
+        when the application is initialized. rich is only
+        imported here, it isn't needed to serve requests."""
+        from rich.console import Console
+        from rich.table import Table
         console = Console()
         table = Table(
             show_header=True,
@@ -370,7 +1049,8 @@ class API:
         console.log(table)
 
 
-def expose_static(route: str, data_dir: str):
+def expose_static(route: str, data_dir: str, cache_control: str = None,
+                  **options):
     """The simplest way to attach a static directory
     in the application.
 
@@ -382,28 +1062,58 @@ def expose_static(route: str, data_dir: str):
     data_dir : str
         Path to where the actual files are
         located.
+    cache_control : str
+        Value of the Cache-Control header of the files.
+    options : dict
+        hot_bytes, max_hot_size and scan, as accepted
+        by HttpStaticDir.
 
     Returns
     -------
     HttpStaticDir"""
-    return HttpStaticDir(route, data_dir)
+    return HttpStaticDir(route, data_dir, cache_control, **options)
 
 
-def expose_web(route: str, methods: str = 'get'):
-    """Exposes a function to the web-server
+def expose_web(route: str, methods: str = 'get', cache: CachePolicy = None,
+               etag: bool = False, static_body: bool = False,
+               limit: Limit = None, coalesce: CoalescePolicy = None,
+               timeout: Timeout = None):
+    """Exposes a function to the web-server. The function
+    receives the RequestContext of the request and may be
+    declared with async def when the application runs in
+    ASGI mode.
     Parameters
     ----------
     route : str
         The URI.
     methods : str
         Comma-separated methods, i.e. 'get,post,put".
+    cache : CachePolicy
+        Cache the responses to GET requests.
+    etag : bool
+        Attach ETags to the responses and honor conditional
+        and Range requests.
+    static_body : bool
+        The response never changes: the function is called once
+        when the handler is mounted and its encoded outcome is
+        served to every request.
+    limit : Limit
+        Reject the requests over its concurrency or rate.
+    coalesce : CoalescePolicy
+        Identical concurrent GET requests share the response of
+        the first one, True for the default policy.
+    timeout : Timeout
+        Answer with a 504 once the handler takes longer, a number
+        of seconds for a Timeout with the defaults.
     Returns
     -------
     HttpWeb"""
 
     def decorator(function):
         def wrapper():
-            handler = HttpMlv(route)
+            handler = HttpMlv(route, cache=cache, etag=etag,
+                              static_body=static_body, limit=limit,
+                              coalesce=coalesce, timeout=timeout)
             for method in methods.split(','):
                 setattr(handler, method.strip(), function)
             return handler
@@ -0,0 +1,160 @@
+"""The module runs the startup and shutdown hooks of an application
+in every process serving it. PreforkServer starts a worker right
+after forking it and the ASGI lifespan events start the process of
+an ASGI server. Behind other servers, i.e. gunicorn, which may or
+may not fork after the application was created, the process starts
+on its first request. Nothing runs in a master process which only
+forks the workers."""
+import os
+import atexit
+import logging
+import weakref
+import threading
+from milvago.server.handlers import HttpMlv
+
+
+LOGGER = logging.getLogger('Milvago')
+
+# the live lifecycles, registered once for the exit and fork
+# callbacks so these don't keep the applications alive
+_LIFECYCLES = weakref.WeakSet()
+
+
+class Lifecycle:
+    """Startup and shutdown of the processes of an application,
+    also installed as falcon middleware.
+
+    Parameters
+    ----------
+    app : Milvago
+        Passed to every hook.
+    on_startup : list
+        Callables run once per process before it serves requests.
+    on_shutdown : list
+        Callables run when a started process exits, in the reverse
+        order, before the resources are closed.
+    resources : Resources
+        Created when a process starts and closed when it exits.
+    tasks : TaskQueue
+        Drained when a process exits, before the hooks run, since
+        the tasks may still use the resources."""
+    __slots__ = [
+        "_app",
+        "_on_startup",
+        "_on_shutdown",
+        "_resources",
+        "_tasks",
+        "_pid",
+        "_lock",
+        "__weakref__"
+    ]
+
+    def __init__(self, app, on_startup: list = None,
+                 on_shutdown: list = None, resources=None, tasks=None):
+        self._app = app
+        self._on_startup = list(on_startup or [])
+        self._on_shutdown = list(on_shutdown or [])
+        self._resources = resources
+        self._tasks = tasks
+        self._pid = None
+        self._lock = threading.Lock()
+        _LIFECYCLES.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Lifecycle(on_startup = {self._on_startup}, " \
+               f"on_shutdown = {self._on_shutdown}, " \
+               f"started = {self.started})>"
+
+    def _forget(self) -> None:
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        """Whether the current process has been started."""
+        return self._pid == os.getpid()
+
+    def startup(self) -> None:
+        """Runs the startup hooks and creates the resources, once
+        per process. When a hook fails, the next call starts over."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            for hook in self._on_startup:
+                hook(self._app)
+            if self._resources is not None:
+                self._resources.start()
+            self._pid = os.getpid()
+            LOGGER.info(f"Process {self._pid} has started")
+
+    def shutdown(self) -> None:
+        """Drains the tasks, runs the shutdown hooks and closes the
+        resources, if the current process has been started."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._pid = None
+        if self._tasks is not None:
+            self._tasks.drain()
+        for hook in reversed(self._on_shutdown):
+            try:
+                hook(self._app)
+            except Exception:
+                LOGGER.exception(f"The shutdown hook {hook} failed")
+        if self._resources is not None:
+            self._resources.close()
+
+    def process_request(self, req, resp):
+        """Starts the process on its first request."""
+        if self._pid != os.getpid():
+            self.startup()
+
+
+def _shutdown_lifecycles() -> None:
+    """Shuts the started processes down when they exit."""
+    for lifecycle in list(_LIFECYCLES):
+        lifecycle.shutdown()
+
+
+def _forget_lifecycles() -> None:
+    """The locks may be held by threads which don't survive fork."""
+    for lifecycle in list(_LIFECYCLES):
+        lifecycle._forget()
+
+
+atexit.register(_shutdown_lifecycles)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_lifecycles)
+
+
+class HealthHandler(HttpMlv):
+    """Reports the health of the resources as JSON, with a 503
+    when any of them fails.
+
+    Parameters
+    ----------
+    route : str
+        Where the handler is mounted.
+    resources : Resources
+        The resources to check."""
+    __slots__ = []
+
+    def __init__(self, route: str, resources):
+        HttpMlv.__init__(self, route)
+        self.attach_resources(resources)
+
+    def get(self, web):
+        results = web.resources.health()
+        healthy = all(result == "ok" for result in results.values())
+        if not healthy:
+            web.set_status(503)
+        return {
+            "status": "ok" if healthy else "failing",
+            "resources": results
+        }
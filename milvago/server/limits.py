@@ -0,0 +1,320 @@
+"""The module sheds load before it piles up: Limit caps the requests
+a route, or the whole application, processes at once and the rate
+at which it accepts them. The requests over a limit are rejected at
+once with a 503 or a 429 and a Retry-After header, instead of
+queueing until every one of them times out.
+
+A request finding all the slots taken may wait for one up to
+queue_timeout. With a target, the wait adapts in the manner of CoDel:
+the queue is fine as long as it empties now and then, but when even
+the shortest wait of an interval exceeds the target, the queue is
+standing and the requests are only given the target to get a slot
+until it drains."""
+import math
+import time
+import threading
+import functools
+from inspect import iscoroutinefunction
+import falcon
+
+
+# the method the rejections are recorded with in Metrics
+METRICS_METHOD = "SHED"
+
+# the route of the limit of the whole application in Metrics
+GLOBAL_ROUTE = "<global>"
+
+
+class Limit:
+    """Concurrency and rate limits, shared by the routes it's
+    passed to.
+
+    Parameters
+    ----------
+    concurrency : int
+        How many requests may be processed at once, None for
+        no limit.
+    rate : float
+        How many requests are accepted per second, on average,
+        None for no limit.
+    burst : int
+        How many requests are accepted at once above the rate,
+        the size of the token bucket. Defaults to the rate.
+    queue_timeout : float
+        How long a request may wait for a slot, in seconds,
+        0 to reject it immediately.
+    target : float
+        The acceptable wait for a slot, in seconds. Above it for
+        a whole interval, the waits are cut down to the target.
+        None to always allow queue_timeout.
+    interval : float
+        The window, in seconds, over which the shortest wait is
+        compared to the target.
+    retry_after : int
+        The Retry-After of the 503 responses, in seconds."""
+    __slots__ = [
+        "_concurrency",
+        "_rate",
+        "_burst",
+        "_queue_timeout",
+        "_target",
+        "_interval",
+        "_retry_after",
+        "_lock",
+        "_room",
+        "_in_flight",
+        "_tokens",
+        "_refilled",
+        "_interval_end",
+        "_shortest",
+        "_standing",
+        "_metrics",
+        "admitted",
+        "shed"
+    ]
+
+    def __init__(self, concurrency: int = None, rate: float = None,
+                 burst: int = None, queue_timeout: float = 0.0,
+                 target: float = None, interval: float = 0.1,
+                 retry_after: int = 1):
+        self._concurrency = concurrency
+        self._rate = rate
+        self._burst = burst if burst is not None \
+            else max(1, int(rate or 0))
+        self._queue_timeout = queue_timeout
+        self._target = target
+        self._interval = interval
+        self._retry_after = retry_after
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._tokens = float(self._burst)
+        self._refilled = time.monotonic()
+        self._interval_end = 0.0
+        self._shortest = math.inf
+        self._standing = False
+        self._metrics = None
+        self.admitted = 0
+        self.shed = {}
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Limit(concurrency = {self._concurrency}, " \
+               f"rate = {self._rate}, burst = {self._burst}, " \
+               f"queue_timeout = {self._queue_timeout}, " \
+               f"target = {self._target})>"
+
+    @property
+    def in_flight(self) -> int:
+        """The requests holding a slot."""
+        return self._in_flight
+
+    @property
+    def standing(self) -> bool:
+        """Whether the queue was found standing over the last
+        interval, the waits are then cut down to the target."""
+        return self._standing
+
+    def attach_metrics(self, metrics) -> None:
+        """Counts the rejected requests in the metrics of the
+        application, Milvago attaches them.
+
+        Parameters
+        ----------
+        metrics : Metrics
+            Self-explanatory."""
+        self._metrics = metrics
+
+    def acquire(self, route: str = GLOBAL_ROUTE, wait: bool = True) -> None:
+        """Takes a token and a slot, each taken slot must be given
+        back with release.
+
+        Parameters
+        ----------
+        route : str
+            The route the request has been sent to, for
+            the metrics.
+        wait : bool
+            Whether the calling thread may wait for a slot, never
+            on an event loop.
+
+        Raises
+        ------
+        falcon.HTTPTooManyRequests
+            In case the rate is exceeded.
+        falcon.HTTPServiceUnavailable
+            In case no slot is available in time."""
+        arrived = time.monotonic()
+        with self._lock:
+            reason = self._take_token(arrived)
+            if reason is None and self._concurrency is not None:
+                reason = self._take_slot(arrived, wait)
+                if reason is not None and self._rate is not None:
+                    self._tokens += 1
+            if reason is None:
+                self.admitted += 1
+                return
+            self.shed[reason] = self.shed.get(reason, 0) + 1
+        if self._metrics is not None:
+            self._metrics.count(route, METRICS_METHOD, reason)
+        if reason == "rate":
+            raise falcon.HTTPTooManyRequests(
+                description="Too many requests, try again later",
+                retry_after=max(1, math.ceil(
+                    (1 - self._tokens) / self._rate
+                ))
+            )
+        raise falcon.HTTPServiceUnavailable(
+            description="The server is overloaded, try again later",
+            retry_after=self._retry_after
+        )
+
+    def _take_token(self, now: float) -> str:
+        """Refills the bucket and takes a token from it.
+
+        Returns
+        -------
+        str
+            'rate' if the bucket is empty, None otherwise."""
+        if self._rate is None:
+            return None
+        self._tokens = min(
+            self._burst,
+            self._tokens + (now - self._refilled) * self._rate
+        )
+        self._refilled = now
+        if self._tokens < 1:
+            return "rate"
+        self._tokens -= 1
+        return None
+
+    def _take_slot(self, arrived: float, wait: bool) -> str:
+        """Takes a slot, waiting for one if allowed.
+
+        Returns
+        -------
+        str
+            'concurrency' if there was no slot and no time to wait,
+            'queue' if none was freed in time, None otherwise."""
+        if self._in_flight < self._concurrency:
+            self._in_flight += 1
+            self._observe(0.0, arrived)
+            return None
+        timeout = self._queue_timeout if wait else 0.0
+        if self._standing:
+            timeout = min(timeout, self._target)
+        if timeout <= 0:
+            return "concurrency"
+        deadline = arrived + timeout
+        while self._in_flight >= self._concurrency:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._observe(timeout, time.monotonic())
+                return "queue"
+            self._room.wait(remaining)
+        self._in_flight += 1
+        now = time.monotonic()
+        self._observe(now - arrived, now)
+        return None
+
+    def _observe(self, waited: float, now: float) -> None:
+        """Keeps the shortest wait of the interval and decides,
+        once it's over, whether the queue is standing."""
+        if self._target is None:
+            return
+        if now >= self._interval_end:
+            self._standing = self._target < self._shortest < math.inf
+            self._shortest = waited
+            self._interval_end = now + self._interval
+        elif waited < self._shortest:
+            self._shortest = waited
+
+    def release(self) -> None:
+        """Gives a slot back."""
+        if self._concurrency is None:
+            return
+        with self._lock:
+            self._in_flight -= 1
+            self._room.notify()
+
+    def wrap(self, route: str, invoke):
+        """Applies the limit to a method of a handler.
+
+        Parameters
+        ----------
+        route : str
+            The route of the handler.
+        invoke : callable
+            Callable accepting the RequestContext, or a coroutine
+            function, which never waits for a slot so as not to
+            block the event loop.
+
+        Returns
+        -------
+        callable"""
+        acquire = self.acquire
+        release = self.release
+        if iscoroutinefunction(invoke):
+            @functools.wraps(invoke)
+            async def limited_coroutine(context):
+                acquire(route, wait=False)
+                try:
+                    return await invoke(context)
+                finally:
+                    release()
+
+            return limited_coroutine
+
+        @functools.wraps(invoke)
+        def limited(context):
+            acquire(route)
+            try:
+                return invoke(context)
+            finally:
+                release()
+
+        return limited
+
+
+class LimitMiddleware:
+    """falcon middleware applying a Limit to every request, before
+    it's routed.
+
+    Parameters
+    ----------
+    limit : Limit
+        Self-explanatory.
+    wait : bool
+        Whether the requests may wait for a slot, False when the
+        middleware runs on an event loop."""
+    __slots__ = [
+        "_limit",
+        "_wait"
+    ]
+
+    def __init__(self, limit: Limit, wait: bool = True):
+        self._limit = limit
+        self._wait = wait
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<LimitMiddleware(limit = {self._limit})>"
+
+    def process_request(self, req, resp):
+        """Takes a slot for the request, or rejects it."""
+        self._limit.acquire(GLOBAL_ROUTE, self._wait)
+        req.context.milvago_limited = True
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        """Gives the slot back."""
+        if getattr(req.context, "milvago_limited", False):
+            req.context.milvago_limited = False
+            self._limit.release()
@@ -0,0 +1,695 @@
+"""The module collects per-route metrics: latency histograms, status
+codes, request and response bytes and in-flight requests. Every
+thread records into its own shard, so the request path never takes
+a lock, and the shards are merged when the metrics are scraped. The
+shard of a thread which has ended is folded into the totals of the
+retired threads. With a multiprocess directory, each worker
+periodically writes its metrics to a file and a scrape merges the
+files of all workers, folding those of the workers which have exited
+into a single file."""
+import os
+import json
+import time
+import atexit
+import bisect
+import weakref
+import threading
+import contextlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from milvago.server.handlers import HttpMlv, HttpStaticDir
+from milvago.server.tasks import METRICS_METHOD as TASK_METHOD
+from milvago.server.limits import METRICS_METHOD as SHED_METHOD
+from milvago.server.deadlines import METRICS_METHOD as TIMEOUT_METHOD
+
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# the file of the multiprocess directory the workers which have
+# exited are folded into
+RETIRED_FILE = "retired.json"
+
+# the file the scrapes lock the multiprocess directory with
+LOCK_FILE = ".lock"
+
+# the live registries, registered once for the exit and fork
+# callbacks so these don't keep them alive
+_REGISTRIES = weakref.WeakSet()
+
+
+class RouteStats:
+    """The metrics of a single route and method, within a shard.
+
+    Parameters
+    ----------
+    bounds : tuple
+        The upper bounds of the histogram buckets, +Inf excluded."""
+    __slots__ = [
+        "bounds",
+        "buckets",
+        "total",
+        "count",
+        "statuses",
+        "request_bytes",
+        "response_bytes",
+        "in_flight"
+    ]
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.statuses = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.in_flight = 0
+
+    def observe(self, status: str, seconds: float, request_bytes: int,
+                response_bytes: int) -> None:
+        """Records a finished request, see Metrics.finished."""
+        self.buckets[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        statuses = self.statuses
+        statuses[status] = statuses.get(status, 0) + 1
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+
+    def as_dict(self) -> dict:
+        """Plain representation, for the multiprocess files.
+
+        Returns
+        -------
+        dict"""
+        return {
+            "buckets": list(self.buckets),
+            "sum": self.total,
+            "count": self.count,
+            "statuses": dict(self.statuses),
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "in_flight": self.in_flight,
+        }
+
+    def add(self, other) -> None:
+        """Adds the metrics of the same route in another shard."""
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+        self.total += other.total
+        self.count += other.count
+        statuses = self.statuses
+        for status, count in other.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+        self.request_bytes += other.request_bytes
+        self.response_bytes += other.response_bytes
+        self.in_flight += other.in_flight
+
+
+def _merge(target: dict, key: str, stats: dict) -> None:
+    """Adds the plain representation of RouteStats to another."""
+    merged = target.get(key)
+    if merged is None:
+        target[key] = {
+            "buckets": list(stats["buckets"]),
+            "sum": stats["sum"],
+            "count": stats["count"],
+            "statuses": dict(stats["statuses"]),
+            "request_bytes": stats["request_bytes"],
+            "response_bytes": stats["response_bytes"],
+            "in_flight": stats["in_flight"],
+        }
+        return
+    merged["buckets"] = [a + b for a, b in
+                         zip(merged["buckets"], stats["buckets"])]
+    for name in ("sum", "count", "request_bytes",
+                 "response_bytes", "in_flight"):
+        merged[name] += stats[name]
+    for status, count in stats["statuses"].items():
+        merged["statuses"][status] = merged["statuses"].get(status, 0) + count
+
+
+class _ShardHolder:
+    """Holds the shard of a thread in its thread local storage,
+    which drops it once the thread ends."""
+    __slots__ = [
+        "shard",
+        "__weakref__"
+    ]
+
+    def __init__(self, shard: dict):
+        self.shard = shard
+
+
+def _retire(metrics_ref, shard: dict) -> None:
+    """Called once the thread of a shard has ended."""
+    metrics = metrics_ref()
+    if metrics is not None:
+        metrics._retire(shard)
+
+
+def _escape(value: str) -> str:
+    """Escapes a Prometheus label value."""
+    return value.replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+class Metrics:
+    """Registry of the metrics of an application.
+
+    Parameters
+    ----------
+    buckets : tuple
+        The upper bounds of the latency histogram, in seconds.
+    multiprocess_dir : str
+        Directory shared by all the workers of the application,
+        i.e. a tmpfs. Every worker writes its metrics there and
+        a scrape aggregates them. None for a single process.
+    flush_interval : float
+        How often, in seconds, a worker writes its file."""
+    __slots__ = [
+        "_buckets",
+        "_local",
+        "_shards",
+        "_retired",
+        "_lock",
+        "_multiprocess_dir",
+        "_flush_interval",
+        "_flusher_pid",
+        "__weakref__"
+    ]
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS,
+                 multiprocess_dir: str = None, flush_interval: float = 1.0):
+        self._buckets = tuple(sorted(buckets))
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.RLock()
+        self._multiprocess_dir = multiprocess_dir
+        self._flush_interval = flush_interval
+        self._flusher_pid = None
+        if multiprocess_dir is not None:
+            os.makedirs(multiprocess_dir, exist_ok=True)
+        _REGISTRIES.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Metrics(buckets = {self._buckets}, " \
+               f"multiprocess_dir = {self._multiprocess_dir})>"
+
+    @property
+    def buckets(self) -> tuple:
+        """The upper bounds of the latency histogram."""
+        return self._buckets
+
+    def _reset(self) -> None:
+        """Drops the metrics inherited from the parent process,
+        they are reported by the parent itself."""
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.RLock()
+        self._flusher_pid = None
+
+    def stats(self, route: str, method: str) -> RouteStats:
+        """The RouteStats of a route in the shard of the current
+        thread, only that thread may update them.
+
+        Returns
+        -------
+        RouteStats"""
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = self._local.holder = _ShardHolder({})
+            finalizer = weakref.finalize(
+                holder, _retire, weakref.ref(self), holder.shard
+            )
+            finalizer.atexit = False
+            with self._lock:
+                self._shards.append(holder.shard)
+            if self._multiprocess_dir is not None \
+                    and self._flusher_pid != os.getpid():
+                self._start_flusher()
+        shard = holder.shard
+        stats = shard.get((route, method))
+        if stats is None:
+            stats = shard[(route, method)] = RouteStats(self._buckets)
+        return stats
+
+    def _retire(self, shard: dict) -> None:
+        """Folds the shard of a thread which has ended into the
+        totals of the retired threads."""
+        with self._lock:
+            try:
+                self._shards.remove(shard)
+            except ValueError:
+                # inherited from the parent process
+                return
+            retired = self._retired
+            for key, stats in shard.items():
+                if key not in retired:
+                    retired[key] = RouteStats(self._buckets)
+                retired[key].add(stats)
+
+    def started(self, route: str, method: str) -> RouteStats:
+        """Counts a request in flight.
+
+        Returns
+        -------
+        RouteStats
+            Where the request is recorded once finished."""
+        stats = self.stats(route, method)
+        stats.in_flight += 1
+        return stats
+
+    def finished(self, route: str, method: str, status: str,
+                 seconds: float, request_bytes: int = 0,
+                 response_bytes: int = 0, in_flight: bool = True) -> None:
+        """Records a finished request.
+
+        Parameters
+        ----------
+        route : str
+            The route of the handler.
+        method : str
+            The HTTP method.
+        status : str
+            The response code, i.e. '200'.
+        seconds : float
+            How long it took to respond.
+        request_bytes : int
+            The size of the request body.
+        response_bytes : int
+            The size of the response body, when known.
+        in_flight : bool
+            Whether the request has been counted by started."""
+        stats = self.stats(route, method)
+        stats.observe(status, seconds, request_bytes, response_bytes)
+        if in_flight:
+            stats.in_flight -= 1
+
+    def count(self, route: str, method: str, status: str) -> None:
+        """Counts an outcome which has no latency, i.e. a
+        dropped task."""
+        statuses = self.stats(route, method).statuses
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def snapshot(self) -> dict:
+        """Merges the shards of all threads of the process.
+
+        Returns
+        -------
+        dict
+            Plain metrics keyed by "<method> <route>"."""
+        merged = {}
+        with self._lock:
+            shards = list(self._shards)
+            for (route, method), stats in self._retired.items():
+                _merge(merged, f"{method} {route}", stats.as_dict())
+        for shard in shards:
+            for (route, method), stats in list(shard.items()):
+                _merge(merged, f"{method} {route}", stats.as_dict())
+        return merged
+
+    def collect(self) -> dict:
+        """The metrics of the process, or of all the workers in
+        multiprocess mode. In-flight requests are only counted
+        for workers which are still alive.
+
+        Returns
+        -------
+        dict"""
+        if self._multiprocess_dir is None:
+            return self.snapshot()
+        self.flush()
+        merged = {}
+        exited = {}
+        with self._directory_lock():
+            for name in os.listdir(self._multiprocess_dir):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self._multiprocess_dir, name)
+                data = _load(path)
+                if data is None:
+                    continue
+                alive = name == RETIRED_FILE or _alive(data["pid"])
+                for key, stats in data["routes"].items():
+                    if not alive:
+                        stats["in_flight"] = 0
+                    _merge(merged, key, stats)
+                if not alive:
+                    exited[path] = data["routes"]
+            if exited:
+                self._retire_files(exited)
+        return merged
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        """Serializes the scrapes of the workers, which fold the
+        files of the exited ones."""
+        if fcntl is None:
+            yield
+            return
+        path = os.path.join(self._multiprocess_dir, LOCK_FILE)
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _retire_files(self, exited: dict) -> None:
+        """Folds the files of the workers which have exited into
+        RETIRED_FILE and removes them, so recycled workers don't
+        leave a file behind each.
+
+        Parameters
+        ----------
+        exited : dict
+            The routes of the files, by path."""
+        path = os.path.join(self._multiprocess_dir, RETIRED_FILE)
+        data = _load(path) or {"pid": None, "routes": {}}
+        routes = data["routes"]
+        for stats in exited.values():
+            for key, route_stats in stats.items():
+                _merge(routes, key, route_stats)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(data, f)
+        os.replace(temporary, path)
+        for exited_path in exited:
+            try:
+                os.remove(exited_path)
+            except FileNotFoundError:
+                pass
+
+    def flush(self) -> None:
+        """Writes the metrics of the process to its file in the
+        multiprocess directory."""
+        if self._multiprocess_dir is None:
+            return
+        path = os.path.join(self._multiprocess_dir, f"{os.getpid()}.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"pid": os.getpid(), "routes": self.snapshot()}, f)
+        os.replace(temporary, path)
+
+    def _start_flusher(self) -> None:
+        """Starts the thread writing the file of this worker."""
+        self._flusher_pid = os.getpid()
+        thread = threading.Thread(
+            target=self._flush_forever,
+            name="milvago-metrics",
+            daemon=True
+        )
+        thread.start()
+
+    def _flush_forever(self) -> None:
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self._flush_interval)
+            self._flush_quietly()
+
+    def _flush_quietly(self) -> None:
+        """Flushes in the background, where the directory may
+        already be gone."""
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text format. The tasks
+        deferred by the handlers, the requests rejected by the
+        limits and the ones which expired are reported apart from
+        the requests.
+
+        Returns
+        -------
+        str"""
+        metrics = self.collect()
+        bounds = [repr(float(bound)) for bound in self._buckets] + ["+Inf"]
+        histogram = [
+            "# HELP milvago_request_duration_seconds Time to respond.",
+            "# TYPE milvago_request_duration_seconds histogram",
+        ]
+        responses = [
+            "# HELP milvago_responses_total Responses by status code.",
+            "# TYPE milvago_responses_total counter",
+        ]
+        request_bytes = [
+            "# HELP milvago_request_bytes_total Size of the request bodies.",
+            "# TYPE milvago_request_bytes_total counter",
+        ]
+        response_bytes = [
+            "# HELP milvago_response_bytes_total Size of the response bodies.",
+            "# TYPE milvago_response_bytes_total counter",
+        ]
+        in_flight = [
+            "# HELP milvago_requests_in_flight Requests being processed.",
+            "# TYPE milvago_requests_in_flight gauge",
+        ]
+        task_histogram = [
+            "# HELP milvago_task_duration_seconds Time from deferring a "
+            "task to its end.",
+            "# TYPE milvago_task_duration_seconds histogram",
+        ]
+        tasks = [
+            "# HELP milvago_tasks_total Deferred tasks by outcome.",
+            "# TYPE milvago_tasks_total counter",
+        ]
+        tasks_pending = [
+            "# HELP milvago_tasks_pending Tasks waiting or running.",
+            "# TYPE milvago_tasks_pending gauge",
+        ]
+        timeouts = [
+            "# HELP milvago_request_timeouts_total Requests answered "
+            "with a 504 at their deadline.",
+            "# TYPE milvago_request_timeouts_total counter",
+        ]
+        shed = [
+            "# HELP milvago_requests_shed_total Requests rejected by "
+            "a limit, by reason.",
+            "# TYPE milvago_requests_shed_total counter",
+        ]
+        for key in sorted(metrics):
+            stats = metrics[key]
+            method, _, route = key.partition(" ")
+            if method == SHED_METHOD:
+                for reason in sorted(stats["statuses"]):
+                    shed.append(
+                        f'milvago_requests_shed_total{{route="'
+                        f'{_escape(route)}",reason="{reason}"}} '
+                        f"{stats['statuses'][reason]}"
+                    )
+                continue
+            if method == TIMEOUT_METHOD:
+                timeouts.append(
+                    f'milvago_request_timeouts_total{{route="'
+                    f'{_escape(route)}"}} {stats["statuses"]["expired"]}'
+                )
+                continue
+            if method == TASK_METHOD:
+                labels = f'task="{_escape(route)}"'
+                _histogram(task_histogram, "milvago_task_duration_seconds",
+                           labels, bounds, stats)
+                for status in sorted(stats["statuses"]):
+                    tasks.append(
+                        f'milvago_tasks_total{{{labels},status="{status}"}} '
+                        f"{stats['statuses'][status]}"
+                    )
+                tasks_pending.append(
+                    f"milvago_tasks_pending{{{labels}}} {stats['in_flight']}"
+                )
+                continue
+            labels = f'route="{_escape(route)}",method="{method}"'
+            _histogram(histogram, "milvago_request_duration_seconds",
+                       labels, bounds, stats)
+            for status in sorted(stats["statuses"]):
+                responses.append(
+                    f'milvago_responses_total{{{labels},status="{status}"}} '
+                    f"{stats['statuses'][status]}"
+                )
+            request_bytes.append(
+                f"milvago_request_bytes_total{{{labels}}} "
+                f"{stats['request_bytes']}"
+            )
+            response_bytes.append(
+                f"milvago_response_bytes_total{{{labels}}} "
+                f"{stats['response_bytes']}"
+            )
+            in_flight.append(
+                f"milvago_requests_in_flight{{{labels}}} "
+                f"{stats['in_flight']}"
+            )
+        return "\n".join(
+            histogram + responses + request_bytes + response_bytes
+            + in_flight + task_histogram + tasks + tasks_pending + timeouts + shed
+        ) + "\n"
+
+
+def _flush_registries() -> None:
+    """Writes the files of the multiprocess registries when the
+    process exits."""
+    for metrics in list(_REGISTRIES):
+        metrics._flush_quietly()
+
+
+def _reset_registries() -> None:
+    """Drops the metrics inherited by a forked child."""
+    for metrics in list(_REGISTRIES):
+        metrics._reset()
+
+
+atexit.register(_flush_registries)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_registries)
+
+
+def _histogram(lines: list, name: str, labels: str, bounds: list,
+               stats: dict) -> None:
+    """Appends the samples of a histogram to lines."""
+    cumulative = 0
+    for bound, count in zip(bounds, stats["buckets"]):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {stats['sum']}")
+    lines.append(f"{name}_count{{{labels}}} {stats['count']}")
+
+
+def _load(path: str) -> dict:
+    """The contents of a file of the multiprocess directory, None
+    if it's gone or incomplete."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process is still running."""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _route_of(req, resource) -> str:
+    """The route label of a request."""
+    if isinstance(resource, (HttpMlv, HttpStaticDir)):
+        return resource.uri
+    if req.uri_template is not None:
+        return req.uri_template
+    return "<unmatched>"
+
+
+def _response_size(resp) -> int:
+    """The size of the response body, 0 for streams of
+    unknown length."""
+    body = resp.body
+    if body is not None:
+        if isinstance(body, str) and not body.isascii():
+            return len(body.encode("utf-8"))
+        return len(body)
+    if resp.data is not None:
+        return len(resp.data)
+    length = resp.content_length
+    return int(length) if length is not None else 0
+
+
+class MetricsMiddleware:
+    """falcon middleware timing every request.
+
+    Parameters
+    ----------
+    metrics : Metrics
+        Where the measurements are recorded."""
+    __slots__ = ["_metrics"]
+
+    def __init__(self, metrics: Metrics):
+        self._metrics = metrics
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<MetricsMiddleware(metrics = {self._metrics})>"
+
+    def process_request(self, req, resp):
+        """Starts the clock."""
+        req.context.milvago_started = time.perf_counter()
+
+    def process_resource(self, req, resp, resource, params):
+        """Counts the request in flight, once it has been routed."""
+        req.context.milvago_stats = self._metrics.started(
+            _route_of(req, resource),
+            req.method
+        )
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        """Records the latency, status and sizes of the response.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+        resource : object
+            The resource the request has been routed to.
+        req_succeeded : bool
+            Whether the request has been processed without errors."""
+        started = getattr(req.context, "milvago_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        stats = getattr(req.context, "milvago_stats", None)
+        if stats is None:
+            stats = self._metrics.stats(_route_of(req, resource), req.method)
+        else:
+            stats.in_flight -= 1
+        stats.observe(
+            resp.status[:3],
+            seconds,
+            req.content_length or 0,
+            _response_size(resp)
+        )
+
+
+class MetricsHandler(HttpMlv):
+    """Exposes the metrics in the Prometheus text format.
+
+    Parameters
+    ----------
+    route : str
+        Where the handler is mounted.
+    metrics : Metrics
+        The registry to expose."""
+    __slots__ = ["_metrics"]
+
+    def __init__(self, route: str, metrics: Metrics):
+        HttpMlv.__init__(self, route)
+        self._metrics = metrics
+
+    def get(self, web):
+        web.set_custom_content_type(CONTENT_TYPE)
+        return self._metrics.render().encode("utf-8")
@@ -0,0 +1,388 @@
+"""The module contains PreforkServer, the production server behind
+Milvago(..., workers=N). The master process creates the application,
+binds the socket once and forks the workers, which inherit both and
+serve WSGI through the standard library. The master restarts the
+workers which exit, replaces all of them upon SIGHUP and stops them
+gracefully upon SIGTERM or SIGINT."""
+import os
+import gc
+import time
+import random
+import select
+import signal
+import socket
+import logging
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+
+LOGGER = logging.getLogger('Milvago')
+
+# blocked around fork, until the worker has installed its handlers
+_WORKER_SIGNALS = {signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                   signal.SIGCHLD}
+
+
+class _RequestHandler(WSGIRequestHandler):
+    """Logs the requests through the Milvago logger, not stderr."""
+
+    def log_message(self, format, *args):
+        LOGGER.debug("%s - %s", self.address_string(), format % args)
+
+
+class _WorkerServer(WSGIServer):
+    """WSGIServer accepting connections on the socket of the master.
+
+    Parameters
+    ----------
+    listener : socket.socket
+        The bound, listening and non-blocking socket.
+    app : callable
+        The WSGI application."""
+
+    def __init__(self, listener: socket.socket, app):
+        address = listener.getsockname()[:2]
+        WSGIServer.__init__(self, address, _RequestHandler,
+                            bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.server_name, self.server_port = address
+        self.setup_environ()
+        self.set_app(app)
+        self.handled = 0
+
+    def get_request(self):
+        # the losers of the race for a connection get BlockingIOError,
+        # which socketserver ignores
+        request, client_address = self.socket.accept()
+        request.setblocking(True)
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        self.handled += 1
+        WSGIServer.process_request(self, request, client_address)
+
+    def handle_error(self, request, client_address):
+        LOGGER.exception(f"Error while serving {client_address}")
+
+
+class PreforkServer:
+    """Serves a WSGI application with a pool of forked workers,
+    each of them processing one request at a time.
+
+    Parameters
+    ----------
+    app : callable
+        The WSGI application, created before forking so the
+        workers share its memory.
+    host : str
+        Self-explanatory.
+    port : int
+        Self-explanatory again.
+    workers : int
+        The number of worker processes.
+    max_requests : int
+        Replace a worker after it has served this many requests,
+        0 to never replace them.
+    max_requests_jitter : int
+        Up to this many requests are added to max_requests, so the
+        workers aren't all replaced at once.
+    backlog : int
+        The size of the queue of pending connections.
+    graceful_timeout : float
+        How long, in seconds, the workers are given to finish
+        their requests before being killed.
+    on_start : list
+        Callables every worker runs before serving requests, a
+        worker failing to start is restarted.
+    on_exit : list
+        Callables every worker runs before exiting, i.e. draining
+        its TaskQueue. The workers leave through os._exit, which
+        skips the atexit handlers."""
+    __slots__ = [
+        "_app",
+        "_host",
+        "_port",
+        "_workers",
+        "_max_requests",
+        "_max_requests_jitter",
+        "_backlog",
+        "_graceful_timeout",
+        "_on_start",
+        "_on_exit",
+        "_socket",
+        "_children",
+        "_retiring",
+        "_signals",
+        "_wakeup",
+        "_respawn_after",
+        "_running"
+    ]
+
+    def __init__(self, app, host: str = '0.0.0.0', port: int = 8000,
+                 workers: int = 2, max_requests: int = 0,
+                 max_requests_jitter: int = 0, backlog: int = 2048,
+                 graceful_timeout: float = 30.0, on_start: list = None,
+                 on_exit: list = None):
+        self._app = app
+        self._host = host
+        self._port = port
+        self._workers = workers
+        self._max_requests = max_requests
+        self._max_requests_jitter = max_requests_jitter
+        self._backlog = backlog
+        self._graceful_timeout = graceful_timeout
+        self._on_start = list(on_start or [])
+        self._on_exit = list(on_exit or [])
+        self._socket = None
+        self._children = {}
+        self._retiring = set()
+        self._signals = []
+        self._wakeup = None
+        self._respawn_after = 0.0
+        self._running = False
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<PreforkServer(host = {self._host}, port = {self._port}, " \
+               f"workers = {self._workers}, " \
+               f"max_requests = {self._max_requests})>"
+
+    @property
+    def children(self) -> list:
+        """The pids of the running workers."""
+        return list(self._children)
+
+    def bind(self) -> socket.socket:
+        """Creates the listening socket shared by the workers.
+        SO_REUSEPORT lets a new server bind the port while the
+        previous one is still draining its connections.
+
+        Returns
+        -------
+        socket.socket"""
+        if self._socket is None:
+            family = socket.AF_INET6 if ":" in self._host \
+                else socket.AF_INET
+            listener = socket.socket(family, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, "SO_REUSEPORT"):
+                listener.setsockopt(
+                    socket.SOL_SOCKET, socket.SO_REUSEPORT, 1
+                )
+            listener.bind((self._host, self._port))
+            listener.listen(self._backlog)
+            listener.setblocking(False)
+            self._socket = listener
+        return self._socket
+
+    def run(self) -> None:
+        """Binds the socket, starts the workers and supervises them
+        until SIGTERM or SIGINT."""
+        listener = self.bind()
+        LOGGER.info(
+            f"Listening on {listener.getsockname()[:2]} with "
+            f"{self._workers} workers, master {os.getpid()}"
+        )
+        self._wakeup = os.pipe()
+        for descriptor in self._wakeup:
+            os.set_blocking(descriptor, False)
+        previous = {
+            number: signal.signal(number, self._queue_signal)
+            for number in (signal.SIGHUP, signal.SIGTERM,
+                           signal.SIGINT, signal.SIGCHLD)
+        }
+        previous_wakeup = signal.set_wakeup_fd(self._wakeup[1])
+        self._running = True
+        try:
+            while self._running:
+                self._handle_signals()
+                self._reap()
+                if self._running:
+                    self._maintain()
+                    self._sleep()
+        finally:
+            self._stop()
+            signal.set_wakeup_fd(previous_wakeup)
+            for number, handler in previous.items():
+                signal.signal(number, handler)
+            for descriptor in self._wakeup:
+                os.close(descriptor)
+            listener.close()
+            self._socket = None
+
+    def _queue_signal(self, number, frame) -> None:
+        self._signals.append(number)
+
+    def _sleep(self) -> None:
+        """Waits for a signal, at most a second."""
+        try:
+            select.select([self._wakeup[0]], [], [], 1.0)
+        except InterruptedError:
+            pass
+        try:
+            while os.read(self._wakeup[0], 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _stopping(self) -> bool:
+        """Whether the master is stopping or has been told to."""
+        return not self._running or any(
+            number in (signal.SIGTERM, signal.SIGINT)
+            for number in self._signals
+        )
+
+    def _handle_signals(self) -> None:
+        while self._signals:
+            number = self._signals.pop(0)
+            if number in (signal.SIGTERM, signal.SIGINT):
+                LOGGER.info("Shutting down")
+                self._running = False
+            elif number == signal.SIGHUP:
+                LOGGER.info("Replacing the workers")
+                self._reload()
+
+    def _reload(self) -> None:
+        """Starts a new set of workers, then stops the old ones
+        gracefully."""
+        old = set(self._children) - self._retiring
+        self._retiring |= old
+        self._maintain()
+        for pid in old:
+            _kill(pid, signal.SIGTERM)
+
+    def _reap(self) -> None:
+        """Collects the workers which have exited."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self._children.pop(pid, None)
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if started is None or not self._running:
+                continue
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) \
+                else -os.WTERMSIG(status)
+            if code == 0:
+                LOGGER.info(f"Worker {pid} has been recycled")
+                continue
+            LOGGER.warning(f"Worker {pid} exited with {code}, restarting")
+            if time.monotonic() - started < 1.0:
+                # it crashes on startup, don't fork in a tight loop
+                self._respawn_after = time.monotonic() + 1.0
+
+    def _maintain(self) -> None:
+        """Forks the missing workers."""
+        if time.monotonic() < self._respawn_after:
+            return
+        while len(self._children) - len(self._retiring) < self._workers \
+                and not self._stopping():
+            self._spawn()
+
+    def _spawn(self) -> None:
+        """Forks a worker. The objects created so far are moved out of
+        the reach of the garbage collector, which would otherwise
+        touch, and so copy, the memory pages shared with the master.
+        The signals are blocked until the worker has replaced the
+        handlers of the master, a SIGTERM arriving in between would
+        otherwise be queued for a loop the worker doesn't run."""
+        gc.collect()
+        gc.freeze()
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, _WORKER_SIGNALS)
+        try:
+            pid = os.fork()
+        except BaseException:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            raise
+        if pid:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+            self._children[pid] = time.monotonic()
+            return
+        code = 0
+        try:
+            self._serve(mask)
+        except BaseException:
+            LOGGER.exception(f"Worker {os.getpid()} failed")
+            code = 1
+        finally:
+            os._exit(self._exit_hooks(code))
+
+    def _exit_hooks(self, code: int) -> int:
+        """Runs the on_exit callables of a worker.
+
+        Returns
+        -------
+        int
+            The exit code of the worker."""
+        for hook in self._on_exit:
+            try:
+                hook()
+            except BaseException:
+                LOGGER.exception(f"Worker {os.getpid()} failed to exit")
+                code = code or 1
+        return code
+
+    def _serve(self, mask) -> None:
+        """The loop of a worker, until SIGTERM or max_requests.
+
+        Parameters
+        ----------
+        mask : set
+            The signal mask of the master before the fork, restored
+            once the handlers of the worker are installed."""
+        stopping = []
+        self._signals = []
+        signal.set_wakeup_fd(-1)
+        for descriptor in self._wakeup:
+            os.close(descriptor)
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+        for hook in self._on_start:
+            hook()
+        server = _WorkerServer(self._socket, self._app)
+        server.timeout = 0.5
+        limit = self._max_requests
+        if limit and self._max_requests_jitter:
+            limit += random.randint(0, self._max_requests_jitter)
+        while not stopping and not (limit and server.handled >= limit):
+            server.handle_request()
+
+    def _stop(self) -> None:
+        """Stops the workers, killing those which don't finish
+        within graceful_timeout."""
+        self._running = False
+        for pid in self._children:
+            _kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self._graceful_timeout
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in self._children:
+            _kill(pid, signal.SIGKILL)
+        while self._children:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self._children.pop(pid, None)
+        self._retiring.clear()
+
+
+def _kill(pid: int, number: int) -> None:
+    """Sends a signal to a worker which may have exited already."""
+    try:
+        os.kill(pid, number)
+    except ProcessLookupError:
+        pass
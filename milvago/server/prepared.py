@@ -0,0 +1,157 @@
+"""The module contains PreparedResponse, a response encoded ahead of
+time which is written onto falcon.Response without any conversion,
+for constant endpoints and cached bodies, and NegotiatedResponse,
+one of them per media type when the body depends on Accept."""
+import falcon
+from milvago.server.context import CONTENT_TYPES
+from milvago.server.conditional import make_etag, send_bytes
+
+
+class PreparedResponse:
+    """An encoded body together with its status and headers.
+    Handlers can return it, it's served through resp.data as it is.
+
+    Parameters
+    ----------
+    body : bytes
+        The body, str is encoded to UTF-8 once.
+    content_type : str
+        Value of the Content-Type header, or one of the short
+        names accepted by set_content_type, i.e. 'json'.
+    status : int
+        The response code, or a falcon status line.
+    headers : dict
+        All the other headers.
+    etag : bool
+        Compute a strong ETag once and answer matching
+        If-None-Match requests with 304."""
+    __slots__ = [
+        "body",
+        "content_type",
+        "status",
+        "headers",
+        "etag"
+    ]
+
+    def __init__(self, body, content_type: str = None, status=200,
+                 headers: dict = None, etag: bool = False):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.body = body
+        self.content_type = CONTENT_TYPES.get(content_type, content_type)
+        self.status = status if isinstance(status, str) \
+            else getattr(falcon, f"HTTP_{status}")
+        self.headers = headers or {}
+        self.etag = make_etag(body) if etag is True else etag or None
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<{self.__class__.__name__}(status = {self.status}, " \
+               f"length = {len(self.body)}, etag = {self.etag})>"
+
+    @classmethod
+    def from_response(cls, resp, etag: bool = False):
+        """Captures the outcome of a handler.
+
+        Parameters
+        ----------
+        resp : falcon.Response
+            falcon.Response instance, after the handler ran.
+        etag : bool
+            Compute a strong ETag, otherwise the one set by the
+            handler, if any, is kept.
+
+        Returns
+        -------
+        PreparedResponse
+
+        Raises
+        ------
+        ValueError
+            In case the response is streamed."""
+        if resp.stream is not None:
+            raise ValueError("A streamed response cannot be prepared")
+        headers = resp.headers
+        content_type = headers.pop("content-type", None)
+        headers.pop("content-length", None)
+        own = headers.pop("etag", None)
+        if own is not None and not etag:
+            if own.startswith("W/"):
+                headers["etag"] = own
+            else:
+                etag = own.strip('"')
+        body = resp.body
+        if body is None:
+            body = resp.data or b""
+        return cls(bytes(body) if not isinstance(body, str) else body,
+                   content_type, resp.status, headers, etag)
+
+    def apply(self, req, resp) -> None:
+        """Writes the response, answering with 304 if the client
+        already has it and with 206 to a Range when it has an ETag.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance."""
+        if self.headers:
+            resp.set_headers(self.headers)
+        resp.status = self.status
+        if self.content_type is not None:
+            resp.content_type = self.content_type
+        if self.etag is None:
+            resp.body = None
+            resp.data = self.body
+        else:
+            send_bytes(req, resp, self.body, self.etag)
+
+
+class NegotiatedResponse:
+    """The PreparedResponses of a constant endpoint whose body is
+    negotiated with the Accept header, by media type.
+
+    Parameters
+    ----------
+    serializers : Serializers
+        The serializers which negotiated the bodies.
+    variants : dict
+        PreparedResponse instances by media type."""
+    __slots__ = [
+        "_serializers",
+        "variants"
+    ]
+
+    def __init__(self, serializers, variants: dict):
+        self._serializers = serializers
+        self.variants = variants
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<NegotiatedResponse(variants = {list(self.variants)})>"
+
+    def apply(self, req, resp) -> None:
+        """Writes the variant the request accepts.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+
+        Raises
+        ------
+        falcon.HTTPNotAcceptable
+            In case the client accepts none of the media types."""
+        serializer = self._serializers.negotiate(req, resp)
+        self.variants[serializer.media_type].apply(req, resp)
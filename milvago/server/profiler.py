@@ -0,0 +1,292 @@
+"""The module contains a sampling profiler for production. A fraction
+of the requests to the selected routes is sampled: while the handler
+runs, a background thread periodically records its stack. The stacks
+are aggregated per route and dumped in the collapsed format read by
+flamegraph.pl, speedscope, inferno, etc."""
+import os
+import sys
+import time
+import hmac
+import random
+import signal
+import weakref
+import threading
+from collections import Counter
+import falcon
+from milvago.server.handlers import HttpMlv
+
+
+# the live profilers, registered once for the fork callback so it
+# doesn't keep them alive
+_PROFILERS = weakref.WeakSet()
+
+
+class Profiler:
+    """Samples the stacks of the handlers of selected routes.
+
+    Parameters
+    ----------
+    rate : float
+        The fraction of the requests which are sampled, 0-1.
+    routes : list
+        The routes to profile, None for all of them.
+    interval : float
+        How often, in seconds, the stack of a sampled request
+        is recorded.
+    token : str
+        Secret expected in the Authorization header, as
+        'Bearer <token>', by the admin endpoint. Without a token
+        the endpoint isn't mounted.
+    signal_number : int
+        Dump the stacks to dump_dir upon this signal, i.e.
+        signal.SIGUSR2. None to not install a signal handler.
+    dump_dir : str
+        Where the dumps triggered by the signal are written."""
+    __slots__ = [
+        "_rate",
+        "_routes",
+        "_interval",
+        "_token",
+        "_signal_number",
+        "_dump_dir",
+        "_active",
+        "_stacks",
+        "_lock",
+        "_wake",
+        "_sampler_pid",
+        "samples",
+        "__weakref__"
+    ]
+
+    def __init__(self, rate: float = 0.01, routes: list = None,
+                 interval: float = 0.005, token: str = None,
+                 signal_number: int = None, dump_dir: str = "."):
+        self._rate = rate
+        self._routes = frozenset(routes) if routes is not None else None
+        self._interval = interval
+        self._token = token
+        self._signal_number = signal_number
+        self._dump_dir = dump_dir
+        self._active = {}
+        self._stacks = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._sampler_pid = None
+        self.samples = 0
+        _PROFILERS.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Profiler(rate = {self._rate}, routes = {self._routes}, " \
+               f"interval = {self._interval}, samples = {self.samples})>"
+
+    @property
+    def token(self):
+        """The secret of the admin endpoint."""
+        return self._token
+
+    def selects(self, route: str) -> bool:
+        """Whether the requests to a route are profiled."""
+        return self._routes is None or route in self._routes
+
+    def wrap(self, route: str, invoke):
+        """Wraps the invocation of a synchronous handler, so a
+        fraction of its calls are sampled. Routes which aren't
+        selected are returned unchanged.
+
+        Parameters
+        ----------
+        route : str
+            The route of the handler.
+        invoke : callable
+            Callable accepting the RequestContext.
+
+        Returns
+        -------
+        callable"""
+        if not self.selects(route) or self._rate <= 0:
+            return invoke
+        rate = self._rate
+        active = self._active
+        sample = random.random
+
+        def profiled(context):
+            if sample() >= rate:
+                return invoke(context)
+            self._start_sampler()
+            ident = threading.get_ident()
+            active[ident] = (route, sys._getframe())
+            self._wake.set()
+            try:
+                return invoke(context)
+            finally:
+                del active[ident]
+
+        return profiled
+
+    def _reset_after_fork(self) -> None:
+        """The sampler thread doesn't survive fork, neither do the
+        requests being sampled by the parent."""
+        self._active.clear()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._sampler_pid = None
+
+    def _start_sampler(self) -> None:
+        """Starts the sampler thread of the process."""
+        if self._sampler_pid != os.getpid():
+            with self._lock:
+                if self._sampler_pid != os.getpid():
+                    self._sampler_pid = os.getpid()
+                    threading.Thread(
+                        target=self._sample_forever,
+                        name="milvago-profiler",
+                        daemon=True
+                    ).start()
+
+    def _sample_forever(self) -> None:
+        pid = os.getpid()
+        while self._sampler_pid == pid:
+            if not self._active:
+                self._wake.clear()
+                if not self._active:
+                    self._wake.wait()
+                continue
+            self.sample()
+            time.sleep(self._interval)
+
+    def sample(self) -> None:
+        """Records the stacks of the requests being sampled,
+        from the handler up."""
+        frames = sys._current_frames()
+        recorded = []
+        for ident, (route, root) in list(self._active.items()):
+            frame = frames.get(ident)
+            names = []
+            while frame is not None and frame is not root:
+                code = frame.f_code
+                names.append(
+                    f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            if frame is root and names:
+                recorded.append((route, ";".join(reversed(names))))
+        with self._lock:
+            for route, stack in recorded:
+                stacks = self._stacks.get(route)
+                if stacks is None:
+                    stacks = self._stacks[route] = Counter()
+                stacks[stack] += 1
+                self.samples += 1
+
+    def collapsed(self, route: str = None) -> str:
+        """The aggregated stacks in the collapsed format, one
+        'frame;frame;frame count' line per distinct stack. The
+        route is the root frame of every stack.
+
+        Parameters
+        ----------
+        route : str
+            Only the stacks of a single route.
+
+        Returns
+        -------
+        str"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._stacks):
+                if route is not None and name != route:
+                    continue
+                for stack, count in self._stacks[name].most_common():
+                    lines.append(f"{name};{stack} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def reset(self) -> None:
+        """Drops the recorded stacks."""
+        with self._lock:
+            self._stacks = {}
+            self.samples = 0
+
+    def dump(self, path: str = None) -> str:
+        """Writes the collapsed stacks to a file.
+
+        Parameters
+        ----------
+        path : str
+            Where, by default milvago-<pid>-<timestamp>.folded
+            in dump_dir.
+
+        Returns
+        -------
+        str
+            The path of the file."""
+        if path is None:
+            path = os.path.join(
+                self._dump_dir,
+                f"milvago-{os.getpid()}-{int(time.time())}.folded"
+            )
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+        return path
+
+    def install_signal(self) -> None:
+        """Dumps the stacks upon signal_number. Must be called from
+        the main thread, Milvago does it when the application is
+        created."""
+        if self._signal_number is not None:
+            signal.signal(self._signal_number, lambda *_: self.dump())
+
+    def authorized(self, req) -> bool:
+        """Whether a request carries the token of the profiler."""
+        if self._token is None:
+            return False
+        header = req.get_header("Authorization") or ""
+        scheme, _, token = header.partition(" ")
+        return scheme.lower() == "bearer" and hmac.compare_digest(
+            token.encode("utf-8"),
+            self._token.encode("utf-8")
+        )
+
+
+def _reset_profilers() -> None:
+    """Resets the live profilers in a forked child."""
+    for profiler in list(_PROFILERS):
+        profiler._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_profilers)
+
+
+class ProfilerHandler(HttpMlv):
+    """Admin endpoint of the Profiler. GET returns the collapsed
+    stacks, optionally of ?route=, and ?reset=true drops them
+    afterwards.
+
+    Parameters
+    ----------
+    route : str
+        Where the handler is mounted.
+    profiler : Profiler
+        The profiler to expose."""
+    __slots__ = ["_profiler"]
+
+    def __init__(self, route: str, profiler: Profiler):
+        HttpMlv.__init__(self, route)
+        self._profiler = profiler
+
+    def get(self, web):
+        if not self._profiler.authorized(web.request):
+            raise falcon.HTTPUnauthorized(
+                description="A valid profiler token is required",
+                challenges=["Bearer"]
+            )
+        output = self._profiler.collapsed(web.request.get_param("route"))
+        if web.request.get_param_as_bool("reset"):
+            self._profiler.reset()
+        web.set_content_type("text")
+        return output
@@ -0,0 +1,176 @@
+"""The module contains Resources, the registry of the connection
+pools and clients used by the handlers through web.resources.
+Every resource is created at most once per process, on first use or
+when the worker starts, and never crosses a fork: a forked worker
+forgets the instances of its parent without closing them, as they
+still belong to the parent, and creates its own."""
+import os
+import logging
+import weakref
+import threading
+from milvago.common.exceptions import UnknownResourceException
+
+
+LOGGER = logging.getLogger('Milvago')
+
+# the live registries, registered once for the fork callback so it
+# doesn't keep them alive
+_REGISTRIES = weakref.WeakSet()
+
+
+class _Resource:
+    """How a resource is created, checked and closed."""
+    __slots__ = [
+        "factory",
+        "close",
+        "check"
+    ]
+
+    def __init__(self, factory, close, check):
+        self.factory = factory
+        self.close = close
+        self.check = check
+
+
+class Resources:
+    """Registry of the resources of an application, reachable as
+    attributes, i.e. web.resources.db."""
+    __slots__ = [
+        "_resources",
+        "_instances",
+        "_lock",
+        "__weakref__"
+    ]
+
+    def __init__(self):
+        self._resources = {}
+        self._forget()
+        _REGISTRIES.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Resources(registered = {list(self._resources)}, " \
+               f"created = {list(self._instances)})>"
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._resources
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def _forget(self) -> None:
+        """Drops the instances of the parent process."""
+        self._instances = {}
+        self._lock = threading.RLock()
+
+    @property
+    def created(self) -> list:
+        """The names of the resources created by this process,
+        in the order they were created."""
+        return list(self._instances)
+
+    def register(self, name: str, factory, close=None,
+                 check=None) -> None:
+        """Registers a resource, created when first used.
+
+        Parameters
+        ----------
+        name : str
+            The attribute the handlers reach it through.
+        factory : callable
+            Creates the resource, without arguments.
+        close : callable
+            Called with the resource when the worker stops, its
+            close() method by default.
+        check : callable
+            Called with the resource by the health checks, which
+            fail if it returns False or raises.
+
+        Raises
+        ------
+        ValueError
+            In case the name is taken or private."""
+        if name.startswith("_") or name in self._resources:
+            raise ValueError(f"Cannot register the resource {name!r}")
+        self._resources[name] = _Resource(factory, close, check)
+
+    def get(self, name: str):
+        """The resource of this process, created if needed.
+
+        Raises
+        ------
+        UnknownResourceException
+            In case it hasn't been registered."""
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        resource = self._resources.get(name)
+        if resource is None:
+            raise UnknownResourceException(
+                f"Unknown resource {name!r}, register it with "
+                f"Resources.register"
+            )
+        with self._lock:
+            # another thread may have created it meanwhile
+            if name not in self._instances:
+                self._instances[name] = resource.factory()
+            return self._instances[name]
+
+    def start(self) -> None:
+        """Creates all the resources, so the first requests don't
+        wait for them and a failure shows when the worker starts."""
+        for name in list(self._resources):
+            self.get(name)
+
+    def health(self) -> dict:
+        """Checks every resource, creating those which don't
+        exist yet.
+
+        Returns
+        -------
+        dict
+            'ok' or the reason of the failure, by name."""
+        results = {}
+        for name, resource in list(self._resources.items()):
+            try:
+                instance = self.get(name)
+                healthy = resource.check is None \
+                    or resource.check(instance) is not False
+                results[name] = "ok" if healthy else "check failed"
+            except Exception as error:
+                results[name] = f"{error.__class__.__name__}: {error}"
+        return results
+
+    def close(self) -> None:
+        """Closes the resources of this process, the last created
+        first, they're created again if used afterwards."""
+        with self._lock:
+            instances, self._instances = self._instances, {}
+        for name in reversed(list(instances)):
+            resource = self._resources[name]
+            try:
+                if resource.close is not None:
+                    resource.close(instances[name])
+                elif hasattr(instances[name], "close"):
+                    instances[name].close()
+            except Exception:
+                LOGGER.exception(f"Failed to close the resource {name}")
+
+
+def _forget_instances() -> None:
+    """Makes the forked child create its own instances."""
+    for registry in list(_REGISTRIES):
+        registry._forget()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_instances)
+
+DEFAULT_RESOURCES = Resources()
@@ -0,0 +1,352 @@
+"""The module contains RadixRouter, a falcon router keeping the routes
+in a tree of path segments. A lookup walks the tree once, converting
+the fields on the way, and the outcome of the most requested concrete
+paths is kept in an LRU. Routes which can't be told apart are
+rejected when they are added instead of shadowing each other."""
+import re
+import keyword
+import functools
+from falcon.routing import (
+    BaseConverter,
+    CompiledRouterOptions,
+    map_http_methods,
+    set_default_responders
+)
+from milvago.common.exceptions import RouteConflictException
+
+
+_FIELD_PATTERN = re.compile(
+    r"{(?P<name>[^}:]*)(?P<separator>:(?P<converter>[^}(]*)"
+    r"(?:\((?P<args>[^}]*)\))?)?}"
+)
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class PathConverter(BaseConverter):
+    """Matches the rest of the path, slashes included. It can
+    only be used for the whole last segment of a template,
+    i.e. '/files/{name:path}'."""
+
+    def convert(self, value):
+        return value
+
+
+def _segments(path: str) -> list:
+    """Splits a path, or a template, into its segments."""
+    path = path.strip("/")
+    return path.split("/") if path else []
+
+
+def _anonymous(field) -> str:
+    """A field without its name, for comparing templates."""
+    return "{:%s(%s)}" % (field.group("converter") or "",
+                          field.group("args") or "")
+
+
+class _Node:
+    """A segment of the tree, static children are looked up by
+    their text, the dynamic ones are tried by priority."""
+    __slots__ = ["static", "dynamic", "resource", "method_map", "uri_template"]
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = []
+        self.resource = None
+        self.method_map = None
+        self.uri_template = None
+
+
+class _Field(_Node):
+    """A segment with one or more fields.
+
+    Parameters
+    ----------
+    shape : str
+        The segment with the names of the fields removed.
+    names : tuple
+        The names of the fields.
+    converters : tuple
+        Their converters, None for plain strings.
+    pattern : re.Pattern
+        Matches segments mixing text and fields, None when the
+        whole segment is a single field.
+    origin : str
+        The first template the segment was added for."""
+    __slots__ = ["shape", "names", "converters", "pattern", "priority",
+                 "rest", "origin"]
+
+    def __init__(self, shape: str, names: tuple, converters: tuple,
+                 pattern=None, origin: str = None):
+        _Node.__init__(self)
+        self.shape = shape
+        self.names = names
+        self.converters = converters
+        self.pattern = pattern
+        self.rest = isinstance(converters[0], PathConverter)
+        self.origin = origin
+        if self.rest:
+            self.priority = 3
+        elif pattern is not None:
+            self.priority = 0
+        else:
+            self.priority = 2 if converters[0] is None else 1
+
+    def match(self, segment: str):
+        """The values of the fields in a segment.
+
+        Returns
+        -------
+        dict
+            None if the segment doesn't match."""
+        if self.pattern is None:
+            if not segment:
+                return None
+            converter = self.converters[0]
+            if converter is None:
+                return {self.names[0]: segment}
+            value = converter.convert(segment)
+            return None if value is None else {self.names[0]: value}
+        found = self.pattern.fullmatch(segment)
+        if found is None:
+            return None
+        values = found.groupdict()
+        for name, converter in zip(self.names, self.converters):
+            if converter is not None:
+                value = converter.convert(values[name])
+                if value is None:
+                    return None
+                values[name] = value
+        return values
+
+
+class RadixRouter:
+    """falcon router built on a tree of path segments, pass it to
+    Milvago(router=RadixRouter()). Templates use falcon's syntax,
+    the int, uuid and dt converters and falcon's router_options
+    work the same, plus the path converter.
+
+    Static segments win over fields, fields mixed with text over
+    fields with a converter, those over plain fields and plain
+    fields over path.
+
+    Parameters
+    ----------
+    cache_size : int
+        How many concrete paths are remembered, 0 disables it."""
+    __slots__ = ["_root", "_options", "_cache_size", "_lookup"]
+
+    def __init__(self, cache_size: int = 1024):
+        self._root = _Node()
+        self._options = CompiledRouterOptions()
+        self._options.converters["path"] = PathConverter
+        self._cache_size = cache_size
+        self._lookup = functools.lru_cache(cache_size)(self._search) \
+            if cache_size else self._search
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<RadixRouter(cache_size = {self._cache_size})>"
+
+    @property
+    def options(self):
+        """The router_options of the falcon.API, for registering
+        custom converters."""
+        return self._options
+
+    def cache_info(self):
+        """Hits and misses of the LRU of concrete paths, None if
+        it is disabled.
+
+        Returns
+        -------
+        functools._CacheInfo"""
+        return self._lookup.cache_info() if self._cache_size else None
+
+    def add_route(self, uri_template: str, resource, **kwargs) -> None:
+        """Adds a route, as falcon.API.add_route does.
+
+        Parameters
+        ----------
+        uri_template : str
+            falcon URI template, i.e. '/users/{id:int}'.
+        resource : object
+            The resource the requests are routed to.
+
+        Raises
+        ------
+        ValueError
+            In case the template is malformed.
+        RouteConflictException
+            In case the route can't be told apart from a route
+            which has already been added."""
+        method_map = map_http_methods(resource, suffix=kwargs.get("suffix"))
+        set_default_responders(method_map)
+        if re.search(r"\s", _FIELD_PATTERN.sub("{FIELD}", uri_template)):
+            raise ValueError("URI templates may not include whitespace.")
+        node = self._root
+        used_names = set()
+        segments = _segments(uri_template)
+        for index, segment in enumerate(segments):
+            if "{" not in segment:
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = _Node()
+                node = child
+                continue
+            field = self._field(
+                segment,
+                used_names,
+                index == len(segments) - 1,
+                uri_template
+            )
+            node = self._insert(node, field, uri_template)
+        if node.resource is not None:
+            raise RouteConflictException(
+                f"{uri_template} conflicts with {node.uri_template}"
+            )
+        node.resource = resource
+        node.method_map = method_map
+        node.uri_template = uri_template
+        if self._cache_size:
+            self._lookup.cache_clear()
+
+    def _field(self, segment: str, used_names: set, last: bool,
+               uri_template: str) -> _Field:
+        """Parses a segment containing fields.
+
+        Returns
+        -------
+        _Field"""
+        names = []
+        converters = []
+        pattern = []
+        position = 0
+        for field in _FIELD_PATTERN.finditer(segment):
+            name = field.group("name")
+            if not _IDENTIFIER_PATTERN.match(name) or name in keyword.kwlist:
+                raise ValueError(
+                    f'Field names must be valid identifiers '
+                    f'("{name}" is not valid)'
+                )
+            if name in used_names:
+                raise ValueError(
+                    f'Field names may not be duplicated '
+                    f'("{name}" was used more than once)'
+                )
+            used_names.add(name)
+            converter = field.group("converter")
+            if field.group("separator") and not converter:
+                raise ValueError(f'Missing converter for field "{name}"')
+            if converter and converter not in self._options.converters:
+                raise ValueError(f'Unknown converter: "{converter}"')
+            names.append(name)
+            converters.append(
+                _instantiate(
+                    self._options.converters[converter],
+                    field.group("args")
+                ) if converter else None
+            )
+            pattern.append(re.escape(segment[position:field.start()]))
+            pattern.append(f"(?P<{name}>.+?)")
+            position = field.end()
+        pattern.append(re.escape(segment[position:]))
+        whole = len(names) == 1 and pattern[0] == pattern[-1] == ""
+        if any(isinstance(c, PathConverter) for c in converters) \
+                and not (whole and last):
+            raise ValueError(
+                f"{uri_template}: the path converter can only be used "
+                f"for the whole last segment"
+            )
+        return _Field(
+            _FIELD_PATTERN.sub(_anonymous, segment),
+            tuple(names),
+            tuple(converters),
+            None if whole else re.compile("".join(pattern)),
+            uri_template
+        )
+
+    @staticmethod
+    def _insert(node: _Node, field: _Field, uri_template: str) -> _Field:
+        """Adds a dynamic child, unless an equivalent one exists.
+
+        Raises
+        ------
+        RouteConflictException
+            In case the same segment uses different field names."""
+        for child in node.dynamic:
+            if child.shape == field.shape:
+                if child.names != field.names:
+                    raise RouteConflictException(
+                        f"{uri_template} conflicts with {child.origin}, "
+                        f"the fields of a segment must have the same names"
+                    )
+                return child
+        node.dynamic.append(field)
+        node.dynamic.sort(key=lambda child: child.priority)
+        return field
+
+    def find(self, uri: str, req=None):
+        """Routes a path, as falcon expects.
+
+        Parameters
+        ----------
+        uri : str
+            The path of the request.
+        req : falcon.Request
+            falcon.Request instance, unused.
+
+        Returns
+        -------
+        tuple
+            (resource, method_map, params, uri_template), None in
+            case no route matches."""
+        route = self._lookup(uri)
+        if route is None:
+            return None
+        resource, method_map, params, uri_template = route
+        return resource, method_map, dict(params), uri_template
+
+    def _search(self, uri: str):
+        """The uncached lookup."""
+        params = {}
+        node = self._match(self._root, _segments(uri), 0, params)
+        if node is None:
+            return None
+        return node.resource, node.method_map, params, node.uri_template
+
+    def _match(self, node: _Node, segments: list, index: int, params: dict):
+        """Depth first search of the node of a path."""
+        if index == len(segments):
+            return node if node.resource is not None else None
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                return found
+        for child in node.dynamic:
+            if child.rest:
+                params[child.names[0]] = child.converters[0].convert(
+                    "/".join(segments[index:])
+                )
+                return child
+            values = child.match(segment)
+            if values is None:
+                continue
+            found = self._match(child, segments, index + 1, params)
+            if found is not None:
+                params.update(values)
+                return found
+        return None
+
+
+def _instantiate(converter_class, args: str):
+    """Creates the converter of a field, passing the arguments
+    written in the template, i.e. int(4, min=1000)."""
+    if args is None:
+        return converter_class()
+    return eval(f"converter({args})", {"converter": converter_class})
@@ -0,0 +1,282 @@
+"""The module serializes the structured data returned by handlers,
+dicts, lists, tuples and dataclasses, straight to bytes. The
+representation is negotiated with the Accept header among the
+serializers of the application. orjson, ujson and msgpack are
+optional, the stdlib json module is always available."""
+import json
+import datetime
+import dataclasses
+import falcon
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+STRUCTURED_TYPES = (dict, list, tuple)
+
+
+def is_structured(body) -> bool:
+    """Whether a value returned by a handler should be serialized.
+
+    Returns
+    -------
+    bool"""
+    return isinstance(body, STRUCTURED_TYPES) or (
+        dataclasses.is_dataclass(body) and not isinstance(body, type)
+    )
+
+
+def _default(obj):
+    """Converts the types the serializers don't know about."""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {
+            field.name: getattr(obj, field.name)
+            for field in dataclasses.fields(obj)
+        }
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(
+        f"Object of type {obj.__class__.__name__} is not serializable"
+    )
+
+
+class Serializer:
+    """Base class of the serializers.
+
+    Parameters
+    ----------
+    media_type : str
+        Value of the Content-Type header of the output."""
+    __slots__ = ["media_type"]
+
+    name = None
+
+    def __init__(self, media_type: str):
+        self.media_type = media_type
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<{self.__class__.__name__}(media_type = {self.media_type})>"
+
+    def dumps(self, obj) -> bytes:
+        """Serializes an object.
+
+        Returns
+        -------
+        bytes"""
+        raise NotImplementedError
+
+
+class JsonSerializer(Serializer):
+    """JSON through the standard library."""
+    __slots__ = []
+
+    name = "json"
+
+    def __init__(self, media_type: str = falcon.MEDIA_JSON):
+        Serializer.__init__(self, media_type)
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(
+            obj,
+            separators=(",", ":"),
+            default=_default
+        ).encode("ascii")
+
+
+class OrjsonSerializer(Serializer):
+    """JSON through orjson, which handles dataclasses and
+    datetimes natively."""
+    __slots__ = []
+
+    name = "orjson"
+
+    def __init__(self, media_type: str = falcon.MEDIA_JSON):
+        if orjson is None:
+            raise ImportError("OrjsonSerializer requires orjson")
+        Serializer.__init__(self, media_type)
+
+    def dumps(self, obj) -> bytes:
+        # the keys the json module accepts, i.e. integers
+        return orjson.dumps(
+            obj,
+            default=_default,
+            option=orjson.OPT_NON_STR_KEYS
+        )
+
+
+class UjsonSerializer(Serializer):
+    """JSON through ujson."""
+    __slots__ = []
+
+    name = "ujson"
+
+    def __init__(self, media_type: str = falcon.MEDIA_JSON):
+        if ujson is None:
+            raise ImportError("UjsonSerializer requires ujson")
+        Serializer.__init__(self, media_type)
+
+    def dumps(self, obj) -> bytes:
+        return ujson.dumps(obj, default=_default).encode("ascii")
+
+
+class MsgpackSerializer(Serializer):
+    """MessagePack through msgpack."""
+    __slots__ = []
+
+    name = "msgpack"
+
+    def __init__(self, media_type: str = falcon.MEDIA_MSGPACK):
+        if msgpack is None:
+            raise ImportError("MsgpackSerializer requires msgpack")
+        Serializer.__init__(self, media_type)
+
+    def dumps(self, obj) -> bytes:
+        return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def json_serializer() -> Serializer:
+    """The fastest JSON serializer available.
+
+    Returns
+    -------
+    Serializer"""
+    if orjson is not None:
+        return OrjsonSerializer()
+    if ujson is not None:
+        return UjsonSerializer()
+    return JsonSerializer()
+
+
+class Serializers:
+    """The serializers of an application, by order of preference.
+    The first one is used when the client accepts anything.
+
+    Parameters
+    ----------
+    serializers : list
+        Serializer instances with distinct media types."""
+    __slots__ = ["_serializers", "_media_types", "_vary"]
+
+    def __init__(self, serializers: list):
+        self._serializers = {
+            serializer.media_type: serializer for serializer in serializers
+        }
+        self._media_types = list(self._serializers)
+        self._vary = len(self._media_types) > 1
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Serializers({list(self._serializers.values())})>"
+
+    @classmethod
+    def default(cls):
+        """The fastest JSON serializer and msgpack, if installed.
+
+        Returns
+        -------
+        Serializers"""
+        serializers = [json_serializer()]
+        if msgpack is not None:
+            serializers.append(MsgpackSerializer())
+        return cls(serializers)
+
+    @property
+    def media_types(self) -> list:
+        """The supported media types, by order of preference."""
+        return list(self._media_types)
+
+    @property
+    def negotiates(self) -> bool:
+        """Whether the representation depends on the Accept
+        header, with more than one serializer."""
+        return self._vary
+
+    def preferred(self, req) -> str:
+        """The media type the Accept header of a request picks.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+
+        Returns
+        -------
+        str
+            None if the client accepts none of them."""
+        if not self._vary or req.accept == "*/*":
+            return self._media_types[0]
+        return req.client_prefers(self._media_types)
+
+    def negotiate(self, req, resp) -> Serializer:
+        """Picks the serializer of a response. A content-type set
+        by the handler wins over the Accept header.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+
+        Returns
+        -------
+        Serializer
+
+        Raises
+        ------
+        falcon.HTTPNotAcceptable
+            In case the client accepts none of the media types."""
+        serializer = self._serializers.get(resp.content_type)
+        if serializer is not None:
+            return serializer
+        media_type = self.preferred(req)
+        if media_type is None:
+            raise falcon.HTTPNotAcceptable(
+                f"Supported media types: {', '.join(self._media_types)}"
+            )
+        return self._serializers[media_type]
+
+    def write(self, req, resp, body) -> None:
+        """Serializes the value returned by a handler into the
+        response.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+        body : object
+            dict, list, tuple or dataclass instance."""
+        serializer = self.negotiate(req, resp)
+        if self._vary:
+            resp.append_header("Vary", "Accept")
+        resp.content_type = serializer.media_type
+        resp.body = None
+        resp.data = serializer.dumps(body)
+
+
+DEFAULT_SERIALIZERS = Serializers.default()
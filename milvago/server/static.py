@@ -0,0 +1,640 @@
+"""The module serves files from the disk, taking care of the
+validators, conditional requests and byte ranges. StaticDirectory
+is the engine behind HttpStaticDir: it scans the directory once,
+precomputes the headers of every file and keeps the small ones
+in memory, the others are streamed through wsgi.file_wrapper.
+send_file serves any open file, i.e. one a handler has authorized."""
+import io
+import os
+import re
+import mimetypes
+import threading
+import stat as stat_module
+from collections import OrderedDict
+from datetime import datetime, timezone
+import falcon
+from milvago.server.conditional import (
+    stat_etag,
+    not_modified,
+    requested_ranges
+)
+from milvago.server.compression import PRECOMPRESSED, accepted_encoding
+
+
+_DISALLOWED_CHARS = re.compile('[\x00-\x1f\x80-\x9f\ufffd~?<>:*|\'"]')
+_MAX_RELATIVE_PATH = 512
+
+# requests for more ranges get the whole file
+MAX_RANGES = 16
+
+# the size of the blocks the parts of multipart/byteranges are read in
+RANGE_BLOCK_SIZE = 64 * 1024
+
+
+class BoundedReader(io.RawIOBase):
+    """File-like object reading at most `length` bytes of a file,
+    starting at its current position. It deliberately hides the
+    file descriptor, so servers don't sendfile past the range.
+
+    Parameters
+    ----------
+    fileobj : file
+        The open file, positioned at the start of the range.
+    length : int
+        How many bytes to read."""
+
+    def __init__(self, fileobj, length: int):
+        super().__init__()
+        self._file = fileobj
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        chunk = self._file.read(size)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def resolve_path(directory: str, relative: str) -> str:
+    """Safely joins a requested path to a directory, in the
+    same manner as falcon's static routes.
+
+    Parameters
+    ----------
+    directory : str
+        Absolute path of the directory.
+    relative : str
+        The part of the request path after the mount-point.
+
+    Returns
+    -------
+    str
+
+    Raises
+    ------
+    falcon.HTTPNotFound
+        In case the path is invalid or escapes the directory."""
+    if not relative \
+            or relative.strip().rstrip(".") != relative \
+            or _DISALLOWED_CHARS.search(relative) \
+            or "\\" in relative \
+            or "//" in relative \
+            or len(relative) > _MAX_RELATIVE_PATH:
+        raise falcon.HTTPNotFound()
+    normalized = os.path.normpath(relative)
+    if normalized.startswith("../") or normalized.startswith("/"):
+        raise falcon.HTTPNotFound()
+    file_path = os.path.join(directory, normalized)
+    if ".." in file_path or not file_path.startswith(directory):
+        raise falcon.HTTPNotFound()
+    return file_path
+
+
+def last_modified(stat) -> datetime:
+    """The modification time of a file as a naive UTC datetime,
+    which is what falcon works with.
+
+    Returns
+    -------
+    datetime.datetime"""
+    return datetime.fromtimestamp(
+        int(stat.st_mtime), timezone.utc
+    ).replace(tzinfo=None)
+
+
+def select_ranges(req, resp, size: int, etag: str, modified,
+                  max_ranges: int = MAX_RANGES) -> list:
+    """Evaluates the conditional headers and the Range header of
+    a request for a file, setting the status of the response.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    resp : falcon.Response
+        falcon.Response instance.
+    size : int
+        Size of the file.
+    etag : str
+        The unquoted entity-tag of the file.
+    modified : datetime.datetime
+        The modification time of the file.
+    max_ranges : int
+        The whole file is sent to requests for more ranges.
+
+    Returns
+    -------
+    list
+        The inclusive (first, last) ranges to send, None if the
+        request has been answered with 304.
+
+    Raises
+    ------
+    falcon.HTTPRangeNotSatisfiable
+        In case none of the requested ranges overlaps the file."""
+    if not_modified(req, etag, modified):
+        resp.status = falcon.HTTP_304
+        resp.content_type = None
+        return None
+    ranges = requested_ranges(req, size, etag, modified)
+    if ranges is None or len(ranges) > max_ranges:
+        return [(0, size - 1)]
+    resp.status = falcon.HTTP_206
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        resp.content_range = (first, last, size)
+    return ranges
+
+
+def select_range(req, resp, size: int, etag: str, modified) -> tuple:
+    """Same as select_ranges, requests for several ranges get
+    the whole file.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    resp : falcon.Response
+        falcon.Response instance.
+    size : int
+        Size of the file.
+    etag : str
+        The unquoted entity-tag of the file.
+    modified : datetime.datetime
+        The modification time of the file.
+
+    Returns
+    -------
+    tuple
+        The inclusive (first, last) bytes to send, None if the
+        request has been answered with 304.
+
+    Raises
+    ------
+    falcon.HTTPRangeNotSatisfiable
+        In case none of the requested ranges overlaps the file."""
+    ranges = select_ranges(req, resp, size, etag, modified, max_ranges=1)
+    return None if ranges is None else ranges[0]
+
+
+def stream_file(req, resp, fileobj, first: int, last: int,
+                size: int) -> None:
+    """Hands an open file over to the response. Whole files keep
+    their file descriptor, so the server can sendfile them through
+    wsgi.file_wrapper, the file is closed for HEAD requests."""
+    length = last - first + 1
+    if req.method == "HEAD":
+        fileobj.close()
+        resp.content_length = length
+    elif length == size:
+        resp.set_stream(fileobj, size)
+    else:
+        fileobj.seek(first)
+        resp.set_stream(BoundedReader(fileobj, length), length)
+
+
+def stream_ranges(req, resp, fileobj, ranges: list, size: int,
+                  content_type: str = None) -> None:
+    """Hands several ranges of an open file over to the response
+    as multipart/byteranges. The parts are read in blocks as they
+    are sent, the file is closed after the last one.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    resp : falcon.Response
+        falcon.Response instance.
+    fileobj : file
+        The file, open in binary mode.
+    ranges : list
+        The inclusive (first, last) ranges.
+    size : int
+        Size of the file.
+    content_type : str
+        The Content-Type of the parts."""
+    boundary = os.urandom(16).hex()
+    parts = []
+    length = 0
+    for index, (first, last) in enumerate(ranges):
+        # the CRLF before a boundary belongs to it, not to the part
+        header = (b"\r\n" if index else b"") + (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type or 'application/octet-stream'}\r\n"
+            f"Content-Range: bytes {first}-{last}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((header, first, last))
+        length += len(header) + last - first + 1
+    closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    length += len(closing)
+    resp.content_type = f"multipart/byteranges; boundary={boundary}"
+    if req.method == "HEAD":
+        fileobj.close()
+        resp.content_length = length
+    else:
+        resp.set_stream(_byteranges(fileobj, parts, closing), length)
+
+
+def _byteranges(fileobj, parts: list, closing: bytes):
+    """Generates the body of a multipart/byteranges response."""
+    try:
+        for header, first, last in parts:
+            yield header
+            fileobj.seek(first)
+            remaining = last - first + 1
+            while remaining > 0:
+                chunk = fileobj.read(min(remaining, RANGE_BLOCK_SIZE))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        yield closing
+    finally:
+        fileobj.close()
+
+
+def send_file(req, resp, fileobj, stat, content_type: str = None) -> None:
+    """Streams an open file, setting its validators and answering
+    with 304 or 206 when the request asks for it, with several
+    ranges as multipart/byteranges. The file is closed whenever
+    it isn't handed over to the response.
+
+    Parameters
+    ----------
+    req : falcon.Request
+        falcon.Request instance.
+    resp : falcon.Response
+        falcon.Response instance.
+    fileobj : file
+        The file, open in binary mode.
+    stat : os.stat_result
+        The result of os.fstat of the file.
+    content_type : str
+        Value of the Content-Type header."""
+    etag = stat_etag(stat)
+    modified = last_modified(stat)
+    resp.etag = etag
+    resp.last_modified = modified
+    resp.accept_ranges = "bytes"
+    if content_type is not None:
+        resp.content_type = content_type
+    try:
+        ranges = select_ranges(req, resp, stat.st_size, etag, modified)
+    except falcon.HTTPRangeNotSatisfiable:
+        fileobj.close()
+        raise
+    if ranges is None:
+        fileobj.close()
+    elif len(ranges) == 1:
+        stream_file(req, resp, fileobj, *ranges[0], stat.st_size)
+    else:
+        stream_ranges(req, resp, fileobj, ranges, stat.st_size,
+                      content_type)
+
+
+def open_file(file_path: str):
+    """Opens a regular file for reading.
+
+    Returns
+    -------
+    tuple
+        The open file and its os.stat_result.
+
+    Raises
+    ------
+    falcon.HTTPNotFound
+        In case the file is missing or isn't a regular file."""
+    try:
+        fileobj = io.open(file_path, "rb")
+    except (IOError, OSError):
+        raise falcon.HTTPNotFound()
+    stat = os.fstat(fileobj.fileno())
+    if not stat_module.S_ISREG(stat.st_mode):
+        fileobj.close()
+        raise falcon.HTTPNotFound()
+    return fileobj, stat
+
+
+def open_source(source):
+    """Opens the file a handler sends, see RequestContext.send_file.
+
+    Parameters
+    ----------
+    source : str
+        A path, a file descriptor or a file open in binary mode,
+        the file descriptors and the files are taken over. They
+        are flushed and sent from their start, whatever their
+        current offset, i.e. right after writing an export.
+
+    Returns
+    -------
+    tuple
+        The open file, its os.stat_result and its name, None
+        if it has none.
+
+    Raises
+    ------
+    falcon.HTTPNotFound
+        In case the file is missing or isn't a regular file."""
+    if isinstance(source, int):
+        source = io.open(source, "rb")
+    elif not hasattr(source, "read"):
+        fileobj, stat = open_file(os.fspath(source))
+        return fileobj, stat, fileobj.name
+    if hasattr(source, "flush"):
+        source.flush()
+    stat = os.fstat(source.fileno())
+    if not stat_module.S_ISREG(stat.st_mode):
+        source.close()
+        raise falcon.HTTPNotFound()
+    source.seek(0)
+    name = getattr(source, "name", None)
+    return source, stat, name if isinstance(name, str) else None
+
+
+def guess_type(name: str) -> str:
+    """The content-type of a file, by its extension.
+
+    Returns
+    -------
+    str"""
+    if name is None:
+        return "application/octet-stream"
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+class StaticFile:
+    """A file found by the directory scan, with all of its
+    headers computed upfront.
+
+    Parameters
+    ----------
+    path : str
+        Absolute path of the file.
+    stat : os.stat_result
+        The result of os.stat of the file.
+    content_type : str
+        Value of the Content-Type header.
+    cache_control : str
+        Value of the Cache-Control header, None to skip it.
+    encoding : str
+        Value of the Content-Encoding header of precompressed
+        files, None otherwise."""
+    __slots__ = [
+        "path",
+        "size",
+        "etag",
+        "last_modified",
+        "headers",
+        "variants"
+    ]
+
+    def __init__(self, path: str, stat, content_type: str,
+                 cache_control: str = None, encoding: str = None):
+        self.path = path
+        self.size = stat.st_size
+        self.etag = stat_etag(stat)
+        self.last_modified = last_modified(stat)
+        self.headers = {
+            "Content-Type": content_type,
+            "ETag": f'"{self.etag}"',
+            "Last-Modified": falcon.dt_to_http(self.last_modified),
+            "Accept-Ranges": "bytes",
+        }
+        if cache_control:
+            self.headers["Cache-Control"] = cache_control
+        if encoding:
+            self.headers["Content-Encoding"] = encoding
+        self.variants = None
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<StaticFile(path = {self.path}, size = {self.size})>"
+
+
+class HotFiles:
+    """Thread-safe LRU of the contents of small files.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum total size of the kept files."""
+    __slots__ = ["_entries", "_lock", "_max_bytes", "_size", "hits", "misses"]
+
+    def __init__(self, max_bytes: int):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_bytes = max_bytes
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """The total size of the kept files."""
+        return self._size
+
+    def get(self, entry: StaticFile) -> bytes:
+        """Returns the contents of a file, reading it on a miss.
+
+        Raises
+        ------
+        falcon.HTTPNotFound
+            In case the file has been removed since the scan."""
+        with self._lock:
+            data = self._entries.get(entry.path)
+            if data is not None:
+                self._entries.move_to_end(entry.path)
+                self.hits += 1
+                return data
+            self.misses += 1
+        try:
+            with io.open(entry.path, "rb") as fileobj:
+                data = fileobj.read(entry.size)
+        except (IOError, OSError):
+            raise falcon.HTTPNotFound()
+        with self._lock:
+            if entry.path not in self._entries:
+                while self._entries \
+                        and self._size + len(data) > self._max_bytes:
+                    self._size -= len(self._entries.popitem(last=False)[1])
+                self._entries[entry.path] = data
+                self._size += len(data)
+        return data
+
+    def clear(self) -> None:
+        """Drops all the kept files."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class StaticDirectory:
+    """Serves the files of a directory. The directory is scanned
+    once, so requests never touch the disk to resolve a path and
+    files smaller than `max_hot_size` are served from memory.
+
+    Parameters
+    ----------
+    directory : str
+        Path of the directory.
+    media_types : dict
+        Content-types by file extension.
+    cache_control : str
+        Value of the Cache-Control header of every file,
+        i.e. 'public, max-age=3600'.
+    hot_bytes : int
+        Memory budget for the contents of small files,
+        0 disables it.
+    max_hot_size : int
+        Files up to this size are kept in memory."""
+    __slots__ = [
+        "_directory",
+        "_media_types",
+        "_cache_control",
+        "_files",
+        "_hot",
+        "_max_hot_size"
+    ]
+
+    def __init__(self, directory: str, media_types: dict,
+                 cache_control: str = None,
+                 hot_bytes: int = 16 * 1024 * 1024,
+                 max_hot_size: int = 256 * 1024):
+        self._directory = os.path.abspath(directory)
+        self._media_types = media_types
+        self._cache_control = cache_control
+        self._files = {}
+        self._hot = HotFiles(hot_bytes) if hot_bytes else None
+        self._max_hot_size = max_hot_size
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<StaticDirectory(directory = {self._directory}, " \
+               f"files = {len(self._files)})>"
+
+    def __len__(self):
+        return len(self._files)
+
+    @property
+    def hot(self):
+        """The HotFiles LRU, None if disabled."""
+        return self._hot
+
+    def scan(self) -> int:
+        """Walks the directory and replaces the index of its
+        files. Call it again after deploying new files.
+
+        Returns
+        -------
+        int
+            The number of files found."""
+        found = {}
+        for root, _, names in os.walk(self._directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat_module.S_ISREG(stat.st_mode):
+                    relative = os.path.relpath(path, self._directory)
+                    found[relative.replace(os.sep, "/")] = path, stat
+        files = {}
+        for relative, (path, stat) in found.items():
+            content_type = self._media_types.get(
+                os.path.splitext(path)[1],
+                "application/octet-stream"
+            )
+            entry = StaticFile(path, stat, content_type, self._cache_control)
+            variants = {}
+            for encoding, extension in PRECOMPRESSED:
+                sibling = found.get(f"{relative}{extension}")
+                if sibling is not None:
+                    variants[encoding] = StaticFile(
+                        *sibling,
+                        content_type,
+                        self._cache_control,
+                        encoding
+                    )
+                    variants[encoding].headers["Vary"] = "Accept-Encoding"
+            if variants:
+                entry.headers["Vary"] = "Accept-Encoding"
+                entry.variants = variants
+            files[relative] = entry
+        self._files = files
+        if self._hot is not None:
+            self._hot.clear()
+        return len(files)
+
+    def lookup(self, relative: str) -> StaticFile:
+        """Finds a file of the directory.
+
+        Raises
+        ------
+        falcon.HTTPNotFound
+            In case the scan didn't find it."""
+        entry = self._files.get(relative)
+        if entry is None:
+            raise falcon.HTTPNotFound()
+        return entry
+
+    def serve(self, req, resp, relative: str) -> None:
+        """Answers a GET or HEAD request for a file.
+
+        Parameters
+        ----------
+        req : falcon.Request
+            falcon.Request instance.
+        resp : falcon.Response
+            falcon.Response instance.
+        relative : str
+            The part of the request path after the mount-point."""
+        entry = self.lookup(relative)
+        if entry.variants is not None:
+            encoding = accepted_encoding(
+                req.get_header("Accept-Encoding"),
+                tuple(entry.variants)
+            )
+            if encoding is not None:
+                entry = entry.variants[encoding]
+        resp.set_headers(entry.headers)
+        selected = select_range(
+            req, resp, entry.size, entry.etag, entry.last_modified
+        )
+        if selected is None:
+            return
+        first, last = selected
+        if req.method == "HEAD":
+            resp.content_length = last - first + 1
+        elif self._hot is not None and entry.size <= self._max_hot_size:
+            data = self._hot.get(entry)
+            resp.data = data if last - first + 1 == entry.size \
+                else data[first:last + 1]
+        else:
+            try:
+                fileobj = io.open(entry.path, "rb")
+            except (IOError, OSError):
+                raise falcon.HTTPNotFound()
+            stream_file(req, resp, fileobj, first, last, entry.size)
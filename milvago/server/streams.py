@@ -0,0 +1,348 @@
+"""The module contains StreamHub, which broadcasts the frames of a
+single producer per source, i.e. a camera, to every client streaming
+it, as multipart/x-mixed-replace (MJPEG) or server-sent events.
+
+Every subscriber has a small ring buffer, a slow client misses the
+oldest frames instead of slowing down the producer or the other
+clients. A producer is started by the first subscriber of its source
+and stopped once the last one leaves. The source stays registered
+until its producer has closed it, a client subscribing meanwhile
+waits for the producer to open it again rather than start another
+one, so a camera is never opened twice."""
+import os
+import json
+import logging
+import weakref
+import threading
+import collections
+
+
+LOGGER = logging.getLogger('Milvago')
+
+# the live hubs, registered once for the fork callback so it doesn't
+# keep them alive
+_HUBS = weakref.WeakSet()
+
+
+class _Channel:
+    """The producer of a source and its subscribers."""
+    __slots__ = [
+        "key",
+        "subscribers",
+        "condition",
+        "closed",
+        "stopping",
+        "produced"
+    ]
+
+    def __init__(self, key):
+        self.key = key
+        self.subscribers = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.stopping = False
+        self.produced = 0
+
+
+class Subscription:
+    """The ring buffer of a subscriber of a StreamHub.
+
+    Parameters
+    ----------
+    channel : _Channel
+        The source the frames come from.
+    size : int
+        How many frames are kept for the subscriber, the oldest
+        are dropped."""
+    __slots__ = [
+        "_channel",
+        "_buffer",
+        "dropped",
+        "received"
+    ]
+
+    def __init__(self, channel: _Channel, size: int):
+        self._channel = channel
+        self._buffer = collections.deque(maxlen=size)
+        self.dropped = 0
+        self.received = 0
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<Subscription(key = {self._channel.key}, " \
+               f"received = {self.received}, dropped = {self.dropped})>"
+
+    @property
+    def closed(self) -> bool:
+        """Whether the source has ended and no frame is left."""
+        return self._channel.closed and not self._buffer
+
+    def push(self, sequence: int, frame) -> None:
+        """Adds a frame, dropping the oldest one when the buffer is
+        full. Called by the producer, under the channel's lock."""
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append((sequence, frame))
+
+    def get(self, timeout: float = None):
+        """Waits for the next frame.
+
+        Parameters
+        ----------
+        timeout : float
+            The seconds to wait, None to wait until a frame
+            arrives or the source ends.
+
+        Returns
+        -------
+        tuple
+            The sequence number of the frame and the frame, None
+            on timeout or once the source has ended."""
+        condition = self._channel.condition
+        with condition:
+            if not condition.wait_for(
+                    lambda: self._buffer or self._channel.closed, timeout):
+                return None
+            if not self._buffer:
+                return None
+            self.received += 1
+            return self._buffer.popleft()
+
+
+class StreamHub:
+    """Runs one producer per source and fans its frames out to
+    all the subscribers of the source.
+
+    Parameters
+    ----------
+    source : callable
+        Called with the key of a source, returns an iterable of
+        its frames, bytes or str. It's iterated in a thread of its
+        own, closed when nobody streams the source anymore.
+    buffer_size : int
+        The frames kept for every subscriber.
+    heartbeat : float
+        Server-sent event streams receive a comment when no frame
+        has been sent for this many seconds, which keeps proxies
+        from closing them and detects the clients which left."""
+    __slots__ = [
+        "_source",
+        "_buffer_size",
+        "_heartbeat",
+        "_channels",
+        "_lock",
+        "__weakref__"
+    ]
+
+    def __init__(self, source, buffer_size: int = 2,
+                 heartbeat: float = 15.0):
+        self._source = source
+        self._buffer_size = buffer_size
+        self._heartbeat = heartbeat
+        self._reset()
+        _HUBS.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<StreamHub(source = {self._source}, " \
+               f"buffer_size = {self._buffer_size}, " \
+               f"sources = {list(self._channels)})>"
+
+    def _reset(self) -> None:
+        """Forgets the producers, the threads running them don't
+        exist in a forked child."""
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        """The running sources.
+
+        Returns
+        -------
+        dict
+            The subscribers, frames produced and frames dropped
+            for the slow subscribers of every source."""
+        with self._lock:
+            channels = list(self._channels.values())
+        stats = {}
+        for channel in channels:
+            with channel.condition:
+                stats[channel.key] = {
+                    "subscribers": len(channel.subscribers),
+                    "produced": channel.produced,
+                    "dropped": sum(subscriber.dropped for subscriber
+                                   in channel.subscribers)
+                }
+        return stats
+
+    def subscribe(self, key=None) -> Subscription:
+        """Subscribes to a source, starting its producer if needed.
+        The subscription must be ended with unsubscribe.
+
+        Parameters
+        ----------
+        key : hashable
+            The source, passed to the source callable.
+
+        Returns
+        -------
+        Subscription"""
+        with self._lock:
+            channel = self._channels.get(key)
+            start = channel is None
+            if start:
+                channel = self._channels[key] = _Channel(key)
+            subscription = Subscription(channel, self._buffer_size)
+            with channel.condition:
+                channel.subscribers.append(subscription)
+        if start:
+            threading.Thread(
+                target=self._produce,
+                args=(channel,),
+                name=f"milvago-stream-{key}",
+                daemon=True
+            ).start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Ends a subscription, the producer stops after its next
+        frame if it was the last one."""
+        channel = subscription._channel
+        with channel.condition:
+            if subscription in channel.subscribers:
+                channel.subscribers.remove(subscription)
+
+    def _produce(self, channel: _Channel) -> None:
+        """Iterates over a source until it ends or loses its
+        subscribers. The channel is only dropped once the source
+        is closed, the subscribers which joined while it was
+        closing get it opened again by the same thread."""
+        while True:
+            frames = None
+            try:
+                frames = iter(self._source(channel.key))
+                for frame in frames:
+                    with channel.condition:
+                        if not channel.subscribers:
+                            channel.stopping = True
+                            break
+                        channel.produced += 1
+                        for subscriber in channel.subscribers:
+                            subscriber.push(channel.produced, frame)
+                        channel.condition.notify_all()
+            except Exception:
+                LOGGER.exception(f"The stream {channel.key} failed")
+            finally:
+                if hasattr(frames, "close"):
+                    frames.close()
+            with self._lock:
+                with channel.condition:
+                    if channel.stopping and channel.subscribers:
+                        channel.stopping = False
+                        continue
+                    if self._channels.get(channel.key) is channel:
+                        del self._channels[channel.key]
+                    channel.closed = True
+                    channel.condition.notify_all()
+            return
+
+    def _frames(self, key, timeout: float = None):
+        """Yields the frames of a source, None after timeout
+        seconds without any."""
+        subscription = self.subscribe(key)
+        try:
+            while True:
+                item = subscription.get(timeout)
+                if item is None and subscription.closed:
+                    return
+                yield item
+        finally:
+            self.unsubscribe(subscription)
+
+    def multipart(self, web, key=None, content_type: str = "image/jpeg",
+                  boundary: str = "frame") -> None:
+        """Streams a source as multipart/x-mixed-replace, every
+        frame replacing the previous one, i.e. MJPEG.
+
+        Parameters
+        ----------
+        web : RequestContext
+            The context of the request.
+        key : hashable
+            The source.
+        content_type : str
+            The content-type of the frames.
+        boundary : str
+            The separator of the parts."""
+        web.set_custom_content_type(
+            f"multipart/x-mixed-replace; boundary={boundary}"
+        )
+        web.response.stream = self._multipart(key, content_type, boundary)
+
+    def _multipart(self, key, content_type: str, boundary: str):
+        head = f"--{boundary}\r\nContent-Type: {content_type}\r\n" \
+               f"Content-Length: ".encode("latin-1")
+        for _, frame in self._frames(key):
+            if isinstance(frame, str):
+                frame = frame.encode("utf-8")
+            yield b"".join(
+                (head, str(len(frame)).encode(), b"\r\n\r\n", frame, b"\r\n")
+            )
+
+    def sse(self, web, key=None, event: str = None) -> None:
+        """Streams a source as server-sent events, for EventSource.
+        str and bytes frames are sent as they are, the others as
+        JSON.
+
+        Parameters
+        ----------
+        web : RequestContext
+            The context of the request.
+        key : hashable
+            The source.
+        event : str
+            The type of the events, message by default."""
+        web.set_custom_content_type("text/event-stream; charset=utf-8")
+        web.response.set_header("Cache-Control", "no-cache")
+        web.response.set_header("X-Accel-Buffering", "no")
+        web.response.stream = self._sse(key, event)
+
+    def _sse(self, key, event: str):
+        prefix = b"" if event is None else f"event: {event}\n".encode()
+        for item in self._frames(key, self._heartbeat):
+            if item is None:
+                yield b": keep-alive\n\n"
+                continue
+            sequence, frame = item
+            yield prefix + f"id: {sequence}\n".encode() + _event_data(frame)
+
+
+def _reset_hubs() -> None:
+    """Makes the live hubs of a forked child forget the producers
+    of the parent."""
+    for hub in list(_HUBS):
+        hub._reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_hubs)
+
+
+def _event_data(frame) -> bytes:
+    """The data lines of a server-sent event."""
+    if isinstance(frame, bytes):
+        frame = frame.decode("utf-8")
+    elif not isinstance(frame, str):
+        frame = json.dumps(frame)
+    return "".join(
+        f"data: {line}\n" for line in frame.split("\n")
+    ).encode("utf-8") + b"\n"
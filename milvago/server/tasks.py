@@ -0,0 +1,293 @@
+"""The module contains TaskQueue, the pool behind web.defer running
+fire-and-forget work, i.e. audit writes or cache warmups, once the
+handler has returned. Every process gets its own pool, created on
+the first deferred task, so the workers forked by a server don't
+share the threads of the master. The number of tasks waiting or
+running is bounded, when the bound is reached the backpressure
+policy decides whether a new task is dropped, waits for room or
+runs in the calling thread."""
+import os
+import time
+import atexit
+import logging
+import weakref
+import threading
+import functools
+
+
+LOGGER = logging.getLogger('Milvago')
+
+DROP = "drop"
+BLOCK = "block"
+INLINE = "inline"
+
+POLICIES = (DROP, BLOCK, INLINE)
+
+# the method the tasks are recorded with in Metrics
+METRICS_METHOD = "TASK"
+
+# the live queues, registered once for the exit and fork callbacks
+# so these don't keep the queues alive
+_QUEUES = weakref.WeakSet()
+
+
+def _task_name(fn) -> str:
+    """The label of a task in the metrics and the logs."""
+    while isinstance(fn, functools.partial):
+        fn = fn.func
+    module = getattr(fn, "__module__", None)
+    name = getattr(fn, "__qualname__", None) or repr(fn)
+    return f"{module}.{name}" if module else name
+
+
+class TaskQueue:
+    """Bounded pool running the functions deferred by the handlers.
+
+    Parameters
+    ----------
+    workers : int
+        The number of threads, or processes, of each worker.
+    max_pending : int
+        How many tasks may be waiting or running at once.
+    policy : str
+        What happens to a task deferred when max_pending are
+        already pending: 'drop' discards it, 'block' waits for
+        room, up to block_timeout, and 'inline' runs it at once
+        in the thread of the request.
+    processes : bool
+        Run the tasks in a pool of processes, for CPU bound work.
+        The functions and their arguments must be picklable.
+    block_timeout : float
+        With the 'block' policy, the seconds to wait for room
+        before dropping the task, None to wait indefinitely.
+    drain_timeout : float
+        The seconds the pending tasks are given to finish when
+        the process exits."""
+    __slots__ = [
+        "_workers",
+        "_max_pending",
+        "_policy",
+        "_processes",
+        "_block_timeout",
+        "_drain_timeout",
+        "_executor",
+        "_pending",
+        "_lock",
+        "_room",
+        "_idle",
+        "_metrics",
+        "__weakref__"
+    ]
+
+    def __init__(self, workers: int = 4, max_pending: int = 1000,
+                 policy: str = BLOCK, processes: bool = False,
+                 block_timeout: float = None, drain_timeout: float = 30.0):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Invalid policy {policy!r}, you can use one "
+                f"of {', '.join(POLICIES)}"
+            )
+        self._workers = workers
+        self._max_pending = max_pending
+        self._policy = policy
+        self._processes = processes
+        self._block_timeout = block_timeout
+        self._drain_timeout = drain_timeout
+        self._metrics = None
+        self._reset()
+        _QUEUES.add(self)
+
+    def __repr__(self):
+        """Printing representation of the class.
+
+        Returns
+        -------
+        str"""
+        return f"<TaskQueue(workers = {self._workers}, " \
+               f"max_pending = {self._max_pending}, " \
+               f"policy = {self._policy}, " \
+               f"processes = {self._processes})>"
+
+    def _reset(self) -> None:
+        """Forgets the pool and the tasks of the parent process,
+        whose threads don't exist in a forked child."""
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+
+    @property
+    def pending(self) -> int:
+        """The number of tasks waiting or running in this process."""
+        return self._pending
+
+    @property
+    def policy(self) -> str:
+        """The backpressure policy."""
+        return self._policy
+
+    def attach_metrics(self, metrics) -> None:
+        """Records the latency and the outcome of the tasks, as
+        well as the pending ones, Milvago attaches the metrics of
+        the application.
+
+        Parameters
+        ----------
+        metrics : Metrics
+            Self-explanatory."""
+        self._metrics = metrics
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedules fn(*args, **kwargs) in the pool. The exceptions
+        it raises are logged.
+
+        Parameters
+        ----------
+        fn : callable
+            The task.
+        *args : list
+            Its positional arguments.
+        **kwargs : dict
+            Its named arguments.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            The outcome of the task, None if it has been dropped."""
+        name = _task_name(fn)
+        with self._lock:
+            admitted = self._pending < self._max_pending
+            if not admitted and self._policy == BLOCK:
+                admitted = self._room.wait_for(
+                    lambda: self._pending < self._max_pending,
+                    self._block_timeout
+                )
+            if admitted:
+                self._pending += 1
+                executor = self._executor
+                if executor is None:
+                    executor = self._executor = self._create_executor()
+        if not admitted:
+            if self._policy == INLINE:
+                return self._run_inline(name, fn, args, kwargs)
+            LOGGER.warning(f"Dropped the task {name}, the queue is full")
+            if self._metrics is not None:
+                self._metrics.count(name, METRICS_METHOD, "dropped")
+            return None
+        if self._metrics is not None:
+            self._metrics.started(name, METRICS_METHOD)
+        submitted = time.perf_counter()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(name, None, "error")
+            raise
+        future.add_done_callback(
+            functools.partial(self._done, name, submitted)
+        )
+        return future
+
+    def _create_executor(self):
+        # imported on the first task, like the pool, most
+        # applications never defer anything
+        if self._processes:
+            from concurrent.futures import ProcessPoolExecutor
+            return ProcessPoolExecutor(self._workers)
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(
+            self._workers,
+            thread_name_prefix="milvago-task"
+        )
+
+    def _run_inline(self, name: str, fn, args, kwargs):
+        """Runs a task in the calling thread, the queue being full."""
+        from concurrent.futures import Future
+        future = Future()
+        started = time.perf_counter()
+        try:
+            future.set_result(fn(*args, **kwargs))
+            status = "inline"
+        except Exception as error:
+            LOGGER.exception(f"The task {name} failed")
+            future.set_exception(error)
+            status = "error"
+        if self._metrics is not None:
+            self._metrics.finished(name, METRICS_METHOD, status,
+                                   time.perf_counter() - started,
+                                   in_flight=False)
+        return future
+
+    def _done(self, name: str, started: float, future) -> None:
+        status = "ok"
+        if future.cancelled():
+            status = "cancelled"
+        elif future.exception() is not None:
+            LOGGER.error(f"The task {name} failed",
+                         exc_info=future.exception())
+            status = "error"
+        self._release(name, started, status)
+
+    def _release(self, name: str, started: float, status: str) -> None:
+        """Makes room for another task and records the outcome."""
+        with self._lock:
+            self._pending -= 1
+            self._room.notify()
+            if not self._pending:
+                self._idle.notify_all()
+        if self._metrics is None:
+            return
+        if started is None:
+            self._metrics.stats(name, METRICS_METHOD).in_flight -= 1
+            self._metrics.count(name, METRICS_METHOD, status)
+        else:
+            self._metrics.finished(name, METRICS_METHOD, status,
+                                   time.perf_counter() - started)
+
+    def drain(self, timeout: float = None) -> bool:
+        """Waits for the pending tasks and stops the pool, a task
+        deferred afterwards starts a new one. Called when the
+        process exits.
+
+        Parameters
+        ----------
+        timeout : float
+            The seconds to wait, drain_timeout by default.
+
+        Returns
+        -------
+        bool
+            Whether all the tasks have finished."""
+        timeout = self._drain_timeout if timeout is None else timeout
+        with self._lock:
+            executor, self._executor = self._executor, None
+            if executor is None:
+                return not self._pending
+            finished = self._idle.wait_for(
+                lambda: not self._pending, timeout
+            )
+            pending = self._pending
+        if not finished:
+            LOGGER.warning(f"Abandoned {pending} tasks still pending "
+                           f"after {timeout}s")
+        executor.shutdown(wait=finished)
+        return finished
+
+
+def _drain_queues() -> None:
+    """Drains the live queues when the process exits."""
+    for queue in list(_QUEUES):
+        queue.drain()
+
+
+def _reset_queues() -> None:
+    """The pools of the queues don't survive fork."""
+    for queue in list(_QUEUES):
+        queue._reset()
+
+
+atexit.register(_drain_queues)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_queues)
+
+DEFAULT_TASKS = TaskQueue()
@@ -0,0 +1,104 @@
+"""The module creates the jinja2 environment shared by all the
+handlers of an application, with a persistent bytecode cache, and
+precompiles the templates ahead of the first request."""
+import os
+import sys
+import time
+import argparse
+import jinja2
+
+
+def create_environment(template_dir: str, cache_dir: str = None,
+                       auto_reload: bool = True) -> jinja2.Environment:
+    """Creates a jinja2 environment loading templates from a
+    directory.
+
+    Parameters
+    ----------
+    template_dir : str
+        Full path to the directory containing the templates.
+    cache_dir : str
+        Where the compiled templates are persisted across
+        processes and restarts. None uses jinja2's default
+        directory in the system's temporary directory, an
+        empty string disables the bytecode cache.
+    auto_reload : bool
+        Check the templates for modifications on every render,
+        which costs a stat call. Only useful in development.
+
+    Returns
+    -------
+    jinja2.Environment"""
+    # the keys of the bytecode cache contain the path of the
+    # templates, the CLI and the application must agree on it
+    template_dir = os.path.abspath(template_dir)
+    bytecode_cache = None
+    if cache_dir is None:
+        bytecode_cache = jinja2.FileSystemBytecodeCache()
+    elif cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(searchpath=template_dir),
+        bytecode_cache=bytecode_cache,
+        auto_reload=auto_reload
+    )
+
+
+def precompile(environment: jinja2.Environment) -> int:
+    """Compiles every template the environment can find, filling
+    its in-memory cache and its bytecode cache.
+
+    Parameters
+    ----------
+    environment : jinja2.Environment
+        The environment of the application.
+
+    Returns
+    -------
+    int
+        The number of compiled templates.
+
+    Raises
+    ------
+    jinja2.TemplateSyntaxError
+        In case a template is invalid, so broken templates are
+        caught at startup instead of on the first request."""
+    templates = environment.list_templates()
+    for name in templates:
+        environment.get_template(name)
+    return len(templates)
+
+
+def compile_templates(argv=None) -> int:
+    """Entry point of `milvago compile-templates`, which fills the
+    bytecode cache at build time, i.e. while building a container
+    image, so workers never compile templates.
+
+    Returns
+    -------
+    int
+        The exit code."""
+    parser = argparse.ArgumentParser(
+        prog="milvago compile-templates",
+        description="Precompiles jinja2 templates into a bytecode cache."
+    )
+    parser.add_argument("template_dir", type=os.path.abspath)
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory of the bytecode cache, the same as "
+             "Milvago(template_cache_dir=...)."
+    )
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    try:
+        count = precompile(create_environment(
+            args.template_dir, args.cache_dir, auto_reload=False
+        ))
+    except jinja2.TemplateSyntaxError as error:
+        print(f"{error.filename}:{error.lineno}: {error.message}",
+              file=sys.stderr)
+        return 1
+    print(f"Compiled {count} templates in "
+          f"{(time.perf_counter() - started) * 1000:.1f}ms")
+    return 0
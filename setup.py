@@ -30,6 +30,9 @@ setup(
     include_package_data=True,
     license=ABOUT["__license__"],
     zip_safe=False,
+    entry_points={
+        "console_scripts": ["milvago = milvago.__main__:main"],
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import tempfile
+import unittest
+import threading
+from falcon import testing
+import milvago
+from milvago.common.exceptions import UnsupportedHandlerException
+
+
+TEMPLATES = tempfile.mkdtemp()
+STATIC = tempfile.mkdtemp()
+with open(os.path.join(TEMPLATES, 'hello.html'), 'w') as f:
+    f.write('<p>Hello {{ name }}</p>')
+with open(os.path.join(STATIC, 'file.txt'), 'wb') as f:
+    f.write(b'static ' * 10000)
+
+
+@milvago.expose_web('/async/{name}', 'get, post')
+async def async_function(web):
+    await asyncio.sleep(0.2)
+    return f"{web.request.method} {web.uri_data['name']} {web.request.params.get('q')}"
+
+
+@milvago.expose_web('/sync')
+def sync_function(web):
+    web.set_content_type('json')
+    return f'"{threading.current_thread().name}"'
+
+
+@milvago.expose_web('/items/{name}')
+def item(web):
+    return web.uri_data['name']
+
+
+@milvago.expose_web('/template')
+def template(web):
+    return web.render('hello.html', name=web.request.params['name'])
+
+
+class AsyncClass(milvago.HttpMlv):
+
+    def __init__(self):
+        milvago.HttpMlv.__init__(self, '/async_class')
+
+    async def get(self):
+        await asyncio.sleep(0)
+        self.set_status(201)
+        return f"class {self.request.params.get('q')}"
+
+    def post(self, web):
+        return web.request.params['message']
+
+
+def call(app, method, path, query=b'', body=b'', headers=(), raw_path=None):
+    messages = []
+    requests = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return requests.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': raw_path or path.encode(),
+        'query_string': query,
+        'root_path': '',
+        'headers': [(b'host', b'localhost')] + list(headers),
+        'server': ('localhost', 8000),
+        'client': ('127.0.0.1', 1234),
+    }
+    return scope, receive, send, messages
+
+
+def request(app, method, path, **kwargs):
+    scope, receive, send, messages = call(app, method, path, **kwargs)
+    asyncio.run(app(scope, receive, send))
+    return parse(messages)
+
+
+def parse(messages):
+    start = messages[0]
+    headers = {k.decode(): v.decode() for k, v in start['headers']}
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], headers, body
+
+
+class TestAsgi(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        handlers = [
+            async_function(),
+            sync_function(),
+            item(),
+            template(),
+            AsyncClass(),
+            milvago.expose_static('/static', STATIC),
+            milvago.expose_static('/cold', STATIC, hot_bytes=0)
+        ]
+        cls.app = milvago.Milvago(
+            handlers, template_dir=TEMPLATES, asgi=True, asgi_threads=4)()
+
+    def test_async_function(self):
+        status, headers, body = request(self.app, 'GET', '/async/abc', query=b'q=1')
+        self.assertEqual((status, body), (200, b'GET abc 1'))
+
+    def test_async_class(self):
+        status, headers, body = request(self.app, 'GET', '/async_class', query=b'q=2')
+        self.assertEqual((status, body), (201, b'class 2'))
+
+    def test_sync_handler_runs_in_pool(self):
+        status, headers, body = request(self.app, 'GET', '/sync')
+        self.assertEqual(headers['content-type'], 'application/json')
+        self.assertTrue(body.startswith(b'"milvago-asgi'))
+
+    def test_encoded_path_like_wsgi(self):
+        status, headers, body = request(
+            self.app, 'GET', '/items/a b', raw_path=b'/items/a%20b')
+        wsgi = testing.TestClient(milvago.Milvago([item()])())
+        self.assertEqual(body.decode(), wsgi.simulate_get('/items/a%20b').text)
+        self.assertEqual(body, b'a b')
+
+    def test_form_post(self):
+        status, headers, body = request(
+            self.app, 'POST', '/async_class', body=b'message=hi+there',
+            headers=[(b'content-type', b'application/x-www-form-urlencoded')])
+        self.assertEqual((status, body), (200, b'hi there'))
+
+    def test_template(self):
+        status, headers, body = request(self.app, 'GET', '/template', query=b'name=Milvago')
+        self.assertEqual(body, b'<p>Hello Milvago</p>')
+        self.assertTrue(headers['content-type'].startswith('text/html'))
+
+    def test_static(self):
+        status, headers, body = request(self.app, 'GET', '/static/file.txt')
+        self.assertEqual((status, body), (200, b'static ' * 10000))
+
+    def test_static_pathsend(self):
+        scope, receive, send, messages = call(self.app, 'GET', '/cold/file.txt')
+        scope['extensions'] = {'http.response.pathsend': {}}
+        asyncio.run(self.app(scope, receive, send))
+        self.assertEqual(messages[1], {
+            'type': 'http.response.pathsend',
+            'path': os.path.join(os.path.abspath(STATIC), 'file.txt')
+        })
+        self.assertIn((b'content-length', b'70000'), messages[0]['headers'])
+        status, headers, body = request(self.app, 'GET', '/cold/file.txt')
+        self.assertEqual(body, b'static ' * 10000)
+
+    def test_not_allowed_and_not_found(self):
+        self.assertEqual(request(self.app, 'DELETE', '/async_class')[0], 405)
+        self.assertEqual(request(self.app, 'GET', '/missing')[0], 404)
+
+    def test_async_handlers_run_concurrently(self):
+        async def many():
+            pending = []
+            for i in range(20):
+                scope, receive, send, messages = call(self.app, 'GET', f'/async/{i}')
+                pending.append((self.app(scope, receive, send), messages, i))
+            await asyncio.gather(*[p[0] for p in pending])
+            return [(parse(p[1])[2], p[2]) for p in pending]
+        started = time.monotonic()
+        results = asyncio.run(many())
+        self.assertLess(time.monotonic() - started, 1.5)
+        for body, i in results:
+            self.assertEqual(body, f'GET {i} None'.encode())
+
+    def test_wsgi_rejects_async_handlers(self):
+        with self.assertRaises(UnsupportedHandlerException):
+            milvago.Milvago([async_function()])()
+
+    def test_same_output_in_wsgi(self):
+        client = testing.TestClient(milvago.Milvago(
+            [template()], template_dir=TEMPLATES)())
+        result = client.simulate_get('/template', params={'name': 'Milvago'})
+        self.assertEqual(result.content, request(
+            self.app, 'GET', '/template', query=b'name=Milvago')[2])
@@ -0,0 +1,105 @@
+import time
+import unittest
+from falcon import testing
+import milvago
+from milvago.server.cache import CachedResponse
+
+CALLS = []
+
+
+@milvago.expose_web('/cached/{name}', cache=milvago.CachePolicy(ttl=60, vary=['lang']))
+def cached(web):
+    CALLS.append(web.uri_data['name'])
+    web.set_content_type('json')
+    web.set_headers(**{'X-Lang': str(web.request.params.get('lang'))})
+    return f'{{"name": "{web.uri_data["name"]}", "lang": "{web.request.params.get("lang")}"}}'
+
+
+@milvago.expose_web('/short', cache=milvago.CachePolicy(ttl=0.05))
+def short(web):
+    CALLS.append('short')
+    return 'short'
+
+
+@milvago.expose_web('/missing', cache=milvago.CachePolicy(ttl=60))
+def missing(web):
+    CALLS.append('missing')
+    web.set_status(404)
+    return 'missing'
+
+
+class TestResponseCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.milvago = milvago.Milvago([cached(), short(), missing()])
+        cls.client = testing.TestClient(cls.milvago())
+
+    def setUp(self):
+        self.milvago.response_cache.invalidate()
+        CALLS.clear()
+
+    def test_hit(self):
+        first = self.client.simulate_get('/cached/a', params={'lang': 'en', 'x': '1'})
+        second = self.client.simulate_get('/cached/a', params={'lang': 'en', 'x': '2'})
+        self.assertEqual(CALLS, ['a'])
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second.headers['content-type'], 'application/json')
+        self.assertEqual(second.headers['x-lang'], 'en')
+        self.assertEqual(first.headers['etag'], second.headers['etag'])
+        stats = self.milvago.response_cache.stats()
+        self.assertEqual((stats['hits'] >= 1, stats['entries']), (True, 1))
+
+    def test_vary(self):
+        self.client.simulate_get('/cached/a', params={'lang': 'en'})
+        result = self.client.simulate_get('/cached/a', params={'lang': 'de'})
+        self.client.simulate_get('/cached/b', params={'lang': 'de'})
+        self.assertEqual(CALLS, ['a', 'a', 'b'])
+        self.assertIn(b'"de"', result.content)
+
+    def test_not_modified(self):
+        etag = self.client.simulate_get('/cached/a').headers['etag']
+        result = self.client.simulate_get('/cached/a', headers={'If-None-Match': etag})
+        self.assertEqual((result.status_code, result.content), (304, b''))
+        self.assertEqual(CALLS, ['a'])
+
+    def test_ttl(self):
+        self.client.simulate_get('/short')
+        self.client.simulate_get('/short')
+        time.sleep(0.1)
+        self.client.simulate_get('/short')
+        self.assertEqual(CALLS, ['short', 'short'])
+
+    def test_errors_are_not_cached(self):
+        self.client.simulate_get('/missing')
+        self.assertEqual(self.client.simulate_get('/missing').status_code, 404)
+        self.assertEqual(CALLS, ['missing', 'missing'])
+
+    def test_invalidate(self):
+        handler = self.milvago._handler_list[0]
+        self.client.simulate_get('/cached/a')
+        self.client.simulate_get('/cached/b')
+        self.assertEqual(handler.invalidate_cache('/cached/a'), 1)
+        self.client.simulate_get('/cached/a')
+        self.client.simulate_get('/cached/b')
+        self.assertEqual(CALLS, ['a', 'b', 'a'])
+
+
+class TestLRU(unittest.TestCase):
+
+    def test_eviction_by_size(self):
+        cache = milvago.ResponseCache(max_bytes=3000)
+        for i in range(5):
+            cache.put(('r', str(i), '', ()), CachedResponse(
+                b'x' * 700, None, '200 OK', {}, None, time.monotonic() + 60))
+        self.assertEqual(len(cache), 3)
+        self.assertLessEqual(cache.size, 3000)
+        self.assertEqual(cache.evictions, 2)
+        self.assertIsNone(cache.get(('r', '0', '', ())))
+        self.assertIsNotNone(cache.get(('r', '4', '', ())))
+
+    def test_oversized_entry_is_skipped(self):
+        cache = milvago.ResponseCache(max_bytes=100)
+        cache.put(('r', '/', '', ()), CachedResponse(
+            b'x' * 700, None, '200 OK', {}, None, time.monotonic() + 60))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,145 @@
+import time
+import threading
+import unittest
+import falcon
+from falcon import testing
+import milvago
+from milvago.server.coalesce import CoalescePolicy
+
+
+class TextSerializer(milvago.Serializer):
+    __slots__ = []
+
+    def __init__(self):
+        milvago.Serializer.__init__(self, 'text/plain')
+
+    def dumps(self, obj):
+        return repr(obj).encode()
+
+
+class TestCoalesce(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.delay = 0.3
+
+        def handle(web):
+            with self.lock:
+                self.calls += 1
+                call = self.calls
+            time.sleep(self.delay)
+            if web.request.get_param('fail') and call == 1:
+                raise falcon.HTTPServiceUnavailable()
+            web.set_headers(**{'X-Call': str(call)})
+            return {'call': call, 'page': web.request.get_param('page')}
+
+        @milvago.expose_web('/page', coalesce=CoalescePolicy(vary=['page']))
+        def page(web):
+            return handle(web)
+
+        @milvago.expose_web('/short', coalesce=CoalescePolicy(timeout=0.05))
+        def short(web):
+            return handle(web)
+
+        @milvago.expose_web('/cached', coalesce=True,
+                            cache=milvago.CachePolicy(ttl=60))
+        def cached(web):
+            return handle(web)
+
+        @milvago.expose_web('/tagged', coalesce=True)
+        def tagged(web):
+            web.set_headers(ETag='"v1"')
+            return handle(web)
+
+        self.handlers = [page(), short(), cached(), tagged()]
+        self.client = testing.TestClient(milvago.Milvago(
+            self.handlers,
+            serializers=[milvago.JsonSerializer(), TextSerializer()]
+        )())
+
+    def burst(self, path, count, query=None, headers=None):
+        """Sends count concurrent GETs, released at once."""
+        barrier = threading.Barrier(count)
+        results = [None] * count
+
+        def request(index):
+            barrier.wait(5)
+            results[index] = self.client.simulate_get(
+                path, query_string=query(index) if query else None,
+                headers=headers(index) if headers else None
+            )
+
+        threads = [threading.Thread(target=request, args=(index,))
+                   for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_single_execution(self):
+        results = self.burst('/page', 50, lambda index: 'page=1')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({result.status_code for result in results}, {200})
+        self.assertEqual({result.text for result in results},
+                         {'{"call":1,"page":"1"}'})
+        self.assertEqual({result.headers['x-call'] for result in results},
+                         {'1'})
+        flights = self.handlers[0].coalesced
+        self.assertEqual((flights.executed, flights.shared), (1, 49))
+
+    def test_different_keys(self):
+        results = self.burst('/page', 4, lambda index: f'page={index % 2}')
+        self.assertEqual(self.calls, 2)
+        self.assertEqual({result.json['page'] for result in results},
+                         {'0', '1'})
+
+    def test_accept(self):
+        results = self.burst('/page', 4, headers=lambda index: {
+            'Accept': ('application/json', 'text/plain')[index % 2]
+        })
+        self.assertEqual(self.calls, 2)
+        for index, result in enumerate(results):
+            self.assertEqual(result.headers['content-type'],
+                             ('application/json', 'text/plain')[index % 2])
+
+    def test_etag_is_shared(self):
+        results = self.burst('/tagged', 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({result.headers['etag'] for result in results},
+                         {'"v1"'})
+        results = self.burst('/tagged', 5,
+                             headers=lambda index: {'If-None-Match': '"v1"'})
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(sorted(result.status_code for result in results),
+                         [200] + [304] * 4)
+
+    def test_timeout(self):
+        results = self.burst('/short', 2)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual({result.json['call'] for result in results}, {1, 2})
+        self.assertEqual(self.handlers[1].coalesced.timeouts, 1)
+
+    def test_failed_leader(self):
+        results = self.burst('/page', 3, lambda index: 'fail=1')
+        self.assertEqual(sorted(result.status_code for result in results),
+                         [200, 200, 503])
+        self.assertEqual(self.calls, 3)
+
+    def test_sequential_requests_run(self):
+        self.delay = 0
+        self.client.simulate_get('/page')
+        self.client.simulate_get('/page')
+        self.assertEqual(self.calls, 2)
+
+    def test_cache_misses(self):
+        results = self.burst('/cached', 10)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual({result.json['call'] for result in results}, {1})
+        self.assertEqual(self.client.simulate_get('/cached').json['call'], 1)
+        self.assertEqual(self.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+from falcon import testing
+import milvago
+from milvago.server.conditional import etag_matches
+
+PAYLOAD = json.dumps([{'id': i, 'name': 'milvago'} for i in range(200)])
+
+
+@milvago.expose_web('/json', etag=True)
+def as_json(web):
+    web.set_content_type('json')
+    return PAYLOAD
+
+
+@milvago.expose_web('/weak')
+def weak(web):
+    web.set_headers(ETag='W/"v1"')
+    if etag_matches(web.request, 'v1'):
+        web.set_status(304)
+        return None
+    web.set_content_type('json')
+    return PAYLOAD
+
+
+@milvago.expose_web('/small')
+def small(web):
+    return 'small'
+
+
+@milvago.expose_web('/stream')
+def stream(web):
+    web.set_content_type('text')
+    web.response.stream = (f'line {i}\n'.encode() for i in range(500))
+
+
+class TestCompression(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.static_dir = tempfile.mkdtemp()
+        with open(os.path.join(cls.static_dir, 'app.js'), 'w') as f:
+            f.write('console.log("plain");')
+        with gzip.open(os.path.join(cls.static_dir, 'app.js.gz'), 'wb') as f:
+            f.write(b'console.log("gzipped");')
+        # same size and modification time, hence the same ETag
+        for name in ('a.css', 'b.css'):
+            path = os.path.join(cls.static_dir, name)
+            with open(path, 'w') as f:
+                f.write(f'.{name[0]} {{ color: red; }}\n' * 200)
+            os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+        cls.milvago = milvago.Milvago(
+            [as_json(), weak(), small(), stream(),
+             milvago.expose_static('/static', cls.static_dir)],
+            compression=milvago.CompressionPolicy(cache_bytes=1024 * 1024)
+        )
+        cls.client = testing.TestClient(cls.milvago())
+        cls.middleware = cls.milvago.compression
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.static_dir)
+
+    def get(self, path, **headers):
+        return self.client.simulate_get(path, headers=headers)
+
+    def test_gzip(self):
+        result = self.get('/json', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(result.headers['content-encoding'], 'gzip')
+        self.assertEqual(result.headers['vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(result.content).decode(), PAYLOAD)
+        self.assertLess(len(result.content), len(PAYLOAD))
+
+    def test_not_accepted(self):
+        for headers in ({}, {'Accept-Encoding': 'gzip;q=0, identity'}):
+            result = self.get('/json', **headers)
+            self.assertNotIn('content-encoding', result.headers)
+            self.assertEqual(result.text, PAYLOAD)
+
+    def test_small_body(self):
+        result = self.get('/small', **{'Accept-Encoding': 'gzip'})
+        self.assertNotIn('content-encoding', result.headers)
+        self.assertEqual(result.text, 'small')
+
+    def test_stream(self):
+        result = self.get('/stream', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(result.headers['content-encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(result.content).decode(),
+            ''.join(f'line {i}\n' for i in range(500))
+        )
+
+    def test_cache_and_etag(self):
+        cache = self.middleware.cache
+        hits = cache.hits
+        first = self.get('/json', **{'Accept-Encoding': 'gzip'})
+        second = self.get('/json', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(first.content, second.content)
+        self.assertGreater(cache.hits, hits)
+        etag = first.headers['etag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        result = self.get('/json', **{'Accept-Encoding': 'gzip',
+                                      'If-None-Match': etag})
+        self.assertEqual(result.status_code, 304)
+
+    def test_weak_etag(self):
+        result = self.get('/weak', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(result.headers['etag'], 'W/"v1-gzip"')
+        result = self.get('/weak', **{'Accept-Encoding': 'gzip',
+                                      'If-None-Match': result.headers['etag']})
+        self.assertEqual(result.status_code, 304)
+
+    def test_precompressed_static(self):
+        result = self.get('/static/app.js', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(result.headers['content-encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(result.content),
+                         b'console.log("gzipped");')
+        plain = self.get('/static/app.js')
+        self.assertEqual(result.headers['content-type'],
+                         plain.headers['content-type'])
+        self.assertNotIn('content-encoding', plain.headers)
+        self.assertEqual(plain.text, 'console.log("plain");')
+        self.assertEqual(plain.headers['vary'], 'Accept-Encoding')
+
+    def test_cache_keeps_files_with_the_same_etag_apart(self):
+        first = self.get('/static/a.css', **{'Accept-Encoding': 'gzip'})
+        second = self.get('/static/b.css', **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(first.headers['etag'], second.headers['etag'])
+        self.assertEqual(gzip.decompress(first.content).decode(),
+                         '.a { color: red; }\n' * 200)
+        self.assertEqual(gzip.decompress(second.content).decode(),
+                         '.b { color: red; }\n' * 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
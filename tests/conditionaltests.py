@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from falcon import testing
+import milvago
+
+STATIC = tempfile.mkdtemp()
+CONTENTS = bytes(range(256)) * 40
+with open(os.path.join(STATIC, 'file.bin'), 'wb') as f:
+    f.write(CONTENTS)
+os.makedirs(os.path.join(STATIC, 'css'))
+with open(os.path.join(STATIC, 'css', 'style.css'), 'w') as f:
+    f.write('body {}')
+
+
+@milvago.expose_web('/validated', etag=True)
+def validated(web):
+    return 'Hello Milvago!'
+
+
+@milvago.expose_web('/plain')
+def plain(web):
+    return 'Hello Milvago!'
+
+
+class TestHandlerValidators(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = testing.TestClient(milvago.Milvago([validated(), plain()])())
+
+    def test_opt_in(self):
+        self.assertNotIn('etag', self.client.simulate_get('/plain').headers)
+        self.assertIn('etag', self.client.simulate_get('/validated').headers)
+
+    def test_not_modified(self):
+        etag = self.client.simulate_get('/validated').headers['etag']
+        result = self.client.simulate_get('/validated', headers={'If-None-Match': etag})
+        self.assertEqual((result.status_code, result.content), (304, b''))
+        result = self.client.simulate_get('/validated', headers={'If-None-Match': '"other"'})
+        self.assertEqual(result.status_code, 200)
+
+    def test_range(self):
+        result = self.client.simulate_get('/validated', headers={'Range': 'bytes=6-12'})
+        self.assertEqual((result.status_code, result.text), (206, 'Milvago'))
+        self.assertEqual(result.headers['content-range'], 'bytes 6-12/14')
+        result = self.client.simulate_get('/validated', headers={'Range': 'bytes=-1'})
+        self.assertEqual(result.text, '!')
+        result = self.client.simulate_get('/validated', headers={'Range': 'bytes=100-'})
+        self.assertEqual(result.status_code, 416)
+
+    def test_if_range(self):
+        etag = self.client.simulate_get('/validated').headers['etag']
+        result = self.client.simulate_get(
+            '/validated', headers={'Range': 'bytes=0-4', 'If-Range': etag})
+        self.assertEqual(result.status_code, 206)
+        result = self.client.simulate_get(
+            '/validated', headers={'Range': 'bytes=0-4', 'If-Range': '"stale"'})
+        self.assertEqual((result.status_code, result.text), (200, 'Hello Milvago!'))
+
+
+class TestStaticValidators(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = testing.TestClient(milvago.Milvago(
+            [milvago.expose_static('/static', STATIC)])())
+
+    def test_full(self):
+        result = self.client.simulate_get('/static/file.bin')
+        self.assertEqual(result.content, CONTENTS)
+        self.assertIn('etag', result.headers)
+        self.assertIn('last-modified', result.headers)
+        self.assertEqual(result.headers['accept-ranges'], 'bytes')
+        result = self.client.simulate_get('/static/css/style.css')
+        self.assertEqual(result.headers['content-type'], 'text/css')
+
+    def test_not_modified(self):
+        first = self.client.simulate_get('/static/file.bin')
+        result = self.client.simulate_get(
+            '/static/file.bin', headers={'If-None-Match': first.headers['etag']})
+        self.assertEqual((result.status_code, result.content), (304, b''))
+        result = self.client.simulate_get(
+            '/static/file.bin',
+            headers={'If-Modified-Since': first.headers['last-modified']})
+        self.assertEqual(result.status_code, 304)
+        result = self.client.simulate_get(
+            '/static/file.bin',
+            headers={'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'})
+        self.assertEqual(result.status_code, 200)
+
+    def test_range(self):
+        result = self.client.simulate_get('/static/file.bin', headers={'Range': 'bytes=100-199'})
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual(result.content, CONTENTS[100:200])
+        self.assertEqual(result.headers['content-length'], '100')
+        self.assertEqual(result.headers['content-range'], f'bytes 100-199/{len(CONTENTS)}')
+        result = self.client.simulate_get('/static/file.bin', headers={'Range': 'bytes=-10'})
+        self.assertEqual(result.content, CONTENTS[-10:])
+        result = self.client.simulate_get('/static/file.bin', headers={'Range': 'bytes=999999-'})
+        self.assertEqual(result.status_code, 416)
+
+    def test_head(self):
+        result = self.client.simulate_head('/static/file.bin')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.headers['content-length'], str(len(CONTENTS)))
+
+    def test_invalid(self):
+        self.assertEqual(self.client.simulate_get('/static/../conditionaltests.py').status_code, 404)
+        self.assertEqual(self.client.simulate_get('/static/missing').status_code, 404)
+        self.assertEqual(self.client.simulate_get('/static/css').status_code, 404)
+        self.assertEqual(self.client.simulate_post('/static/file.bin').status_code, 405)
@@ -0,0 +1,76 @@
+import time
+import random
+import unittest
+import threading
+from falcon import testing
+import milvago
+
+
+@milvago.expose_web('/echo/{name}', 'get, post')
+def echo(web):
+    name = web.uri_data['name']
+    time.sleep(random.random() / 1000)
+    web.set_headers(**{'X-Name': name})
+    return f"{web.request.method} {name} {web.request.params.get('q')}"
+
+
+class ClassEcho(milvago.HttpMlv):
+
+    def __init__(self):
+        milvago.HttpMlv.__init__(self, '/class_echo/{name}')
+
+    def get(self):
+        name = self.uri_data['name']
+        time.sleep(random.random() / 1000)
+        if name.endswith('7'):
+            self.set_status(404)
+        return f"{name} {self.request.params.get('q')}"
+
+    def post(self, web):
+        return f"{web.uri_data['name']} {self.request.method}"
+
+
+class TestRequestContext(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app = milvago.Milvago([echo(), ClassEcho()])
+        cls.client = testing.TestClient(app())
+
+    def test_function_handler(self):
+        result = self.client.simulate_get('/echo/abc', params={'q': '1'})
+        self.assertEqual(result.text, 'GET abc 1')
+        self.assertEqual(result.headers.get('x-name'), 'abc')
+        result = self.client.simulate_post('/echo/def')
+        self.assertEqual(result.text, 'POST def None')
+
+    def test_class_handler(self):
+        result = self.client.simulate_get('/class_echo/abc', params={'q': '2'})
+        self.assertEqual(result.text, 'abc 2')
+        result = self.client.simulate_post('/class_echo/abc')
+        self.assertEqual(result.text, 'abc POST')
+
+    def test_status_does_not_stick(self):
+        self.assertEqual(self.client.simulate_get('/class_echo/7').status_code, 404)
+        self.assertEqual(self.client.simulate_get('/class_echo/8').status_code, 200)
+
+    def test_no_state_leaks_between_threads(self):
+        errors = []
+
+        def worker(number):
+            for i in range(200):
+                name = f"{number}x{i}"
+                result = self.client.simulate_get(f'/echo/{name}', params={'q': name})
+                if result.text != f"GET {name} {name}" \
+                        or result.headers.get('x-name') != name:
+                    errors.append((name, result.text))
+                result = self.client.simulate_get(f'/class_echo/{name}', params={'q': i})
+                if result.text != f"{name} {i}":
+                    errors.append((name, result.text))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
@@ -0,0 +1,205 @@
+import gc
+import time
+import weakref
+import asyncio
+import tempfile
+import threading
+import unittest
+import falcon
+from falcon import testing
+import milvago
+from milvago.server.deadlines import Deadline, Timeout
+from milvago.server.metrics import Metrics
+
+
+def sample(text, name, **labels):
+    """The value of a sample in the Prometheus text format."""
+    rendered = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f'{name}{{{rendered}}} '
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+class TestDeadline(unittest.TestCase):
+
+    def test_remaining(self):
+        deadline = Deadline.after(10)
+        self.assertGreater(deadline.remaining, 9)
+        self.assertFalse(deadline.expired)
+        deadline.check()
+        expired = Deadline.after(-1)
+        self.assertEqual(expired.remaining, 0)
+        with self.assertRaises(falcon.HTTPGatewayTimeout):
+            expired.check()
+
+    def test_guard(self):
+        first, second = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+        deadline = Deadline.after(10)
+        deadline.guard(first)
+        response = falcon.Response()
+        response.stream = second
+        deadline.abandon(response)
+        self.assertTrue(first.closed and second.closed)
+        self.assertIsNone(response.stream)
+        # nothing is handed to an abandoned response
+        third = tempfile.TemporaryFile()
+        with self.assertRaises(falcon.HTTPGatewayTimeout):
+            deadline.guard(third)
+        self.assertTrue(third.closed)
+
+    def test_timeouts_are_not_kept_alive(self):
+        reference = weakref.ref(Timeout(1))
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def test_coroutines_are_cancelled(self):
+        cancelled = []
+
+        async def handler(context):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(context.deadline.expired)
+                raise
+
+        class Context:
+            request = falcon.Request(testing.create_environ())
+            response = falcon.Response()
+            deadline = None
+
+        timed = Timeout(0.05).wrap('/async', handler)
+        started = time.monotonic()
+        with self.assertRaises(falcon.HTTPGatewayTimeout):
+            asyncio.run(timed(Context()))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(cancelled, [True])
+
+
+class TestTimeout(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.steps = []
+        timeout = Timeout(0.1, workers=1)
+
+        @milvago.expose_web('/slow', timeout=timeout)
+        def slow(web):
+            for step in range(50):
+                if self.release.wait(0.02):
+                    break
+                web.deadline.check()
+                self.steps.append(step)
+            return {'remaining': web.deadline.remaining}
+
+        @milvago.expose_web('/fast', timeout=1)
+        def fast(web):
+            return {'remaining': web.deadline.remaining}
+
+        self.late = []
+
+        @milvago.expose_web('/late', timeout=0.05)
+        def late(web):
+            self.release.wait(5)
+            fileobj = tempfile.TemporaryFile()
+            try:
+                web.send_file(fileobj)
+            except falcon.HTTPGatewayTimeout:
+                self.late.append(fileobj.closed)
+            self.late.append(web.response.stream)
+
+        @milvago.expose_web('/sent', timeout=0.05)
+        def sent(web):
+            fileobj = tempfile.TemporaryFile()
+            web.send_file(fileobj)
+            self.release.wait(5)
+            self.late.append(fileobj.closed)
+
+        self.metrics = Metrics()
+        self.handlers = [slow(), fast(), late(), sent()]
+        self.client = testing.TestClient(milvago.Milvago(
+            self.handlers, metrics=self.metrics
+        )())
+
+    def test_fast(self):
+        result = self.client.simulate_get('/fast')
+        self.assertLessEqual(result.json['remaining'], 1)
+        self.assertEqual(self.handlers[1].timeout.expired, {})
+
+    def test_expired(self):
+        started = time.monotonic()
+        result = self.client.simulate_get('/slow')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(result.status_code, 504)
+        # the handler gives up on its own soon after
+        time.sleep(0.1)
+        steps = len(self.steps)
+        time.sleep(0.1)
+        self.assertEqual(len(self.steps), steps)
+        self.assertLess(steps, 10)
+        self.assertEqual(self.handlers[0].timeout.expired, {'/slow': 1})
+        self.assertEqual(sample(
+            self.metrics.render(), 'milvago_request_timeouts_total',
+            route='/slow'
+        ), 1)
+
+    def test_response_is_left_alone_after_the_deadline(self):
+        result = self.client.simulate_get('/late')
+        self.assertEqual(result.status_code, 504)
+        self.release.set()
+        for _ in range(100):
+            if len(self.late) == 2:
+                break
+            time.sleep(0.01)
+        # the file is closed rather than left in the sent response
+        self.assertEqual(self.late, [True, None])
+
+    def test_unsent_file_is_closed_by_the_deadline(self):
+        # the file was handed to the response before the deadline,
+        # the 504 replaces the response and closes it
+        result = self.client.simulate_get('/sent')
+        self.assertEqual(result.status_code, 504)
+        self.release.set()
+        for _ in range(100):
+            if self.late:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.late, [True])
+
+    def test_header(self):
+        self.release.set()
+        result = self.client.simulate_get(
+            '/fast', headers={'X-Request-Timeout': '0.25'}
+        )
+        self.assertLessEqual(result.json['remaining'], 0.25)
+        # a client can't extend the deadline of the route
+        result = self.client.simulate_get(
+            '/fast', headers={'X-Request-Timeout': '60'}
+        )
+        self.assertLessEqual(result.json['remaining'], 1)
+        result = self.client.simulate_get(
+            '/slow', headers={'X-Request-Timeout': '0'}
+        )
+        self.assertEqual(result.status_code, 504)
+
+    def test_queued_requests_are_cancelled(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.client.simulate_get('/slow').status_code
+            )) for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, [504] * 3)
+        time.sleep(0.2)
+        # the single thread of the pool only ran the handler once or
+        # twice, the requests still waiting for it were cancelled
+        self.assertLess(self.steps.count(0), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from falcon import testing
+import milvago
+
+
+@milvago.expose_web('/get_only')
+def get_only(web):
+    return 'This is GET'
+
+
+@milvago.expose_web('/many', 'get, post, patch')
+def many(web):
+    return f'This is {web.request.method}'
+
+
+class ClassBased(milvago.HttpMlv):
+
+    def __init__(self):
+        milvago.HttpMlv.__init__(self, '/class')
+
+    def get(self):
+        return 'class GET'
+
+    def put(self, web):
+        return f'class {web.request.method}'
+
+
+class TestDispatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.handlers = [get_only(), many(), ClassBased()]
+        cls.client = testing.TestClient(milvago.Milvago(cls.handlers)())
+
+    def test_dispatch_table(self):
+        self.assertEqual(sorted(self.handlers[1].dispatch), ['GET', 'PATCH', 'POST'])
+        self.assertEqual(sorted(self.handlers[2].dispatch), ['GET', 'PUT'])
+        with self.assertRaises(TypeError):
+            self.handlers[0].dispatch['POST'] = None
+
+    def test_declared_methods(self):
+        self.assertEqual(self.client.simulate_patch('/many').text, 'This is PATCH')
+        self.assertEqual(self.client.simulate_get('/class').text, 'class GET')
+        self.assertEqual(self.client.simulate_put('/class').text, 'class PUT')
+
+    def test_undeclared_method(self):
+        result = self.client.simulate_post('/get_only')
+        self.assertEqual(result.status_code, 405)
+        self.assertEqual(result.headers['allow'], 'GET, OPTIONS')
+        result = self.client.simulate_delete('/class')
+        self.assertEqual(result.status_code, 405)
+        self.assertEqual(result.headers['allow'], 'GET, PUT, OPTIONS')
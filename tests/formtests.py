@@ -0,0 +1,143 @@
+import io
+import unittest
+import tracemalloc
+from falcon import testing
+import milvago
+from milvago.server.forms import parse_multipart
+
+BOUNDARY = 'milvago-boundary'
+LIMITS = {
+    'small': milvago.FormLimits(chunk_size=7, spool_size=64),
+    'strict': milvago.FormLimits(max_file_size=100, max_parts=3, max_body_size=4096),
+}
+
+
+def multipart(*parts):
+    body = b'preamble\r\n'
+    for name, value, filename in parts:
+        body += f'--{BOUNDARY}\r\n'.encode()
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        body += f'Content-Disposition: {disposition}\r\n'.encode()
+        if filename:
+            body += b'Content-Type: application/octet-stream\r\n'
+        body += b'\r\n' + value + b'\r\n'
+    return body + f'--{BOUNDARY}--\r\n'.encode()
+
+
+@milvago.expose_web('/upload', 'post')
+def upload(web):
+    limits = LIMITS.get(web.request.params.get('limits'))
+    result = []
+    for part in web.stream_form(limits):
+        result.append({
+            'name': part.name,
+            'filename': part.filename,
+            'size': part.size,
+            'value': part.value,
+            'spooled': getattr(part.file, '_rolled', False),
+        })
+    return result
+
+
+class LazyBody(io.RawIOBase):
+    """A multipart body with a large file, generated while read."""
+
+    def __init__(self, size):
+        self._head = f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="f"; ' \
+                     f'filename="big.bin"\r\n\r\n'.encode()
+        self._tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+        self._remaining = size
+
+    def read(self, size=-1):
+        if self._head:
+            head, self._head = self._head, b''
+            return head
+        if self._remaining:
+            chunk = min(size, self._remaining)
+            self._remaining -= chunk
+            return b'\xab' * chunk
+        tail, self._tail = self._tail, b''
+        return tail
+
+
+class TestForms(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = testing.TestClient(milvago.Milvago([upload()])())
+        cls.streaming = testing.TestClient(milvago.Milvago([upload()], parse_forms=False)())
+
+    def post(self, body, limits=None, content_type=None, client=None):
+        return (client or self.client).simulate_post(
+            '/upload',
+            params={'limits': limits} if limits else None,
+            body=body,
+            headers={'Content-Type': content_type or
+                     f'multipart/form-data; boundary={BOUNDARY}'})
+
+    def test_multipart(self):
+        body = multipart(('title', 'Milvágo'.encode(), None),
+                         ('file', b'\x00\r\n--not-a-boundary' * 10, 'data.bin'),
+                         ('empty', b'', None))
+        for limits in (None, 'small'):
+            result = self.post(body, limits)
+            self.assertEqual(result.status_code, 200)
+            title, upload, empty = result.json
+            self.assertEqual((title['name'], title['value'], title['filename']),
+                             ('title', 'Milvágo', None))
+            self.assertEqual((upload['filename'], upload['size']), ('data.bin', 190))
+            self.assertEqual(upload['spooled'], limits == 'small')
+            self.assertEqual((empty['name'], empty['size']), ('empty', 0))
+
+    def test_limits(self):
+        too_large = multipart(('file', b'x' * 101, 'data.bin'))
+        self.assertEqual(self.post(too_large, 'strict').status_code, 413)
+        too_many = multipart(*[(str(i), b'x', None) for i in range(4)])
+        self.assertEqual(self.post(too_many, 'strict').status_code, 413)
+        huge = multipart(('field', b'x' * 5000, None))
+        self.assertEqual(self.post(huge, 'strict').status_code, 413)
+
+    def test_malformed(self):
+        self.assertEqual(self.post(multipart(('a', b'b', None))[:-30]).status_code, 400)
+        self.assertEqual(self.post(b'', content_type='multipart/form-data').status_code, 400)
+        self.assertEqual(self.post(b'{}', content_type='application/json').status_code, 415)
+
+    def test_urlencoded(self):
+        body = 'name=Milv%C3%A1go&message=hello+there&empty='
+        result = self.post(body, 'small', 'application/x-www-form-urlencoded',
+                           self.streaming)
+        self.assertEqual([(part['name'], part['value']) for part in result.json],
+                         [('name', 'Milvágo'), ('message', 'hello there'), ('empty', '')])
+        # UTF-8 sent as it is rather than percent-encoded
+        result = self.post('name=Milvágo&ñ=a+b%2B'.encode(), 'small',
+                           'application/x-www-form-urlencoded', self.streaming)
+        self.assertEqual([(part['name'], part['value']) for part in result.json],
+                         [('name', 'Milvágo'), ('ñ', 'a b+')])
+
+    def test_urlencoded_parsed_by_falcon(self):
+        # with the default parse_forms=True the body falcon parsed
+        # into the params is streamed, the query string is left out
+        body = 'limits=small&name=Milv%C3%A1go&message=hello+there&tag=a&tag=b&empty='
+        result = self.post(body, 'small', 'application/x-www-form-urlencoded')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual([(part['name'], part['value']) for part in result.json],
+                         [('limits', 'small'), ('name', 'Milvágo'),
+                          ('message', 'hello there'), ('tag', 'a'), ('tag', 'b'),
+                          ('empty', '')])
+
+    def test_flat_memory(self):
+        size = 32 * 1024 * 1024
+        tracemalloc.start()
+        parts = list(parse_multipart(LazyBody(size), BOUNDARY))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertEqual((len(parts), parts[0].size), (1, size))
+        self.assertTrue(parts[0].file._rolled)
+        self.assertLess(peak, 4 * 1024 * 1024)
+        parts[0].close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import gc
+import json
+import weakref
+import asyncio
+import unittest
+from falcon import testing
+import milvago
+from milvago.server.resources import Resources
+from milvago.common.exceptions import UnknownResourceException
+
+
+class Pool:
+    """A fake connection pool."""
+
+    def __init__(self, name, events):
+        self.name = name
+        self.events = events
+        self.pid = os.getpid()
+        events.append(f'open {name}')
+
+    def close(self):
+        self.events.append(f'close {self.name}')
+
+
+class TestResources(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.resources = Resources()
+        self.resources.register('db', lambda: Pool('db', self.events))
+        self.resources.register(
+            'http',
+            lambda: Pool('http', self.events),
+            close=lambda pool: self.events.append('closed http'),
+            check=lambda pool: False
+        )
+
+    def test_created_once_on_first_use(self):
+        self.assertEqual(self.events, [])
+        self.assertIs(self.resources.db, self.resources.get('db'))
+        self.assertEqual(self.events, ['open db'])
+        self.assertEqual(self.resources.created, ['db'])
+
+    def test_unknown_and_duplicate(self):
+        with self.assertRaises(UnknownResourceException):
+            self.resources.cache
+        self.assertFalse(hasattr(self.resources, 'cache'))
+        self.assertIn('db', self.resources)
+        with self.assertRaises(ValueError):
+            self.resources.register('db', dict)
+
+    def test_close_in_reverse_order(self):
+        self.resources.http
+        self.resources.db
+        self.resources.close()
+        self.assertEqual(self.events[2:], ['close db', 'closed http'])
+        self.assertEqual(self.resources.created, [])
+
+    def test_health(self):
+        self.resources.register('broken', lambda: 1 / 0)
+        self.assertEqual(self.resources.health(), {
+            'db': 'ok',
+            'http': 'check failed',
+            'broken': 'ZeroDivisionError: division by zero'
+        })
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+    def test_not_shared_across_fork(self):
+        parent = self.resources.db
+        read, write = os.pipe()
+        pid = os.fork()
+        if not pid:
+            child = self.resources.db
+            os.write(write, json.dumps(
+                [child is parent, child.pid, self.events]
+            ).encode())
+            os._exit(0)
+        os.close(write)
+        with os.fdopen(read) as f:
+            shared, owner, events = json.loads(f.read())
+        os.waitpid(pid, 0)
+        self.assertFalse(shared)
+        self.assertEqual(owner, pid)
+        # the child creates its own pool and leaves the parent's alone
+        self.assertEqual(events, ['open db', 'open db'])
+
+
+class TestLifecycle(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        resources = Resources()
+        resources.register('db', lambda: Pool('db', self.events))
+
+        @milvago.expose_web('/')
+        def index(web):
+            web.defer(self.events.append, 'task')
+            return web.resources.db.name
+
+        self.milvago = milvago.Milvago(
+            [index()],
+            resources=resources,
+            on_startup=[lambda app: self.events.append('startup')],
+            on_shutdown=[
+                lambda app: self.events.append('first hook'),
+                lambda app: self.events.append('second hook')
+            ],
+            health_route='/health'
+        )
+        self.client = testing.TestClient(self.milvago())
+
+    def test_startup_on_first_request(self):
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.client.simulate_get('/').text, 'db')
+        self.client.simulate_get('/')
+        self.milvago.tasks.drain(5)
+        self.assertEqual(self.events[:2], ['startup', 'open db'])
+        self.assertTrue(self.milvago.lifecycle.started)
+
+    def test_shutdown(self):
+        self.client.simulate_get('/')
+        self.milvago.lifecycle.shutdown()
+        self.assertEqual(self.events, [
+            'startup', 'open db', 'task',
+            'second hook', 'first hook', 'close db'
+        ])
+        self.assertFalse(self.milvago.lifecycle.started)
+        # only once
+        self.milvago.lifecycle.shutdown()
+        self.assertEqual(len(self.events), 6)
+
+    def test_applications_are_not_kept_alive(self):
+        self.client.simulate_get('/')
+        self.milvago.lifecycle.shutdown()
+        references = [weakref.ref(self.milvago.lifecycle),
+                      weakref.ref(self.milvago.resources)]
+        del self.milvago, self.client
+        gc.collect()
+        self.assertEqual([reference() for reference in references],
+                         [None, None])
+
+    def test_failed_startup_is_retried(self):
+        failures = [ValueError('not yet')]
+
+        def hook(app):
+            if failures:
+                raise failures.pop()
+
+        @milvago.expose_web('/')
+        def index(web):
+            return 'ok'
+
+        client = testing.TestClient(
+            milvago.Milvago([index()], on_startup=[hook])()
+        )
+        with self.assertRaises(ValueError):
+            client.simulate_get('/')
+        self.assertEqual(client.simulate_get('/').text, 'ok')
+
+    def test_health(self):
+        result = self.client.simulate_get('/health')
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json, {
+            'status': 'ok', 'resources': {'db': 'ok'}
+        })
+        self.milvago.resources.register(
+            'cache', dict, check=lambda cache: False
+        )
+        result = self.client.simulate_get('/health')
+        self.assertEqual(result.status_code, 503)
+        self.assertEqual(result.json['resources']['cache'], 'check failed')
+
+    def test_asgi_lifespan(self):
+        events = []
+        app = milvago.Milvago(
+            [],
+            asgi=True,
+            on_startup=[lambda app: events.append('startup')],
+            on_shutdown=[lambda app: events.append('shutdown')]
+        )()
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(events, ['startup', 'shutdown'])
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import time
+import asyncio
+import threading
+import unittest
+import falcon
+from falcon import testing
+import milvago
+from milvago.server.limits import Limit
+from milvago.server.metrics import Metrics
+
+
+def sample(text, name, **labels):
+    """The value of a sample in the Prometheus text format."""
+    rendered = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f'{name}{{{rendered}}} '
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+class TestLimit(unittest.TestCase):
+
+    def hold(self, limit):
+        """Takes the only slot of limit until self.release is set."""
+        self.release = threading.Event()
+        taken = threading.Event()
+
+        def holder():
+            limit.acquire()
+            taken.set()
+            self.release.wait(5)
+            limit.release()
+
+        thread = threading.Thread(target=holder)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(self.release.set)
+        taken.wait(5)
+
+    def test_rate(self):
+        limit = Limit(rate=1, burst=2)
+        limit.acquire()
+        limit.acquire()
+        with self.assertRaises(falcon.HTTPTooManyRequests) as error:
+            limit.acquire()
+        self.assertEqual(error.exception.headers['Retry-After'], '1')
+        self.assertEqual(limit.shed, {'rate': 1})
+        self.assertEqual(limit.admitted, 2)
+
+    def test_concurrency(self):
+        limit = Limit(concurrency=1, retry_after=3)
+        self.hold(limit)
+        started = time.monotonic()
+        with self.assertRaises(falcon.HTTPServiceUnavailable) as error:
+            limit.acquire()
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(error.exception.headers['Retry-After'], '3')
+        self.assertEqual(limit.shed, {'concurrency': 1})
+
+    def test_queue(self):
+        limit = Limit(concurrency=1, queue_timeout=5)
+        self.hold(limit)
+        threading.Timer(0.1, self.release.set).start()
+        limit.acquire()
+        self.assertEqual(limit.in_flight, 1)
+        limit.release()
+        with self.assertRaises(falcon.HTTPServiceUnavailable):
+            Limit(concurrency=0, queue_timeout=0.05).acquire()
+
+    def test_standing_queue_cuts_the_wait(self):
+        limit = Limit(concurrency=1, queue_timeout=0.3, target=0.01,
+                      interval=0.05)
+        self.hold(limit)
+        # two intervals in which every request waits over the target
+        for _ in range(2):
+            with self.assertRaises(falcon.HTTPServiceUnavailable):
+                limit.acquire()
+            time.sleep(0.06)
+        with self.assertRaises(falcon.HTTPServiceUnavailable):
+            limit.acquire()
+        self.assertTrue(limit.standing)
+        started = time.monotonic()
+        with self.assertRaises(falcon.HTTPServiceUnavailable):
+            limit.acquire()
+        self.assertLess(time.monotonic() - started, 0.15)
+        # the queue drains, the whole queue_timeout is allowed again
+        self.release.set()
+        time.sleep(0.06)
+        limit.acquire()
+        limit.release()
+        self.assertFalse(limit.standing)
+
+    def test_coroutines_never_wait(self):
+        limit = Limit(concurrency=1, queue_timeout=5)
+        self.hold(limit)
+
+        async def handler(context):
+            return 'ok'
+
+        limited = limit.wrap('/async', handler)
+        with self.assertRaises(falcon.HTTPServiceUnavailable):
+            asyncio.run(limited(None))
+        self.release.set()
+        time.sleep(0.05)
+        self.assertEqual(asyncio.run(limited(None)), 'ok')
+
+
+class TestShedding(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.entered = threading.Event()
+
+        @milvago.expose_web('/slow', limit=Limit(concurrency=1))
+        def slow(web):
+            self.entered.set()
+            self.release.wait(5)
+            return 'slow'
+
+        @milvago.expose_web('/fast')
+        def fast(web):
+            return 'fast'
+
+        self.metrics = Metrics()
+        self.client = testing.TestClient(milvago.Milvago(
+            [slow(), fast()],
+            metrics=self.metrics,
+            limit=Limit(rate=1, burst=5)
+        )())
+
+    def test_slow_routes_dont_starve_fast_ones(self):
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(self.client.simulate_get('/slow'))
+        )
+        thread.start()
+        self.entered.wait(5)
+        rejected = self.client.simulate_get('/slow')
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.headers['retry-after'], '1')
+        self.assertEqual(self.client.simulate_get('/fast').text, 'fast')
+        self.release.set()
+        thread.join(5)
+        self.assertEqual(results[0].text, 'slow')
+        self.assertEqual(sample(
+            self.metrics.render(), 'milvago_requests_shed_total',
+            route='/slow', reason='concurrency'
+        ), 1)
+
+    def test_global_rate(self):
+        statuses = [self.client.simulate_get('/fast').status_code
+                    for _ in range(10)]
+        self.assertEqual(statuses[:5], [200] * 5)
+        self.assertEqual(statuses[5:], [429] * 5)
+        self.assertGreaterEqual(sample(
+            self.metrics.render(), 'milvago_requests_shed_total',
+            route='<global>', reason='rate'
+        ), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+import os
+import gc
+import json
+import weakref
+import shutil
+import tempfile
+import threading
+import unittest
+from falcon import testing
+import milvago
+from milvago.server.metrics import Metrics
+
+
+@milvago.expose_web('/hello')
+def hello(web):
+    return 'hello world'
+
+
+@milvago.expose_web('/items/{item}', methods='get,post')
+def items(web):
+    if web.uri_data['item'] == 'missing':
+        web.set_status(404)
+        return 'missing'
+    return {'item': web.uri_data['item']}
+
+
+def sample(text, name, **labels):
+    """The value of a sample in the Prometheus text format."""
+    rendered = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f'{name}{{{rendered}}} '
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.milvago = milvago.Milvago(
+            [hello(), items()],
+            metrics=Metrics(buckets=(0.5, 1.0))
+        )
+        self.client = testing.TestClient(self.milvago())
+
+    def scrape(self):
+        result = self.client.simulate_get('/metrics')
+        self.assertTrue(result.headers['content-type'].startswith(
+            'text/plain; version=0.0.4'
+        ))
+        return result.text
+
+    def test_histogram_and_statuses(self):
+        for _ in range(3):
+            self.client.simulate_get('/hello')
+        self.client.simulate_get('/items/missing')
+        text = self.scrape()
+        labels = {'route': '/hello', 'method': 'GET'}
+        self.assertEqual(sample(
+            text, 'milvago_request_duration_seconds_bucket',
+            **labels, le='0.5'
+        ), 3)
+        self.assertEqual(sample(
+            text, 'milvago_request_duration_seconds_bucket',
+            **labels, le='+Inf'
+        ), 3)
+        self.assertEqual(sample(
+            text, 'milvago_request_duration_seconds_count', **labels
+        ), 3)
+        self.assertEqual(sample(
+            text, 'milvago_responses_total', **labels, status='200'
+        ), 3)
+        self.assertEqual(sample(
+            text, 'milvago_responses_total',
+            route='/items/{item}', method='GET', status='404'
+        ), 1)
+        self.assertEqual(sample(
+            text, 'milvago_response_bytes_total', **labels
+        ), 3 * len('hello world'))
+
+    def test_request_bytes_and_in_flight(self):
+        self.client.simulate_post('/items/1', body=b'x' * 100)
+        text = self.scrape()
+        labels = {'route': '/items/{item}', 'method': 'POST'}
+        self.assertEqual(sample(
+            text, 'milvago_request_bytes_total', **labels
+        ), 100)
+        self.assertEqual(sample(
+            text, 'milvago_requests_in_flight', **labels
+        ), 0)
+        self.assertEqual(sample(
+            text, 'milvago_requests_in_flight',
+            route='/metrics', method='GET'
+        ), 1)
+
+    def test_unmatched(self):
+        self.client.simulate_get('/nowhere')
+        self.assertEqual(sample(
+            self.scrape(), 'milvago_responses_total',
+            route='<unmatched>', method='GET', status='404'
+        ), 1)
+
+    def test_thread_shards(self):
+        metrics = Metrics()
+
+        def record():
+            for _ in range(1000):
+                metrics.started('/', 'GET')
+                metrics.finished('/', 'GET', '200', 0.001, 1, 2)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = metrics.snapshot()['GET /']
+        self.assertEqual(stats['count'], 4000)
+        self.assertEqual(stats['statuses'], {'200': 4000})
+        self.assertEqual(stats['response_bytes'], 8000)
+        self.assertEqual(stats['in_flight'], 0)
+
+    def test_thread_churn(self):
+        metrics = Metrics()
+
+        def record():
+            metrics.started('/', 'GET')
+            metrics.finished('/', 'GET', '200', 0.001, 1, 2)
+
+        for _ in range(500):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        # the shards of the threads which ended are folded together
+        self.assertEqual(len(metrics._shards), 0)
+        stats = metrics.snapshot()['GET /']
+        self.assertEqual(stats['count'], 500)
+        self.assertEqual(stats['response_bytes'], 1000)
+        self.assertEqual(stats['in_flight'], 0)
+
+
+    def test_not_kept_alive(self):
+        metrics = Metrics()
+        metrics.finished('/', 'GET', '200', 0.001, in_flight=False)
+        reference = weakref.ref(metrics)
+        del metrics
+        gc.collect()
+        self.assertIsNone(reference())
+
+
+class TestMultiprocess(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_workers_are_merged(self):
+        metrics = Metrics(multiprocess_dir=self.directory)
+        metrics.finished('/', 'GET', '200', 0.01, in_flight=False)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                metrics.finished('/', 'GET', '500', 0.01, in_flight=False)
+                metrics.started('/', 'GET')
+                metrics.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        stats = metrics.collect()['GET /']
+        self.assertEqual(stats['count'], 2)
+        self.assertEqual(stats['statuses'], {'200': 1, '500': 1})
+        # the child has exited, its requests aren't in flight anymore
+        self.assertEqual(stats['in_flight'], 0)
+        # its file is folded into the one of the exited workers
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, f'{pid}.json')
+        ))
+        with open(os.path.join(self.directory, 'retired.json')) as f:
+            self.assertEqual(json.load(f)['routes']['GET /']['count'], 1)
+        stats = metrics.collect()['GET /']
+        self.assertEqual((stats['count'], stats['in_flight']), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+import unittest
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+SERVER = '''
+import os, sys, logging
+import milvago
+
+logging.basicConfig(level=logging.INFO)
+
+STARTED = []
+resources = milvago.Resources()
+resources.register('owner', os.getpid)
+
+
+@milvago.expose_web('/pid')
+def pid(web):
+    return str(os.getpid())
+
+
+@milvago.expose_web('/owner')
+def owner(web):
+    return f'{os.getpid()} {web.resources.owner} {STARTED[0]}'
+
+
+@milvago.expose_web('/crash')
+def crash(web):
+    os._exit(3)
+
+
+milvago.Milvago(
+    [pid(), owner(), crash()],
+    host='127.0.0.1',
+    port=int(sys.argv[1]),
+    workers=2,
+    max_requests=int(sys.argv[2]),
+    resources=resources,
+    on_startup=[lambda app: STARTED.append(os.getpid())]
+)()
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class TestPrefork(unittest.TestCase):
+
+    def start(self, max_requests=0):
+        self.port = free_port()
+        self.master = subprocess.Popen(
+            [sys.executable, '-c', SERVER, str(self.port), str(max_requests)],
+            cwd=ROOT,
+            stderr=subprocess.DEVNULL
+        )
+        self.addCleanup(self.stop)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                return self.get('/pid')
+            except OSError:
+                time.sleep(0.05)
+        self.fail('The server did not start')
+
+    def stop(self):
+        if self.master.poll() is None:
+            self.master.send_signal(signal.SIGTERM)
+            self.master.wait(10)
+
+    def get(self, path):
+        with urllib.request.urlopen(
+                f'http://127.0.0.1:{self.port}{path}', timeout=5) as response:
+            return response.read().decode()
+
+    def pids(self, requests=40):
+        return {self.get('/pid') for _ in range(requests)}
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            result = condition()
+            if result:
+                return result
+            time.sleep(0.1)
+        self.fail('Timed out')
+
+    def test_workers_share_the_socket(self):
+        self.start()
+        pids = self.wait_for(lambda: self.pids() if len(self.pids()) == 2
+                             else None)
+        self.assertNotIn(str(self.master.pid), pids)
+
+    def test_crashed_worker_is_replaced(self):
+        self.start()
+        before = self.wait_for(
+            lambda: self.pids() if len(self.pids()) == 2 else None
+        )
+        with self.assertRaises(OSError):
+            self.get('/crash')
+        self.wait_for(lambda: len(self.pids()) == 2
+                      and self.pids() != before)
+
+    def test_resources_and_startup_per_worker(self):
+        self.start()
+        for _ in range(10):
+            worker, resource, started = self.get('/owner').split()
+            self.assertEqual(worker, resource)
+            self.assertEqual(worker, started)
+
+    def test_max_requests(self):
+        first = self.start(max_requests=3)
+        self.wait_for(lambda: first not in self.pids(10))
+        # stopping while workers are being replaced, a worker forked
+        # at that moment must not miss its SIGTERM and hold the master
+        # for the whole graceful_timeout
+        for _ in range(6):
+            self.get('/pid')
+        self.master.send_signal(signal.SIGTERM)
+        self.assertEqual(self.master.wait(5), 0)
+
+    def test_reload(self):
+        self.start()
+        before = self.wait_for(
+            lambda: self.pids() if len(self.pids()) == 2 else None
+        )
+        self.master.send_signal(signal.SIGHUP)
+        self.wait_for(lambda: not (self.pids() & before))
+
+    def test_graceful_shutdown(self):
+        self.start()
+        self.master.send_signal(signal.SIGTERM)
+        self.assertEqual(self.master.wait(10), 0)
+        with self.assertRaises(OSError):
+            self.get('/pid')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import array
+import asyncio
+import unittest
+from falcon import testing
+import milvago
+from asgitests import request
+
+CALLS = []
+HELLO = milvago.PreparedResponse('Hello Milvago!', 'text', 201,
+                                 {'X-Prepared': 'yes'}, etag=True)
+
+
+@milvago.expose_web('/bytes')
+def as_bytes(web):
+    return b'\x00\x01binary'
+
+
+@milvago.expose_web('/view')
+def as_view(web):
+    return memoryview(array.array('H', [1, 2, 3]))
+
+
+@milvago.expose_web('/prepared')
+def prepared(web):
+    return HELLO
+
+
+@milvago.expose_web('/constant', 'get, head', etag=True, static_body=True)
+def constant(web):
+    CALLS.append(web.request.method)
+    web.set_content_type('json')
+    web.set_headers(**{'Cache-Control': 'max-age=60'})
+    return {'constant': True}
+
+
+@milvago.expose_web('/async_constant', static_body=True)
+async def async_constant(web):
+    await asyncio.sleep(0)
+    CALLS.append('async')
+    return 'async constant'
+
+
+class TestPreparedResponses(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        CALLS.clear()
+        handlers = [as_bytes(), as_view(), prepared(), constant()]
+        cls.client = testing.TestClient(milvago.Milvago(handlers)())
+        cls.asgi = milvago.Milvago(handlers + [async_constant()], asgi=True)()
+
+    def setUp(self):
+        self.calls = len(CALLS)
+
+    def tearDown(self):
+        self.assertEqual(len(CALLS), self.calls)
+
+    def test_bytes(self):
+        result = self.client.simulate_get('/bytes')
+        self.assertEqual(result.content, b'\x00\x01binary')
+        self.assertEqual(result.headers['content-length'], '8')
+        result = self.client.simulate_get('/view')
+        self.assertEqual(result.content, array.array('H', [1, 2, 3]).tobytes())
+        self.assertEqual(result.headers['content-length'], '6')
+
+    def test_prepared_response(self):
+        result = self.client.simulate_get('/prepared')
+        self.assertEqual((result.status_code, result.text), (201, 'Hello Milvago!'))
+        self.assertEqual(result.headers['x-prepared'], 'yes')
+        self.assertEqual(result.headers['content-type'], 'text/plain; charset=utf-8')
+        self.assertEqual(result.headers['etag'], f'"{HELLO.etag}"')
+
+    def test_static_body(self):
+        for _ in range(3):
+            result = self.client.simulate_get('/constant')
+            self.assertEqual(result.json, {'constant': True})
+        self.assertEqual(result.headers['content-type'], 'application/json')
+        self.assertEqual(result.headers['cache-control'], 'max-age=60')
+        head = self.client.simulate_head('/constant')
+        self.assertEqual((head.status_code, head.content), (200, b''))
+        again = self.client.simulate_get(
+            '/constant', headers={'If-None-Match': result.headers['etag']})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(CALLS.count('GET'), 2)
+
+    def test_static_body_asgi(self):
+        status, headers, body = request(self.asgi, 'GET', '/constant')
+        self.assertEqual((status, body), (200, b'{"constant":true}'))
+        status, headers, body = request(self.asgi, 'GET', '/async_constant')
+        self.assertEqual((status, body), (200, b'async constant'))
+        self.assertEqual(CALLS.count('async'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
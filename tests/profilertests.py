@@ -0,0 +1,106 @@
+import os
+import gc
+import time
+import weakref
+import signal
+import shutil
+import tempfile
+import unittest
+from falcon import testing
+import milvago
+
+TOKEN = 'secret'
+
+
+def slow_part():
+    time.sleep(0.05)
+
+
+@milvago.expose_web('/slow')
+def slow(web):
+    slow_part()
+    return 'done'
+
+
+@milvago.expose_web('/fast')
+def fast(web):
+    return 'fast'
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+        self.profiler = milvago.Profiler(
+            rate=1.0,
+            routes=['/slow'],
+            interval=0.001,
+            token=TOKEN,
+            signal_number=signal.SIGUSR2,
+            dump_dir=self.dump_dir
+        )
+        self.client = testing.TestClient(milvago.Milvago(
+            [slow(), fast()],
+            profiler=self.profiler
+        )())
+
+    def tearDown(self):
+        signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+        shutil.rmtree(self.dump_dir)
+
+    def profile(self, **params):
+        return self.client.simulate_get(
+            '/_milvago/profile',
+            params=params,
+            headers={'Authorization': f'Bearer {TOKEN}'}
+        )
+
+    def test_stacks_are_collapsed(self):
+        self.client.simulate_get('/slow')
+        self.client.simulate_get('/fast')
+        self.assertGreater(self.profiler.samples, 0)
+        lines = self.profile().text.splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, _, count = line.rpartition(' ')
+            self.assertTrue(stack.startswith('/slow;slow '))
+            self.assertIn(';slow_part ', stack)
+            self.assertGreater(int(count), 0)
+
+    def test_token_is_required(self):
+        result = self.client.simulate_get('/_milvago/profile')
+        self.assertEqual(result.status_code, 401)
+        result = self.client.simulate_get(
+            '/_milvago/profile',
+            headers={'Authorization': 'Bearer wrong'}
+        )
+        self.assertEqual(result.status_code, 401)
+
+    def test_reset(self):
+        self.client.simulate_get('/slow')
+        self.assertTrue(self.profile(reset='true').text)
+        self.assertEqual(self.profile().text, '')
+
+    def test_not_kept_alive(self):
+        reference = weakref.ref(milvago.Profiler())
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def test_unselected_routes_are_untouched(self):
+        def invoke(context):
+            return None
+
+        self.assertIs(self.profiler.wrap('/fast', invoke), invoke)
+        self.assertIsNot(self.profiler.wrap('/slow', invoke), invoke)
+
+    def test_signal_dump(self):
+        self.client.simulate_get('/slow')
+        os.kill(os.getpid(), signal.SIGUSR2)
+        dumps = os.listdir(self.dump_dir)
+        self.assertEqual(len(dumps), 1)
+        with open(os.path.join(self.dump_dir, dumps[0])) as f:
+            self.assertIn('slow_part', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import uuid
+import unittest
+from falcon import testing
+import milvago
+from milvago.common.exceptions import RouteConflictException
+
+
+class Resource:
+
+    def __init__(self, name):
+        self.name = name
+
+    def on_get(self, req, resp, **kwargs):
+        resp.body = self.name
+
+
+@milvago.expose_web('/users/{user_id:int}')
+def user(web):
+    user_id = web.uri_data['user_id']
+    return f'{type(user_id).__name__} {user_id}'
+
+
+@milvago.expose_web('/users/me')
+def me(web):
+    return 'me'
+
+
+@milvago.expose_web('/files/{name:path}')
+def files(web):
+    return web.uri_data['name']
+
+
+class TestRadixRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.router = milvago.RadixRouter(cache_size=16)
+
+    def add(self, template):
+        resource = Resource(template)
+        self.router.add_route(template, resource)
+        return resource
+
+    def find(self, path):
+        route = self.router.find(path)
+        if route is None:
+            return None, None
+        return route[0].name, route[2]
+
+    def test_static_wins(self):
+        self.add('/users/{name}')
+        self.add('/users/me')
+        self.assertEqual(self.find('/users/me'), ('/users/me', {}))
+        self.assertEqual(
+            self.find('/users/linus'),
+            ('/users/{name}', {'name': 'linus'})
+        )
+        self.assertEqual(self.find('/'), (None, None))
+        self.assertEqual(self.find('/users'), (None, None))
+
+    def test_converters(self):
+        self.add('/items/{item_id:int}')
+        self.add('/items/{key:uuid}')
+        self.add('/items/{slug}')
+        key = uuid.uuid4()
+        self.assertEqual(
+            self.find('/items/42'),
+            ('/items/{item_id:int}', {'item_id': 42})
+        )
+        self.assertEqual(
+            self.find(f'/items/{key}'),
+            ('/items/{key:uuid}', {'key': key})
+        )
+        self.assertEqual(
+            self.find('/items/hat'),
+            ('/items/{slug}', {'slug': 'hat'})
+        )
+
+    def test_converter_arguments(self):
+        self.add('/years/{year:int(4, min=1900)}')
+        self.assertEqual(self.find('/years/1999')[1], {'year': 1999})
+        self.assertEqual(self.find('/years/1899'), (None, None))
+
+    def test_backtracking(self):
+        self.add('/a/{x:int}/edit')
+        self.add('/a/{name}/view')
+        self.assertEqual(self.find('/a/1/view'), ('/a/{name}/view', {
+            'name': '1'
+        }))
+        self.assertEqual(self.find('/a/1/edit')[1], {'x': 1})
+
+    def test_path(self):
+        self.add('/static/{rest:path}')
+        self.add('/static/{name}/info')
+        self.assertEqual(
+            self.find('/static/css/site/main.css'),
+            ('/static/{rest:path}', {'rest': 'css/site/main.css'})
+        )
+        self.assertEqual(
+            self.find('/static/logo/info'),
+            ('/static/{name}/info', {'name': 'logo'})
+        )
+        with self.assertRaises(ValueError):
+            self.add('/{rest:path}/info')
+
+    def test_mixed_segment(self):
+        self.add('/reports/{name}.{ext}')
+        self.add('/reports/{name}')
+        self.assertEqual(
+            self.find('/reports/q1.csv')[1],
+            {'name': 'q1', 'ext': 'csv'}
+        )
+        self.assertEqual(self.find('/reports/q1')[1], {'name': 'q1'})
+
+    def test_conflicts(self):
+        self.add('/users/{name}')
+        with self.assertRaises(RouteConflictException):
+            self.add('/users/{user_id}')
+        with self.assertRaises(RouteConflictException):
+            self.add('/users/{name}')
+        with self.assertRaises(ValueError):
+            self.add('/users/{name}/{name}/x')
+        with self.assertRaises(ValueError):
+            self.add('/users/{id:nope}')
+
+    def test_lru(self):
+        self.add('/users/{name}')
+        for _ in range(3):
+            route = self.router.find('/users/linus')
+            route[2]['name'] = 'changed'
+        info = self.router.cache_info()
+        self.assertEqual((info.hits, info.misses), (2, 1))
+        self.assertEqual(self.find('/users/linus')[1], {'name': 'linus'})
+        self.add('/users/linus')
+        self.assertEqual(self.router.cache_info().currsize, 0)
+        self.assertEqual(self.find('/users/linus'), ('/users/linus', {}))
+
+
+class TestMilvagoRouter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = testing.TestClient(milvago.Milvago(
+            [user(), me(), files()],
+            router=milvago.RadixRouter()
+        )())
+
+    def test_uri_data_is_converted(self):
+        self.assertEqual(self.client.simulate_get('/users/7').text, 'int 7')
+        self.assertEqual(self.client.simulate_get('/users/me').text, 'me')
+        self.assertEqual(
+            self.client.simulate_get('/files/a/b.txt').text,
+            'a/b.txt'
+        )
+
+    def test_not_found_and_not_allowed(self):
+        self.assertEqual(
+            self.client.simulate_get('/nowhere').status_code, 404
+        )
+        self.assertEqual(
+            self.client.simulate_post('/users/7').status_code, 405
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
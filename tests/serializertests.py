@@ -0,0 +1,135 @@
+import json
+import datetime
+import unittest
+import dataclasses
+from falcon import testing
+import milvago
+from milvago.server import serializers
+
+
+@dataclasses.dataclass
+class Order:
+    id: int
+    created: datetime.date
+    items: list
+
+
+class CsvSerializer(milvago.Serializer):
+    __slots__ = []
+
+    def __init__(self):
+        milvago.Serializer.__init__(self, 'text/csv')
+
+    def dumps(self, obj):
+        return '\n'.join(','.join(map(str, row.values())) for row in obj).encode()
+
+
+@milvago.expose_web('/rows', etag=True)
+def rows(web):
+    return [{'id': 1, 'name': 'milvago'}, {'id': 2, 'name': 'falcon'}]
+
+
+@milvago.expose_web('/cached', cache=milvago.CachePolicy(ttl=60))
+def cached(web):
+    return [{'id': 1, 'name': 'milvago'}]
+
+
+@milvago.expose_web('/constant', static_body=True)
+def constant(web):
+    return [{'id': 1, 'name': 'milvago'}]
+
+
+@milvago.expose_web('/order')
+def order(web):
+    return Order(7, datetime.date(2020, 5, 1), ['a', 'b'])
+
+
+@milvago.expose_web('/forced')
+def forced(web):
+    web.set_custom_content_type('text/csv')
+    return [{'id': 1}]
+
+
+class TestSerializers(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = testing.TestClient(milvago.Milvago([rows(), order()])())
+        cls.negotiated = testing.TestClient(milvago.Milvago(
+            [rows(), forced(), cached(), constant()],
+            serializers=[milvago.JsonSerializer(), CsvSerializer()])())
+
+    def test_dict_list(self):
+        result = self.client.simulate_get('/rows')
+        self.assertEqual(result.headers['content-type'], 'application/json')
+        self.assertEqual(result.json[1], {'id': 2, 'name': 'falcon'})
+        self.assertNotIn('vary', result.headers)
+        again = self.client.simulate_get(
+            '/rows', headers={'If-None-Match': result.headers['etag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_dataclass(self):
+        result = self.client.simulate_get('/order')
+        self.assertEqual(result.json, {'id': 7, 'created': '2020-05-01', 'items': ['a', 'b']})
+
+    def test_accept(self):
+        result = self.negotiated.simulate_get('/rows', headers={'Accept': 'text/csv'})
+        self.assertEqual((result.headers['content-type'], result.text),
+                         ('text/csv', '1,milvago\n2,falcon'))
+        self.assertEqual(result.headers['vary'], 'Accept')
+        for accept in ('*/*', 'application/json', 'text/csv;q=0.5, application/*'):
+            result = self.negotiated.simulate_get('/rows', headers={'Accept': accept})
+            self.assertEqual(result.headers['content-type'], 'application/json')
+        result = self.negotiated.simulate_get('/rows', headers={'Accept': 'image/png'})
+        self.assertEqual(result.status_code, 406)
+
+    def test_cached_and_constant_bodies_vary_with_accept(self):
+        for path in ('/cached', '/constant'):
+            for accept, content_type, text in (
+                    ('text/csv', 'text/csv', '1,milvago'),
+                    ('application/json', 'application/json',
+                     '[{"id":1,"name":"milvago"}]'),
+                    ('text/csv', 'text/csv', '1,milvago')):
+                result = self.negotiated.simulate_get(
+                    path, headers={'Accept': accept})
+                self.assertEqual(result.headers['content-type'], content_type)
+                self.assertEqual(result.text.replace(' ', ''), text)
+            result = self.negotiated.simulate_get(
+                path, headers={'Accept': 'image/png'})
+            self.assertEqual(result.status_code, 406)
+
+    def test_content_type_wins(self):
+        result = self.negotiated.simulate_get('/forced', headers={'Accept': 'application/json'})
+        self.assertEqual(result.text, '1')
+
+    def test_backends_agree(self):
+        data = {'name': 'Milvágo', 'order': Order(1, datetime.date(2020, 1, 1), [])}
+        expected = json.loads(milvago.JsonSerializer().dumps(data))
+        for name in ('OrjsonSerializer', 'UjsonSerializer'):
+            try:
+                serializer = getattr(milvago, name)()
+            except ImportError:
+                continue
+            self.assertEqual(json.loads(serializer.dumps(data)), expected)
+
+    def test_non_string_keys(self):
+        data = {1: 'a', 2: {3: 'b'}}
+        expected = milvago.JsonSerializer().dumps(data)
+        for name in ('OrjsonSerializer', 'UjsonSerializer'):
+            try:
+                serializer = getattr(milvago, name)()
+            except ImportError:
+                continue
+            self.assertEqual(json.loads(serializer.dumps(data)), json.loads(expected))
+
+    def test_optional_backends(self):
+        if serializers.msgpack is None:
+            with self.assertRaises(ImportError):
+                milvago.MsgpackSerializer()
+        default = serializers.Serializers.default().media_types
+        self.assertEqual(default[0], 'application/json')
+        self.assertEqual('application/msgpack' in default, serializers.msgpack is not None)
+
+
+if __name__ == '__main__':
+    unittest.main()
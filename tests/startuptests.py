@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import subprocess
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# only needed for debug mode, the startup table, ASGI, workers and
+# deferred tasks
+LAZY_MODULES = ('rich', 'werkzeug', 'asyncio', 'wsgiref',
+                'concurrent.futures')
+
+
+def loaded_modules(code):
+    """The LAZY_MODULES imported after running code in a
+    fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, '-c', code + f'''
+import sys, json
+print(json.dumps([name for name in {LAZY_MODULES!r} if name in sys.modules]))
+'''],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_import(self):
+        self.assertEqual(loaded_modules('import milvago'), [])
+
+    def test_production_app(self):
+        self.assertEqual(loaded_modules('''
+import milvago
+
+@milvago.expose_web('/')
+def index(web):
+    return 'hello'
+
+milvago.Milvago([index()])()
+'''), [])
+
+    def test_startup_table(self):
+        self.assertEqual(loaded_modules('''
+import milvago
+
+@milvago.expose_web('/')
+def index(web):
+    return 'hello'
+
+milvago.Milvago([index()], startup_table=True)()
+'''), ['rich'])
+
+    def test_asgi_is_imported_on_use(self):
+        self.assertEqual(
+            loaded_modules('from milvago import AsgiApp'),
+            ['asyncio', 'concurrent.futures']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import os
+import email
+import shutil
+import tempfile
+import unittest
+from falcon import testing
+import milvago
+
+SMALL = b'small file ' * 100
+LARGE = os.urandom(512 * 1024)
+
+
+class TestStaticEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('small.txt', SMALL)
+        self.write('large.bin', LARGE)
+        self.write('nested/deep/app.css', b'body {}')
+        self.static = milvago.expose_static(
+            '/static', self.directory, 'public, max-age=3600')
+        self.dynamic = milvago.expose_static(
+            '/dynamic', self.directory, scan=False)
+        self.client = testing.TestClient(
+            milvago.Milvago([self.static, self.dynamic])())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(contents)
+
+    def test_scanned_at_mount(self):
+        self.assertEqual(len(self.static.directory), 3)
+        self.assertIsNone(self.dynamic.directory)
+        result = self.client.simulate_get('/static/nested/deep/app.css')
+        self.assertEqual(result.content, b'body {}')
+        self.assertEqual(result.headers['content-type'], 'text/css')
+
+    def test_hot_files(self):
+        hot = self.static.directory.hot
+        for _ in range(3):
+            result = self.client.simulate_get('/static/small.txt')
+            self.assertEqual(result.content, SMALL)
+        self.assertEqual((hot.misses, hot.hits, len(hot)), (1, 2, 1))
+        self.assertEqual(result.headers['cache-control'], 'public, max-age=3600')
+        self.assertEqual(result.headers['content-length'], str(len(SMALL)))
+        self.assertIn('etag', result.headers)
+
+    def test_hot_conditional_and_range(self):
+        first = self.client.simulate_get('/static/small.txt')
+        result = self.client.simulate_get(
+            '/static/small.txt', headers={'If-None-Match': first.headers['etag']})
+        self.assertEqual(result.status_code, 304)
+        self.assertNotIn('content-type', result.headers)
+        result = self.client.simulate_get(
+            '/static/small.txt', headers={'Range': 'bytes=6-9'})
+        self.assertEqual((result.status_code, result.content), (206, b'file'))
+        result = self.client.simulate_head('/static/small.txt')
+        self.assertEqual((result.content, result.headers['content-length']),
+                         (b'', str(len(SMALL))))
+
+    def test_large_files_use_file_wrapper(self):
+        wrapped = []
+
+        def file_wrapper(fileobj, block_size):
+            wrapped.append(fileobj)
+            return iter(lambda: fileobj.read(block_size), b'')
+
+        result = self.client.simulate_get(
+            '/static/large.bin', extras={'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(result.content, LARGE)
+        self.assertEqual(wrapped[0].name, os.path.join(self.directory, 'large.bin'))
+        self.assertEqual(len(self.static.directory.hot), 0)
+        result = self.client.simulate_get(
+            '/static/large.bin', headers={'Range': 'bytes=1000-1999'})
+        self.assertEqual(result.content, LARGE[1000:2000])
+
+    def test_rescan(self):
+        self.write('new.txt', b'new')
+        self.assertEqual(self.client.simulate_get('/static/new.txt').status_code, 404)
+        self.assertEqual(self.client.simulate_get('/dynamic/new.txt').content, b'new')
+        self.assertEqual(self.static.rescan(), 4)
+        self.assertEqual(self.client.simulate_get('/static/new.txt').content, b'new')
+
+    def test_not_found(self):
+        for path in ('/static/../statictests.py', '/static/nested',
+                     '/static/missing', '/static/'):
+            self.assertEqual(self.client.simulate_get(path).status_code, 404)
+
+
+class TestSendFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'report.pdf')
+        with open(self.path, 'wb') as f:
+            f.write(LARGE)
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        @milvago.expose_web('/reports/{name}', methods='get,head')
+        def report(web):
+            if web.uri_data['name'] != 'report.pdf':
+                web.set_status(403)
+                return 'Forbidden'
+            web.send_file(self.path, filename='report-2024.pdf')
+
+        @milvago.expose_web('/fd')
+        def descriptor(web):
+            web.send_file(os.open(self.path, os.O_RDONLY),
+                          content_type='application/octet-stream')
+
+        @milvago.expose_web('/export')
+        def export(web):
+            f = tempfile.TemporaryFile()
+            f.write(b'id,name\n1,milvago\n')
+            web.send_file(f, filename='export.csv')
+
+        self.client = testing.TestClient(
+            milvago.Milvago([report(), descriptor(), export()])())
+
+    def test_whole_file(self):
+        wrapped = []
+
+        def file_wrapper(fileobj, block_size):
+            wrapped.append(fileobj)
+            return iter(lambda: fileobj.read(block_size), b'')
+
+        result = self.client.simulate_get(
+            '/reports/report.pdf', extras={'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(result.content, LARGE)
+        self.assertEqual(wrapped[0].name, self.path)
+        self.assertEqual(result.headers['content-length'], str(len(LARGE)))
+        self.assertEqual(result.headers['content-type'], 'application/pdf')
+        self.assertEqual(result.headers['content-disposition'],
+                         'attachment; filename="report-2024.pdf"')
+        result = self.client.simulate_get(
+            '/reports/report.pdf',
+            headers={'If-None-Match': result.headers['etag']})
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(self.client.simulate_get(
+            '/reports/secret.pdf').status_code, 403)
+
+    def test_file_descriptor(self):
+        result = self.client.simulate_get(
+            '/fd', headers={'Range': 'bytes=-100'})
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual(result.content, LARGE[-100:])
+        self.assertEqual(result.headers['content-range'],
+                         f'bytes {len(LARGE) - 100}-{len(LARGE) - 1}/'
+                         f'{len(LARGE)}')
+
+    def test_file_just_written(self):
+        result = self.client.simulate_get('/export')
+        self.assertEqual(result.content, b'id,name\n1,milvago\n')
+        self.assertEqual(result.headers['content-length'], '18')
+        self.assertEqual(result.headers['content-type'], 'text/csv')
+        result = self.client.simulate_get(
+            '/export', headers={'Range': 'bytes=8-'})
+        self.assertEqual((result.status_code, result.content),
+                         (206, b'1,milvago\n'))
+
+    def test_multiple_ranges(self):
+        result = self.client.simulate_get(
+            '/reports/report.pdf',
+            headers={'Range': 'bytes=0-99,1000-1999,-10'})
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual(result.headers['content-length'],
+                         str(len(result.content)))
+        content_type = result.headers['content-type']
+        self.assertTrue(content_type.startswith('multipart/byteranges'))
+        message = email.message_from_bytes(
+            f'Content-Type: {content_type}\r\n\r\n'.encode()
+            + result.content)
+        parts = [(part['content-range'], part.get_payload(decode=True))
+                 for part in message.get_payload()]
+        size = len(LARGE)
+        self.assertEqual(parts, [
+            (f'bytes 0-99/{size}', LARGE[:100]),
+            (f'bytes 1000-1999/{size}', LARGE[1000:2000]),
+            (f'bytes {size - 10}-{size - 1}/{size}', LARGE[-10:]),
+        ])
+        result = self.client.simulate_head(
+            '/reports/report.pdf', headers={'Range': 'bytes=0-99,1000-1999'})
+        self.assertEqual(result.content, b'')
+        self.assertGreater(int(result.headers['content-length']), 1100)
+
+    def test_not_satisfiable(self):
+        result = self.client.simulate_get(
+            '/reports/report.pdf', headers={'Range': f'bytes={len(LARGE)}-'})
+        self.assertEqual(result.status_code, 416)
+        os.remove(self.path)
+        self.assertEqual(self.client.simulate_get(
+            '/reports/report.pdf').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
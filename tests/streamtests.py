@@ -0,0 +1,199 @@
+import gc
+import time
+import weakref
+import threading
+import unittest
+from falcon import testing
+import milvago
+from milvago.server.streams import StreamHub
+
+
+class SyntheticSource:
+    """Frames numbered from 0, one every interval seconds, up to
+    count of them."""
+
+    def __init__(self, interval=0.001, count=None):
+        self.interval = interval
+        self.count = count
+        self.opened = []
+        self.closed = []
+
+    def __call__(self, key):
+        self.opened.append(key)
+        number = 0
+        try:
+            while self.count is None or number < self.count:
+                yield f'{key}-{number}'.encode()
+                number += 1
+                time.sleep(self.interval)
+        finally:
+            self.closed.append(key)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestStreamHub(unittest.TestCase):
+
+    def test_one_producer_per_source(self):
+        source = SyntheticSource()
+        hub = StreamHub(source, buffer_size=100)
+        first = hub.subscribe('cam')
+        second = hub.subscribe('cam')
+        other = hub.subscribe('other')
+        frames = [first.get(5) for _ in range(10)]
+        self.assertEqual(sorted(source.opened), ['cam', 'other'])
+        self.assertEqual(len(frames), 10)
+        self.assertEqual(hub.stats()['cam']['subscribers'], 2)
+        # both subscribers of a source get the same frames, the
+        # second may have missed the first one
+        first_frames = dict(frames)
+        later = dict(second.get(5) for _ in range(10))
+        common = set(first_frames) & set(later)
+        self.assertGreaterEqual(len(common), 9)
+        for sequence in common:
+            self.assertEqual(first_frames[sequence], later[sequence])
+        self.assertTrue(other.get(5)[1].startswith(b'other-'))
+        for subscription in (first, second, other):
+            hub.unsubscribe(subscription)
+
+    def test_slow_subscribers_drop_frames(self):
+        hub = StreamHub(SyntheticSource(), buffer_size=2)
+        slow = hub.subscribe('cam')
+        self.assertTrue(wait_for(lambda: slow.dropped > 10))
+        first, second = slow.get(0), slow.get(0)
+        # only the latest frames are kept
+        self.assertEqual(second[0], first[0] + 1)
+        self.assertGreater(first[0], 10)
+        self.assertGreater(hub.stats()['cam']['dropped'], 10)
+        hub.unsubscribe(slow)
+
+    def test_producer_stops_without_subscribers(self):
+        source = SyntheticSource()
+        hub = StreamHub(source)
+        subscription = hub.subscribe('cam')
+        subscription.get(5)
+        hub.unsubscribe(subscription)
+        self.assertTrue(wait_for(lambda: source.closed == ['cam']))
+        # the source is dropped once closed
+        self.assertTrue(wait_for(lambda: hub.stats() == {}))
+        # the next subscriber starts it again
+        subscription = hub.subscribe('cam')
+        self.assertIsNotNone(subscription.get(5))
+        hub.unsubscribe(subscription)
+        self.assertTrue(wait_for(lambda: len(source.closed) == 2))
+
+    def test_subscriber_waits_for_the_source_to_close(self):
+        closing, release = threading.Event(), threading.Event()
+        active = []
+        opened = []
+
+        def camera(key):
+            opened.append(key)
+            active.append(key)
+            try:
+                while True:
+                    yield b'frame'
+                    time.sleep(0.001)
+            finally:
+                closing.set()
+                release.wait(5)
+                active.remove(key)
+
+        hub = StreamHub(camera)
+        first = hub.subscribe('cam')
+        first.get(5)
+        hub.unsubscribe(first)
+        self.assertTrue(closing.wait(5))
+        # the camera is still being released
+        second = hub.subscribe('cam')
+        self.assertEqual(active, ['cam'])
+        release.set()
+        self.assertIsNotNone(second.get(5))
+        self.assertEqual((active, opened), (['cam'], ['cam', 'cam']))
+        hub.unsubscribe(second)
+        self.assertTrue(wait_for(lambda: hub.stats() == {}))
+        self.assertEqual(active, [])
+
+    def test_not_kept_alive(self):
+        reference = weakref.ref(StreamHub(SyntheticSource()))
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def test_source_end(self):
+        hub = StreamHub(SyntheticSource(count=3), buffer_size=10)
+        subscription = hub.subscribe('cam')
+        frames = []
+        while True:
+            item = subscription.get(5)
+            if item is None:
+                break
+            frames.append(item[1])
+        self.assertEqual(frames, [b'cam-0', b'cam-1', b'cam-2'])
+        self.assertTrue(subscription.closed)
+
+
+class TestStreamHandlers(unittest.TestCase):
+
+    def setUp(self):
+        hub = StreamHub(SyntheticSource(count=3), buffer_size=10)
+
+        @milvago.expose_web('/stream.mjpeg')
+        def mjpeg(web):
+            hub.multipart(web, web.request.get_param('camera'))
+
+        @milvago.expose_web('/events')
+        def events(web):
+            hub.sse(web, 'lines', event='frame')
+
+        self.client = testing.TestClient(
+            milvago.Milvago([mjpeg(), events()])()
+        )
+
+    def test_multipart(self):
+        result = self.client.simulate_get('/stream.mjpeg?camera=1')
+        self.assertEqual(result.headers['content-type'],
+                         'multipart/x-mixed-replace; boundary=frame')
+        self.assertEqual(result.content, b''.join(
+            b'--frame\r\nContent-Type: image/jpeg\r\n'
+            b'Content-Length: 3\r\n\r\n1-%d\r\n' % number
+            for number in range(3)
+        ))
+
+    def test_sse(self):
+        result = self.client.simulate_get('/events')
+        self.assertEqual(result.headers['content-type'],
+                         'text/event-stream; charset=utf-8')
+        self.assertEqual(result.headers['cache-control'], 'no-cache')
+        self.assertEqual(result.text, ''.join(
+            f'event: frame\nid: {number + 1}\ndata: lines-{number}\n\n'
+            for number in range(3)
+        ))
+
+    def test_sse_heartbeat_and_multiline(self):
+        release = threading.Event()
+
+        def source(key):
+            yield 'first\nsecond'
+            release.wait(5)
+            yield {'done': True}
+
+        hub = StreamHub(source, heartbeat=0.01)
+        stream = hub._sse(None, None)
+        self.assertEqual(next(stream), b'id: 1\ndata: first\ndata: second\n\n')
+        self.assertEqual(next(stream), b': keep-alive\n\n')
+        release.set()
+        self.assertEqual(
+            [chunk for chunk in stream if chunk != b': keep-alive\n\n'],
+            [b'id: 2\ndata: {"done": true}\n\n']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import os
+import gc
+import weakref
+import threading
+import unittest
+from falcon import testing
+import milvago
+from milvago.server.metrics import Metrics
+from milvago.server.tasks import TaskQueue
+
+
+def pid():
+    return os.getpid()
+
+
+DEFERRED = []
+
+
+def record(value):
+    DEFERRED.append(value)
+
+
+def fail():
+    raise ValueError('failed')
+
+
+def sample(text, name, **labels):
+    """The value of a sample in the Prometheus text format."""
+    rendered = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f'{name}{{{rendered}}} '
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+class TestTaskQueue(unittest.TestCase):
+
+    def busy(self, policy, **kwargs):
+        """A queue with room for a single task, taken by a task
+        waiting for self.release."""
+        self.release = threading.Event()
+        queue = TaskQueue(workers=1, max_pending=1, policy=policy, **kwargs)
+        self.addCleanup(queue.drain, 5)
+        self.addCleanup(self.release.set)
+        queue.submit(self.release.wait)
+        return queue
+
+    def test_submit(self):
+        queue = TaskQueue(workers=2)
+        self.assertEqual(queue.submit(pow, 2, 10).result(5), 1024)
+        self.assertTrue(queue.drain())
+        self.assertEqual(queue.pending, 0)
+        # a drained queue starts a new pool
+        self.assertEqual(queue.submit(pow, 2, 3).result(5), 8)
+        queue.drain()
+
+    def test_drop(self):
+        queue = self.busy('drop')
+        self.assertIsNone(queue.submit(pow, 2, 10))
+        self.assertEqual(queue.pending, 1)
+
+    def test_inline(self):
+        queue = self.busy('inline')
+        future = queue.submit(threading.get_ident)
+        self.assertEqual(future.result(0), threading.get_ident())
+
+    def test_block(self):
+        queue = self.busy('block')
+        done = []
+        waiting = threading.Thread(
+            target=lambda: done.append(queue.submit(pow, 2, 10).result(5))
+        )
+        waiting.start()
+        waiting.join(0.2)
+        self.assertEqual(done, [])
+        self.release.set()
+        waiting.join(5)
+        self.assertEqual(done, [1024])
+
+    def test_block_timeout(self):
+        queue = self.busy('block', block_timeout=0.05)
+        self.assertIsNone(queue.submit(pow, 2, 10))
+
+    def test_drain_timeout(self):
+        queue = self.busy('drop')
+        self.assertFalse(queue.drain(0.05))
+        self.release.set()
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            TaskQueue(policy='later')
+
+    def test_queues_are_not_kept_alive(self):
+        queue = TaskQueue()
+        queue.submit(pid).result(5)
+        queue.drain()
+        reference = weakref.ref(queue)
+        del queue
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def test_processes(self):
+        queue = TaskQueue(workers=1, processes=True)
+        self.assertNotEqual(queue.submit(pid).result(30), os.getpid())
+        queue.drain()
+
+
+class TestDefer(unittest.TestCase):
+
+    def test_web_defer(self):
+        metrics = Metrics(buckets=(0.5,))
+        tasks = TaskQueue(workers=1)
+
+        @milvago.expose_web('/audit', methods='post')
+        def audit(web):
+            web.defer(record, web.request.get_param('user'))
+            web.defer(fail)
+            return 'ok'
+
+        client = testing.TestClient(milvago.Milvago(
+            [audit()], metrics=metrics, tasks=tasks
+        )())
+        self.assertEqual(
+            client.simulate_post('/audit?user=alice').text, 'ok'
+        )
+        self.assertTrue(tasks.drain(5))
+        self.assertEqual(DEFERRED, ['alice'])
+        text = metrics.render()
+        self.assertEqual(sample(
+            text, 'milvago_tasks_total',
+            task=f'{__name__}.record', status='ok'
+        ), 1)
+        self.assertEqual(sample(
+            text, 'milvago_tasks_total',
+            task=f'{__name__}.fail', status='error'
+        ), 1)
+        self.assertEqual(sample(
+            text, 'milvago_task_duration_seconds_count',
+            task=f'{__name__}.fail'
+        ), 1)
+        self.assertEqual(sample(
+            text, 'milvago_tasks_pending', task=f'{__name__}.fail'
+        ), 0)
+        self.assertIsNone(sample(
+            text, 'milvago_request_duration_seconds_count',
+            route=f'{__name__}.fail', method='TASK'
+        ))
+
+    def test_dropped_tasks_are_counted(self):
+        metrics = Metrics()
+        release = threading.Event()
+        tasks = TaskQueue(workers=1, max_pending=1, policy='drop')
+        tasks.attach_metrics(metrics)
+        tasks.submit(release.wait)
+        tasks.submit(fail)
+        release.set()
+        tasks.drain(5)
+        text = metrics.render()
+        self.assertEqual(sample(
+            text, 'milvago_tasks_total',
+            task=f'{__name__}.fail', status='dropped'
+        ), 1)
+        self.assertEqual(sample(
+            text, 'milvago_task_duration_seconds_count',
+            task=f'{__name__}.fail'
+        ), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
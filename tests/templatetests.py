@@ -0,0 +1,143 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+import jinja2
+from falcon import testing
+import milvago
+from milvago.__main__ import main
+from milvago.common.exceptions import StreamRenderError
+
+TEMPLATES = tempfile.mkdtemp()
+with open(os.path.join(TEMPLATES, 'layout.html'), 'w') as f:
+    f.write('<main>{% block body %}{% endblock %}</main>')
+with open(os.path.join(TEMPLATES, 'page.html'), 'w') as f:
+    f.write('{% extends "layout.html" %}{% block body %}{{ name }}{% endblock %}')
+with open(os.path.join(TEMPLATES, 'report.html'), 'w') as f:
+    f.write('{% extends "layout.html" %}{% block body %}'
+            '{% for row in rows %}<p>{{ check(row) }}</p>{% endfor %}'
+            '{% endblock %}')
+
+
+def check(row):
+    if row == 'fail':
+        raise ValueError('invalid row')
+    return row
+
+
+@milvago.expose_web('/report')
+def report(web):
+    rows = web.request.params['rows'].split(',')
+    if web.request.params.get('stream'):
+        return web.render_stream('report.html', buffer_size=64, rows=rows, check=check)
+    return web.render('report.html', rows=rows, check=check)
+
+
+def page_handler(route):
+    @milvago.expose_web(route)
+    def page(web):
+        return web.render('page.html', name=web.request.path)
+    return page()
+
+
+class TestTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def build(self, handlers, **options):
+        app = milvago.Milvago(handlers, template_dir=TEMPLATES,
+                              template_cache_dir=self.cache_dir, **options)
+        return app, testing.TestClient(app())
+
+    def test_shared_environment(self):
+        handlers = [page_handler(f'/page{i}') for i in range(5)]
+        app, client = self.build(handlers)
+        self.assertEqual({id(h.template_loader) for h in handlers},
+                         {id(app.templates)})
+        self.assertFalse(app.templates.auto_reload)
+        for i in range(5):
+            self.assertEqual(client.simulate_get(f'/page{i}').text,
+                             f'<main>/page{i}</main>')
+        self.assertEqual(len(app.templates.cache), 2)
+
+    def test_precompile(self):
+        app, client = self.build([page_handler('/')], precompile_templates=True)
+        self.assertEqual(len(app.templates.cache), 3)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+        self.assertEqual(client.simulate_get('/').text, '<main>/</main>')
+
+    def test_handler_directory_is_kept(self):
+        other = tempfile.mkdtemp()
+        with open(os.path.join(other, 'page.html'), 'w') as f:
+            f.write('other')
+        handler = page_handler('/')
+        handler.attach_templates(other)
+        app, client = self.build([handler])
+        self.assertEqual(client.simulate_get('/').text, 'other')
+        shutil.rmtree(other)
+
+    def test_render_stream(self):
+        app, client = self.build([report()])
+        rows = ','.join(f'row{i}' for i in range(100))
+        rendered = client.simulate_get('/report', params={'rows': rows})
+        streamed = client.simulate_get('/report', params={'rows': rows, 'stream': 1})
+        self.assertEqual(streamed.text, rendered.text)
+        self.assertEqual(streamed.headers['content-type'], rendered.headers['content-type'])
+        self.assertNotIn('content-length', streamed.headers)
+
+    def test_render_stream_chunks(self):
+        app, client = self.build([report()])
+        rows = ','.join(f'row{i}' for i in range(100))
+        environ = testing.create_environ(
+            '/report', query_string=f'rows={rows}&stream=1')
+        chunks = list(client.app(environ, lambda status, headers: None))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) < 128 for chunk in chunks))
+
+    def test_render_stream_errors(self):
+        app, client = self.build([report()])
+        with self.assertRaises(ValueError):
+            client.simulate_get('/report', params={'rows': 'fail', 'stream': 1})
+        rows = ','.join(['row'] * 100 + ['fail'])
+        with self.assertLogs('Milvago', 'ERROR'):
+            with self.assertRaises(StreamRenderError):
+                client.simulate_get('/report', params={'rows': rows, 'stream': 1})
+
+    def test_cli(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            code = main(['compile-templates', TEMPLATES,
+                         '--cache-dir', self.cache_dir])
+        self.assertEqual(code, 0)
+        self.assertIn('Compiled 3 templates', output.getvalue())
+        self.assertEqual(len(os.listdir(self.cache_dir)), 3)
+
+    def test_cli_cache_is_used_with_any_path(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(['compile-templates', os.path.relpath(TEMPLATES),
+                  '--cache-dir', self.cache_dir])
+        compiled = sorted(os.listdir(self.cache_dir))
+        app, client = self.build([page_handler('/')])
+        self.assertEqual(client.simulate_get('/').text, '<main>/</main>')
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), compiled)
+
+    def test_broken_template(self):
+        broken = tempfile.mkdtemp()
+        with open(os.path.join(broken, 'broken.html'), 'w') as f:
+            f.write('{% if %}')
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(main(['compile-templates', broken,
+                                   '--cache-dir', self.cache_dir]), 1)
+        with self.assertRaises(jinja2.TemplateSyntaxError):
+            milvago.Milvago([page_handler('/')], template_dir=broken,
+                            template_cache_dir='', precompile_templates=True)()
+        shutil.rmtree(broken)
+
+
+if __name__ == '__main__':
+    unittest.main()